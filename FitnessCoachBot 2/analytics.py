@@ -0,0 +1,31 @@
+"""Vectorized /progress analytics over a user's progress columns.
+
+``rolling_averages()`` takes the day-ordinal and count columns of a
+ProgressColumns (see progress_columns.py) and computes the 7/30-day
+workout counts and completion averages with NumPy, without building a
+dict per workout. Totals and streaks come from the running aggregates
+in stats.py instead.
+"""
+import numpy as np
+
+# Windows of the rolling completion averages, in days ending today
+WINDOWS = (7, 30)
+
+
+def rolling_averages(columns, today):
+    """Workout counts and completion averages of the windows ending on ``today`` (a date)"""
+    # Copies: array columns cannot grow while NumPy views them
+    days = np.array(columns.days, dtype=np.int64)
+    completed = np.array(columns.completed, dtype=np.int64)
+    totals = np.array(columns.totals, dtype=np.int64)
+
+    averages = {}
+    today = today.toordinal()
+    for window in WINDOWS:
+        in_window = (days > today - window) & (days <= today)
+        window_totals = totals[in_window].sum()
+        averages[f'workouts_{window}d'] = int(in_window.sum())
+        averages[f'average_{window}d'] = (
+            float(completed[in_window].sum() / window_totals * 100) if window_totals else 0.0
+        )
+    return averages
@@ -0,0 +1,94 @@
+"""Calendar lookups: decoding the month's workouts vs. the backend's date index.
+
+Each simulated user has one workout per day for ``--years`` years. For
+every storage backend the script times the month view and the day
+drill-down both by decoding every workout of the month
+(get_workouts_by_date) and through the calls the calendar uses
+(get_workout_days reads per-day totals, get_workouts_on_date one day).
+
+Usage (from the bot directory):
+    python benchmarks/calendar_index.py [--years 5] [--lookups 200]
+"""
+import argparse
+import calendar
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from storage import JournalStorage
+from sqlite_storage import SQLiteStorage
+
+BACKENDS = {
+    'journal': lambda data_dir: JournalStorage(data_dir, fsync=False),
+    'sqlite': SQLiteStorage,
+}
+
+
+def fill(db, user_id, years):
+    """One workout per day, ending today"""
+    today = date.today()
+    for days_ago in range(365 * years, -1, -1):
+        db.storage.append('progress', str(user_id), {
+            'date': (today - timedelta(days=days_ago)).isoformat(),
+            'exercises_completed': 4,
+            'total_exercises': 5,
+            'workout_completed': False,
+        })
+    db.rebuild_stats(user_id)
+
+
+def timed(lookups, func):
+    start = time.perf_counter()
+    for args in lookups:
+        func(*args)
+    return (time.perf_counter() - start) / len(lookups) * 1e6
+
+
+def month_by_scan(db, year, month):
+    last_day = date(year, month, calendar.monthrange(year, month)[1])
+    return {workout['date'] for workout in db.get_workouts_by_date(1, date(year, month, 1), last_day)}
+
+
+def day_by_scan(db, day):
+    parsed = date.fromisoformat(day)
+    return db.get_workouts_by_date(1, parsed, parsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    today = date.today()
+    days = [today - timedelta(days=rng.randrange(365 * args.years)) for _ in range(args.lookups)]
+    months = [(day.year, day.month) for day in days]
+    day_strings = [(day.isoformat(),) for day in days]
+
+    print(f"{args.years} years of daily workouts, mean time per lookup in microseconds")
+    print(f"{'backend':>8} {'month scan':>11} {'month index':>12} {'day scan':>9} {'day index':>10}")
+    for name, make_storage in BACKENDS.items():
+        with tempfile.TemporaryDirectory() as data_dir:
+            db = Database(make_storage(data_dir))
+            fill(db, 1, args.years)
+            for year, month in months[:5]:
+                assert month_by_scan(db, year, month) == db.get_workout_days(1, year, month)
+            results = (
+                timed(months, lambda year, month: month_by_scan(db, year, month)),
+                timed(months, lambda year, month: db.get_workout_days(1, year, month)),
+                timed(day_strings, lambda day: day_by_scan(db, day)),
+                timed(day_strings, lambda day: db.get_workouts_on_date(1, day)),
+            )
+            db.close()
+        print(f"{name:>8} {results[0]:>11.1f} {results[1]:>12.1f} {results[2]:>9.1f} {results[3]:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
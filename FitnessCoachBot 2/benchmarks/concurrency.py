@@ -0,0 +1,54 @@
+"""Update throughput with per-user serialization vs. a single update at a time.
+
+Every simulated user sends a burst of updates whose handler awaits a fixed
+delay (standing in for Telegram API round trips). Throughput should grow with
+the number of users under PerUserUpdateProcessor and stay flat when updates
+are processed one by one, as with concurrent_updates(False).
+
+Usage (from the bot directory):
+    python benchmarks/concurrency.py [--latency 0.05] [--updates-per-user 5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.ext import SimpleUpdateProcessor
+from update_processor import PerUserUpdateProcessor
+
+
+async def run(processor, users, updates_per_user, latency):
+    async def handler():
+        await asyncio.sleep(latency)
+
+    updates = [
+        SimpleNamespace(effective_user=SimpleNamespace(id=user_id), effective_chat=None)
+        for _ in range(updates_per_user) for user_id in range(users)
+    ]
+    async with processor:
+        start = time.perf_counter()
+        await asyncio.gather(*(processor.process_update(update, handler()) for update in updates))
+        return len(updates) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.05, help="handler latency in seconds")
+    parser.add_argument('--updates-per-user', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'users':>6} {'serial upd/s':>14} {'per-user upd/s':>16}")
+    for users in (1, 10, 100, 1000):
+        serial = asyncio.run(run(SimpleUpdateProcessor(1), users, args.updates_per_user, args.latency)) \
+            if users <= 10 else None
+        concurrent = asyncio.run(run(PerUserUpdateProcessor(1024), users, args.updates_per_user, args.latency))
+        serial_text = f"{serial:>14.1f}" if serial is not None else f"{'(skipped)':>14}"
+        print(f"{users:>6} {serial_text} {concurrent:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""Load test of the real bot application against a fake Bot API server.
+
+Builds the application from bot.py, with its update processor, rate limiter
+and storage, and points it at fake_bot_api.FakeBotAPI. Every simulated user
+replays a scripted journey: the /profile conversation, /workout,
+/start_workout with exercise_done taps, finishing the workout, feedback,
+/calendar and paging to the previous month. Updates are fed to the
+application the way the polling loop does, so a step's latency covers the
+per-user lock, the handlers, the rate limiter and the Bot API round trips.
+
+The data directory is a fresh temporary one unless --data-dir is given.
+Telegram's limits (RATE_LIMIT_PER_CHAT, one message a second per chat, and
+RATE_LIMIT_OVERALL, 30 a second) make each journey take tens of seconds;
+raise them with --per-chat-rate / --overall-rate to measure the bot itself.
+
+Usage (from the bot directory):
+    python benchmarks/loadtest.py [--users 100] [--concurrency 50] [--api-latency 0.05]
+        [--api-error-rate 0.01] [--per-chat-rate 30] [--overall-rate 1000] [--taps 5] [--json report.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_DIR)
+
+from fake_bot_api import FakeBotAPI
+
+FIRST_USER_ID = 100000
+
+# Bot API calls the application makes on its own, not for a user
+STARTUP_METHODS = {'getMe', 'setMyCommands', 'deleteWebhook'}
+
+PROFILE_ANSWERS = ['30', '180', '75', 'Мужской', 'Похудение', 'Начинающий', 'Только вес тела']
+
+
+def journey(taps):
+    """Steps of one user journey: ('text', text) or ('callback', data)"""
+    steps = [('text', '/profile')] + [('text', answer) for answer in PROFILE_ANSWERS]
+    steps += [('text', '/workout'), ('text', '/start_workout')]
+    steps += [('callback', 'exercise_done')] * taps
+    steps += [('callback', 'finish_workout'), ('callback', 'feedback_good'), ('text', '/calendar')]
+    steps.append(('callback', 'calendar_previous'))
+    return steps
+
+
+class Driver:
+    """Feeds journey updates into an Application and times each step"""
+
+    def __init__(self, application, api):
+        self.application = application
+        self.api = api
+        self.latencies = defaultdict(list)  # step name -> seconds
+        self.errors = Counter()
+        self._update_ids = iter(range(1, 10 ** 9))
+
+    async def run_journey(self, user_id, steps):
+        from telegram import Update
+
+        for kind, value in steps:
+            data = self._update(user_id, kind, value)
+            if data is None:
+                self.errors['no message to press'] += 1
+                continue
+            update = Update.de_json(data, self.application.bot)
+            name = _step_name(kind, value)
+            start = time.perf_counter()
+            try:
+                # What Application does for each fetched update
+                await self.application.update_processor.process_update(
+                    update, self.application.process_update(update)
+                )
+            except Exception as e:
+                self.errors[type(e).__name__] += 1
+            self.latencies[name].append(time.perf_counter() - start)
+
+    def _update(self, user_id, kind, value):
+        user = {'id': user_id, 'is_bot': False, 'first_name': f'Load {user_id}'}
+        chat = {'id': user_id, 'type': 'private'}
+        if kind == 'text':
+            message = {'message_id': next(self._update_ids), 'date': int(time.time()),
+                       'from': user, 'chat': chat, 'text': value}
+            if value.startswith('/'):
+                message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(value.split()[0])}]
+            return {'update_id': next(self._update_ids), 'message': message}
+
+        message = self.api.last_message(user_id)
+        if message is None:
+            return None
+        if value == 'calendar_previous':
+            value = _previous_month_button(message)
+        return {
+            'update_id': next(self._update_ids),
+            'callback_query': {
+                'id': str(next(self._update_ids)), 'from': user, 'chat_instance': str(user_id),
+                'data': value, 'message': message,
+            },
+        }
+
+
+def _step_name(kind, value):
+    """Latency bucket of a step: the command, the callback, or a profile answer"""
+    if kind == 'text':
+        return value if value.startswith('/') else 'profile answer'
+    if value.startswith(('feedback_', 'calendar_')):
+        return value.split('_')[0] + '_*'
+    return value
+
+
+def _previous_month_button(message):
+    """callback_data of the calendar's ◀️ button"""
+    for row in message.get('reply_markup', {}).get('inline_keyboard', []):
+        for button in row:
+            if button.get('text') == '◀️':
+                return button['callback_data']
+    return 'calendar_2000_1'
+
+
+async def run(args, api):
+    from bot import build_application
+
+    application, database = build_application()
+    driver = Driver(application, api)
+    steps = journey(args.taps)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def user(user_id):
+        async with semaphore:
+            await driver.run_journey(user_id, steps)
+
+    async with application:
+        await application.start()
+        start = time.perf_counter()
+        await asyncio.gather(*(user(FIRST_USER_ID + n) for n in range(args.users)))
+        elapsed = time.perf_counter() - start
+        await application.stop()
+        await application.post_shutdown(application)
+    database.close()
+    return driver, elapsed, len(steps)
+
+
+def percentiles(values):
+    if len(values) < 2:
+        value = values[0] if values else float('nan')
+        return value, value, value
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+def report(args, api, driver, elapsed, steps_per_journey):
+    # Calls made for users, including answerCallbackQuery which has no chat_id
+    user_calls = [call for call in api.calls if call[1] not in STARTUP_METHODS]
+    all_latencies = [value for values in driver.latencies.values() for value in values]
+    methods = Counter(call[1] for call in user_calls)
+
+    result = {
+        'users': args.users,
+        'concurrency': args.concurrency,
+        'seconds': elapsed,
+        'updates_per_second': len(all_latencies) / elapsed,
+        'journeys_per_second': args.users / elapsed,
+        'latency': {
+            name: dict(zip(('p50', 'p95', 'p99'), percentiles(values)))
+            for name, values in [('all', all_latencies)] + sorted(driver.latencies.items())
+        },
+        'api_calls_per_journey': len(user_calls) / args.users,
+        'api_calls_by_method': {method: count / args.users for method, count in methods.most_common()},
+        'api_429': sum(1 for call in user_calls if call[3] == 429),
+        'errors': dict(driver.errors),
+    }
+
+    print(f"{args.users} journeys of {steps_per_journey} updates, concurrency {args.concurrency}, "
+          f"{elapsed:.1f}s")
+    print(f"throughput: {result['updates_per_second']:.1f} updates/s, "
+          f"{result['journeys_per_second']:.2f} journeys/s")
+    print(f"\n{'step':<18} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, values in result['latency'].items():
+        print(f"{name:<18} {values['p50'] * 1000:>9.1f} {values['p95'] * 1000:>9.1f} {values['p99'] * 1000:>9.1f}")
+    print(f"\nAPI calls per journey: {result['api_calls_per_journey']:.1f} ({result['api_429']} answered 429)")
+    for method, count in result['api_calls_by_method'].items():
+        print(f"  {method:<24} {count:.1f}")
+    if driver.errors:
+        print(f"errors: {dict(driver.errors)}")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=50, help="journeys running at once")
+    parser.add_argument('--taps', type=int, default=5, help="exercise_done taps per workout")
+    parser.add_argument('--api-latency', type=float, default=0.05, help="mean Bot API latency in seconds")
+    parser.add_argument('--api-jitter', type=float, default=0.02)
+    parser.add_argument('--api-error-rate', type=float, default=0.0, help="share of chat requests answered 429")
+    parser.add_argument('--per-chat-rate', type=float, help="override RATE_LIMIT_PER_CHAT (messages/s)")
+    parser.add_argument('--overall-rate', type=float, help="override RATE_LIMIT_OVERALL (messages/s)")
+    parser.add_argument('--data-dir', help="data directory (default: a temporary one)")
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    api = FakeBotAPI(latency=args.api_latency, jitter=args.api_jitter, error_rate=args.api_error_rate).start()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # config.py reads the environment at import time
+        os.environ['TELEGRAM_BOT_TOKEN'] = '123456:LOADTEST'
+        os.environ['TELEGRAM_API_URL'] = api.base_url
+        os.environ['DATA_DIR'] = args.data_dir or tmp_dir
+        os.environ['METRICS_PORT'] = '0'
+        if args.per_chat_rate:
+            os.environ['RATE_LIMIT_PER_CHAT'] = str(args.per_chat_rate)
+        if args.overall_rate:
+            os.environ['RATE_LIMIT_OVERALL'] = str(args.overall_rate)
+        try:
+            driver, elapsed, steps = asyncio.run(run(args, api))
+        finally:
+            api.stop()
+
+    result = report(args, api, driver, elapsed, steps)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+    return result
+
+
+if __name__ == '__main__':
+    main()
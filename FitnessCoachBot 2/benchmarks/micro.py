@@ -0,0 +1,236 @@
+"""Micro-benchmarks of the hot paths, checked against stored baselines.
+
+Covers generate_workout for every level/goal/equipment combination, the
+streak and intensity queries, the stats rebuild and the /progress analytics
+over synthetic histories of 10k and 100k entries, snapshot writes
+(_save_to_file) at the same sizes, and calendar keyboard rendering.
+
+Timings are divided by a fixed pure-Python calibration loop measured in the
+same run, so baselines recorded on one machine stay meaningful on another.
+A benchmark fails when its normalized time exceeds the baseline by more
+than --tolerance; the script then exits with status 1.
+
+Usage (from the bot directory):
+    python benchmarks/micro.py                 # compare with benchmarks/baselines.json
+    python benchmarks/micro.py --save          # record new baselines
+    python benchmarks/micro.py -k streak       # only benchmarks whose name contains "streak"
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+from functools import lru_cache
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import analytics
+import keyboards
+from database import Database
+from progress_columns import ProgressColumns
+from storage import JournalStorage
+from synthetic import make_feedback, make_history
+from workout_manager import WorkoutManager, LEVEL_MAP, GOALS_MAP, EQUIPMENT_MAP
+
+BASELINES = os.path.join(BENCH_DIR, 'baselines.json')
+HISTORY_SIZES = (10000, 100000)
+
+BENCHMARKS = {}  # name -> setup(tmp_dir) returning the function to time
+
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+@lru_cache(maxsize=None)
+def _manager():
+    return WorkoutManager(log_sample_rate=0.0)
+
+
+def _register_generate_workout():
+    def setup_for(profile, feedback=None):
+        def setup(tmp_dir):
+            manager = _manager()
+            return lambda: manager.generate_workout(profile, feedback)
+        return setup
+
+    for level in LEVEL_MAP:
+        for goal in GOALS_MAP:
+            for equipment in EQUIPMENT_MAP:
+                profile = {'fitness_level': level, 'goals': goal, 'equipment': equipment}
+                name = f'generate_workout[{LEVEL_MAP[level]}-{GOALS_MAP[goal]}-{EQUIPMENT_MAP[equipment]}]'
+                benchmark(name)(setup_for(profile))
+
+    profile = {'fitness_level': 'Средний', 'goals': 'Похудение', 'equipment': 'Только вес тела'}
+    benchmark('generate_workout[with feedback]')(setup_for(profile, make_feedback(30, random.Random(0))))
+
+
+def _database(tmp_dir, entries):
+    """Database whose user '1' has ``entries`` progress entries (stats not built yet)"""
+    with open(os.path.join(tmp_dir, 'progress.json'), 'w', encoding='utf-8') as f:
+        json.dump({'1': make_history(entries)}, f)
+    return Database(JournalStorage(tmp_dir, fsync=False))
+
+
+def _register_history_benchmarks():
+    for entries in HISTORY_SIZES:
+        @benchmark(f'get_workout_streak[{entries}]')
+        def streak(tmp_dir, entries=entries):
+            db = _database(tmp_dir, entries)
+            db.get_workout_streak(1)
+            return lambda: db.get_workout_streak(1)
+
+        @benchmark(f'get_workout_intensity_stats[30d-{entries}]')
+        def intensity(tmp_dir, entries=entries):
+            db = _database(tmp_dir, entries)
+            db.get_workout_intensity_stats(1)
+            return lambda: db.get_workout_intensity_stats(1, days=30)
+
+        @benchmark(f'get_workout_intensity_stats[365d-{entries}]')
+        def intensity_year(tmp_dir, entries=entries):
+            db = _database(tmp_dir, entries)
+            return lambda: db.get_workout_intensity_stats(1, days=365)
+
+        @benchmark(f'rebuild_stats[{entries}]')
+        def rebuild(tmp_dir, entries=entries):
+            db = _database(tmp_dir, entries)
+            return lambda: db.rebuild_stats(1)
+
+        @benchmark(f'rolling_averages[{entries}]')
+        def rolling_averages(tmp_dir, entries=entries):
+            columns = ProgressColumns.from_entries(make_history(entries))
+            today = date.today()
+            return lambda: analytics.rolling_averages(columns, today)
+
+        @benchmark(f'_save_to_file[{entries}]')
+        def save_to_file(tmp_dir, entries=entries):
+            storage = JournalStorage(tmp_dir, fsync=False)
+            data = {'1': make_history(entries)}
+            path = os.path.join(tmp_dir, 'bench.json')
+            return lambda: storage._save_to_file(path, data)
+
+
+@benchmark('get_calendar_keyboard[cached]')
+def calendar_cached(tmp_dir):
+    days = {f'2024-05-{day:02d}' for day in range(1, 31, 2)}
+    return lambda: keyboards.get_calendar_keyboard(2024, 5, days)
+
+
+@benchmark('get_calendar_keyboard[uncached]')
+def calendar_uncached(tmp_dir):
+    days = frozenset(f'2024-05-{day:02d}' for day in range(1, 31, 2))
+    build = keyboards._build_calendar_keyboard.__wrapped__
+    return lambda: build(2024, 5, days)
+
+
+_register_generate_workout()
+_register_history_benchmarks()
+
+
+def measure(func, min_time=0.2, repeat=5):
+    """Best seconds per call over ``repeat`` batches of at least ``min_time``"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    best = elapsed / number
+    if elapsed > 5 * min_time:
+        # Slow single calls: fewer repeats keep the whole run short
+        repeat = min(repeat, 2)
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def calibrate():
+    """Seconds for a fixed mix of dict, list and arithmetic work on this machine"""
+    def workload():
+        data = {}
+        for i in range(2000):
+            data[str(i)] = [i, i * 2.5, i % 7]
+        return sum(value[1] for value in data.values() if value[2])
+    return measure(workload)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-k', dest='filter', help="run benchmarks whose name contains this text")
+    parser.add_argument('--save', action='store_true', help="store the results as the new baselines")
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help="fail when normalized time exceeds baseline times this factor")
+    parser.add_argument('--min-time', type=float, default=0.2, help="seconds per timed batch")
+    args = parser.parse_args(argv)
+
+    try:
+        with open(BASELINES, encoding='utf-8') as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {'calibration': None, 'benchmarks': {}}
+
+    calibration = calibrate()
+    results = {}
+    failures = []
+    print(f"calibration: {calibration * 1e6:.1f} us")
+    print(f"{'benchmark':<48} {'time':>12} {'baseline':>12} {'ratio':>7}")
+    for name, setup in BENCHMARKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            seconds = measure(setup(tmp_dir), args.min_time)
+        results[name] = seconds
+
+        baseline = baselines['benchmarks'].get(name)
+        if baseline is None or not baselines['calibration']:
+            print(f"{name:<48} {_format(seconds):>12} {'-':>12} {'-':>7}")
+            continue
+        ratio = (seconds / calibration) / (baseline / baselines['calibration'])
+        flag = ''
+        if ratio > args.tolerance:
+            failures.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<48} {_format(seconds):>12} {_format(baseline):>12} {ratio:>7.2f}{flag}")
+
+    if args.save:
+        # Rescale kept baselines so that every entry shares this run's calibration
+        if baselines['calibration']:
+            scale = calibration / baselines['calibration']
+            kept = {name: seconds * scale for name, seconds in baselines['benchmarks'].items()}
+        else:
+            kept = {}
+        kept.update(results)
+        with open(BASELINES, 'w', encoding='utf-8') as f:
+            json.dump({'calibration': calibration, 'benchmarks': kept}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Saved {len(results)} baselines to {BASELINES}")
+    elif failures:
+        print(f"{len(failures)} benchmarks regressed by more than {args.tolerance}x: {', '.join(failures)}")
+        return 1
+    return 0
+
+
+def _format(seconds):
+    if seconds >= 1:
+        return f'{seconds:.2f} s'
+    if seconds >= 1e-3:
+        return f'{seconds * 1e3:.2f} ms'
+    return f'{seconds * 1e6:.2f} us'
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""Disk and memory size of a progress history: JSON dicts vs ProgressColumns.
+
+For each history size it reports the bytes of the history as written to
+progress.json (indent=2), as compact JSON, and as a ProgressColumns file,
+and the Python heap held by the loaded list of dicts vs the columns, both
+viewed in the file's bytes and copied into arrays (measured with
+tracemalloc), plus the time to load each.
+
+Usage (from the bot directory):
+    python benchmarks/progress_size.py [--entries 1000 10000 100000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from progress_columns import ProgressColumns
+from synthetic import make_history
+
+
+def loaded_size(load):
+    """(bytes allocated by the object load() returns, seconds to load)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = load()
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size, elapsed
+
+
+def _load_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _in_memory(path):
+    columns = ProgressColumns.load(path)
+    columns._materialize()
+    return columns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args(argv)
+
+    print(f"{'entries':>8} {'format':<20} {'disk KB':>10} {'heap KB':>10} {'load ms':>9}")
+    for entries in args.entries:
+        history = make_history(entries)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            indented = os.path.join(tmp_dir, 'progress.json')
+            compact = os.path.join(tmp_dir, 'compact.json')
+            columns = os.path.join(tmp_dir, 'history.progress')
+            formats = [
+                ('json indent=2', indented, json.dumps(history, ensure_ascii=False, indent=2),
+                 lambda: _load_json(indented)),
+                ('json compact', compact, json.dumps(history, ensure_ascii=False, separators=(',', ':')),
+                 lambda: _load_json(compact)),
+                ('columns (bytes)', columns, ProgressColumns.from_entries(history).to_bytes(),
+                 lambda: ProgressColumns.load(columns)),
+                ('columns (arrays)', columns, None, lambda: _in_memory(columns)),
+            ]
+            for name, path, data, load in formats:
+                if data is not None:
+                    with open(path, 'wb') as f:
+                        f.write(data if isinstance(data, bytes) else data.encode('utf-8'))
+                heap, seconds = loaded_size(load)
+                disk = os.path.getsize(path)
+                print(f"{entries:>8} {name:<20} {disk / 1024:>10.1f} {heap / 1024:>10.1f} {seconds * 1000:>9.2f}")
+
+if __name__ == '__main__':
+    main()
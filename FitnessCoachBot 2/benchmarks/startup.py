@@ -0,0 +1,76 @@
+"""Cold start and memory cost of loading the exercise catalog.
+
+Each loader runs in a fresh interpreter so import time and peak RSS are
+measured from scratch. The pandas loader is only measured when pandas is
+installed.
+
+Usage (from the bot directory):
+    python benchmarks/startup.py [--runs N]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+{body}
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'seconds': elapsed, 'rss_mb': rss_kb / 1024}}))
+"""
+
+LOADERS = {
+    'baseline (interpreter only)': "pass",
+    'csv WorkoutManager': """
+import logging
+logging.disable(logging.CRITICAL)
+from workout_manager import WorkoutManager
+WorkoutManager()
+""",
+    'pandas read_csv + filter': """
+import pandas as pd
+from workout_manager import EXERCISES_CSV
+df = pd.read_csv(EXERCISES_CSV)
+df[(df['fitness_level'] == 'beginner') & (df['fitness_goals'] == 'weightloss') & (df['equipment'] == 'Нет')]
+""",
+}
+
+
+def measure(body, runs):
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE.format(body=body)],
+            cwd=BOT_DIR, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            return None
+        samples.append(json.loads(result.stdout))
+    return {
+        'seconds': statistics.median(s['seconds'] for s in samples),
+        'rss_mb': statistics.median(s['rss_mb'] for s in samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'loader':<30} {'startup ms':>12} {'peak RSS MB':>12}")
+    for name, body in LOADERS.items():
+        result = measure(body, args.runs)
+        if result is None:
+            print(f"{name:<30} {'unavailable':>12}")
+            continue
+        print(f"{name:<30} {result['seconds'] * 1000:>12.1f} {result['rss_mb']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
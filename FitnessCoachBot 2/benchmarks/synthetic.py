@@ -0,0 +1,69 @@
+"""Synthetic users, profiles, feedback and workout histories for benchmarks.
+
+Everything is generated from a seed, so two runs benchmark the same data.
+"""
+import random
+from datetime import date, timedelta
+from config import FITNESS_GOALS, FITNESS_LEVELS, EQUIPMENT_OPTIONS
+
+FEEDBACK_VALUES = ('too_easy', 'good', 'good', 'too_hard')
+
+
+def make_profile(rng):
+    """A completed /profile answer set"""
+    return {
+        'age': rng.randint(16, 70),
+        'height': rng.randint(150, 200),
+        'weight': float(rng.randint(45, 120)),
+        'sex': rng.choice(['Мужской', 'Женский']),
+        'goals': rng.choice(FITNESS_GOALS),
+        'fitness_level': rng.choice(FITNESS_LEVELS),
+        'equipment': rng.choice(EQUIPMENT_OPTIONS),
+    }
+
+
+def make_profiles(count, seed=0):
+    """Profiles keyed by user id, as Database stores them"""
+    rng = random.Random(seed)
+    return {str(100000 + n): make_profile(rng) for n in range(count)}
+
+
+def make_feedback(count, rng, start=date(2024, 1, 1)):
+    """A feedback history of ``count`` workouts, oldest first"""
+    return {
+        f"workout_{(start + timedelta(days=n)).strftime('%Y%m%d')}_070000": {
+            'feedback': rng.choice(FEEDBACK_VALUES),
+            'timestamp': f"{(start + timedelta(days=n)).isoformat()} 08:00:00",
+        }
+        for n in range(count)
+    }
+
+
+def make_history(entries, end=None, seed=0, skip_rate=0.2, max_per_day=2):
+    """``entries`` progress entries in date order ending on ``end`` (default today).
+
+    Days are skipped with probability ``skip_rate`` (breaking streaks) and
+    some days have more than one workout.
+    """
+    rng = random.Random(seed)
+    end = end or date.today()
+    days = []
+    day = end
+    while len(days) < entries:
+        if rng.random() >= skip_rate:
+            days.extend([day] * min(rng.randint(1, max_per_day), entries - len(days)))
+        day -= timedelta(days=1)
+    days.reverse()
+
+    history = []
+    for day in days:
+        total = rng.randint(5, 15)
+        completed = rng.randint(1, total)
+        history.append({
+            'date': day.isoformat(),
+            'exercises_completed': completed,
+            'total_exercises': total,
+            'workout_completed': completed == total,
+            'workout_id': f"workout_{day.strftime('%Y%m%d')}_{len(history):06d}",
+        })
+    return history
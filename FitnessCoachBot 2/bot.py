@@ -1,10 +1,18 @@
+import asyncio
 import logging
 from telegram.ext import ApplicationBuilder, Application
-from config import TOKEN, COMMANDS
+from config import (
+    TOKEN, TELEGRAM_API_URL, COMMANDS, MAX_CONCURRENT_UPDATES, BOT_MODE, METRICS_LISTEN, METRICS_PORT,
+    RATE_LIMIT_OVERALL, RATE_LIMIT_PER_CHAT, RATE_LIMIT_CHAT_BURST, RATE_LIMIT_MAX_RETRIES,
+    RATE_LIMIT_CHAT_CACHE_SIZE
+)
 from database import Database
 from workout_manager import WorkoutManager
 from reminder import ReminderManager
 from handlers import BotHandlers
+from update_processor import PerUserUpdateProcessor
+from rate_limiter import PriorityRateLimiter
+import metrics
 
 # Set up logging
 logging.basicConfig(
@@ -18,47 +26,79 @@ async def setup_commands(application: Application) -> None:
         (command, description) for command, description in COMMANDS.items()
     ])
 
-def main():
-    """Initialize and start the bot"""
-    if not TOKEN:
-        print("Error: Telegram Bot Token not found. Please set the TELEGRAM_BOT_TOKEN environment variable.")
-        return
-
-    try:
-        # Initialize components
-        database = Database()
-        workout_manager = WorkoutManager()
-
-        # Create application with specific settings to avoid conflicts
-        application = (
-            ApplicationBuilder()
-            .token(TOKEN)
-            .concurrent_updates(False)    # Disable concurrent updates
-            .build()
+async def error_handler(update, context):
+    """Log errors and tell the user to start over"""
+    logging.error(f"Error occurred: {context.error}")
+    if update and update.effective_message:
+        await update.effective_message.reply_text(
+            "Произошла ошибка. Пожалуйста, попробуйте еще раз или начните сначала с помощью /start"
         )
 
-        # Initialize reminder manager with bot instance
-        reminder_manager = ReminderManager(application.bot, database)
+def build_application(reminder_shard=0, reminder_shards=1, overall_rate=RATE_LIMIT_OVERALL):
+    """Create the Application with all handlers; return (application, database)
+
+    ``overall_rate`` is this process's share of the global message limit and
+    ``reminder_shard`` of ``reminder_shards`` picks the users whose reminders
+    it schedules (see ReminderManager).
+    """
+    # Initialize components
+    database = Database()
+    workout_manager = WorkoutManager()
+
+    async def post_shutdown(application: Application) -> None:
+        await handlers.shutdown()
+        # Storage writes run on a background thread; wait for the last ones
+        await asyncio.to_thread(database.flush)
+
+    # Process different users concurrently, each user's updates in order
+    application = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .base_url(TELEGRAM_API_URL)
+        .concurrent_updates(PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .rate_limiter(PriorityRateLimiter(
+            overall_rate, RATE_LIMIT_PER_CHAT, RATE_LIMIT_CHAT_BURST, RATE_LIMIT_MAX_RETRIES,
+            RATE_LIMIT_CHAT_CACHE_SIZE
+        ))
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+
+    # Initialize reminder manager and reschedule stored reminders
+    reminder_manager = ReminderManager(
+        application.job_queue, database, shard=reminder_shard, shards=reminder_shards, rate=overall_rate
+    )
+    reminder_manager.load_reminders()
 
-        # Initialize handlers
-        handlers = BotHandlers(database, workout_manager, reminder_manager)
+    # Initialize handlers
+    handlers = BotHandlers(database, workout_manager, reminder_manager)
 
-        # Add error handler
-        async def error_handler(update, context):
-            logging.error(f"Error occurred: {context.error}")
-            if update and update.effective_message:
-                await update.effective_message.reply_text(
-                    "Произошла ошибка. Пожалуйста, попробуйте еще раз или начните сначала с помощью /start"
-                )
+    application.add_error_handler(error_handler)
 
-        application.add_error_handler(error_handler)
+    # Add handlers to application
+    for handler in handlers.get_handlers():
+        application.add_handler(handler)
 
-        # Add handlers to application
-        for handler in handlers.get_handlers():
-            application.add_handler(handler)
+    # Set up commands
+    application.job_queue.run_once(setup_commands, when=0)
 
-        # Set up commands
-        application.job_queue.run_once(setup_commands, when=0)
+    return application, database
+
+def main():
+    """Initialize and start the bot"""
+    if not TOKEN:
+        print("Error: Telegram Bot Token not found. Please set the TELEGRAM_BOT_TOKEN environment variable.")
+        return
+
+    if BOT_MODE == 'webhook':
+        import webhook
+        webhook.main()
+        return
+
+    try:
+        application, database = build_application()
+        if METRICS_PORT:
+            metrics.start_server(METRICS_LISTEN, METRICS_PORT)
 
         # Start the bot
         print("Bot started...")
@@ -68,9 +108,12 @@ def main():
             close_loop=False  # Prevent multiple event loop issues
         )
 
+        # Compact journals so the next start has nothing to replay
+        database.close()
+
     except Exception as e:
         logging.error(f"Error starting bot: {e}")
         raise
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
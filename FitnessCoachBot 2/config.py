@@ -4,6 +4,9 @@ import os
 # Telegram Bot Token
 TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 
+# Bot API endpoint; point it at fake_bot_api.FakeBotAPI for load tests
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org/bot')
+
 # States for ConversationHandler
 PROFILE = range(1, 8)
 (
@@ -45,4 +48,94 @@ FITNESS_LEVELS = [
 EQUIPMENT_OPTIONS = [
     "Только вес тела",
     "Доступ в спортзал"
-]
\ No newline at end of file
+]
+
+# Storage backend for the Database: 'journal' (append-only, default), 'sqlite',
+# 'sharded' (one file per user, loaded on demand) or 'json'
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'journal')
+
+# Directory holding the data files
+DATA_DIR = os.getenv('DATA_DIR', '.')
+
+# A collection is compacted once its journal outgrows this fraction of the
+# snapshot, so rewriting the snapshot costs O(1) amortized per record
+JOURNAL_COMPACT_RATIO = float(os.getenv('JOURNAL_COMPACT_RATIO', '0.5'))
+
+# Journal size in bytes below which a collection is not compacted
+JOURNAL_COMPACT_MIN_BYTES = int(os.getenv('JOURNAL_COMPACT_MIN_BYTES', str(1024 * 1024)))
+
+# fsync every journal record (disable only for throwaway environments)
+JOURNAL_FSYNC = os.getenv('JOURNAL_FSYNC', '1') == '1'
+
+# Group-commit window of the json/journal backends' writer thread: writes
+# made within it are persisted off the event loop as one durable batch.
+# A negative value writes synchronously
+STORAGE_WRITE_DELAY = float(os.getenv('STORAGE_WRITE_DELAY', '0.05'))
+if STORAGE_WRITE_DELAY < 0:
+    STORAGE_WRITE_DELAY = None
+
+# Records that close a group-commit window early
+STORAGE_WRITE_BATCH = int(os.getenv('STORAGE_WRITE_BATCH', '500'))
+
+# Users whose data the 'sharded' backend keeps in memory; the least recently
+# used ones are dropped once their writes are on disk
+SHARD_CACHE_SIZE = int(os.getenv('SHARD_CACHE_SIZE', '10000'))
+
+# SQLite database file inside DATA_DIR, used by the 'sqlite' backend
+SQLITE_FILENAME = os.getenv('SQLITE_FILENAME', 'fitness.db')
+
+# Updates processed at once; updates of the same user are always serialized
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '256'))
+
+# Timer messages are edited every TIMER_EDIT_INTERVAL seconds,
+# then every second for the last TIMER_FINAL_COUNTDOWN seconds
+TIMER_EDIT_INTERVAL = int(os.getenv('TIMER_EDIT_INTERVAL', '10'))
+TIMER_FINAL_COUNTDOWN = int(os.getenv('TIMER_FINAL_COUNTDOWN', '5'))
+
+# Outgoing request limits (Telegram allows about 30 msg/s overall, 1 msg/s per chat).
+# RATE_LIMIT_OVERALL is for the whole bot: each webhook worker gets 1/WEBHOOK_WORKERS of it
+RATE_LIMIT_OVERALL = float(os.getenv('RATE_LIMIT_OVERALL', '30'))
+RATE_LIMIT_PER_CHAT = float(os.getenv('RATE_LIMIT_PER_CHAT', '1'))
+RATE_LIMIT_CHAT_BURST = int(os.getenv('RATE_LIMIT_CHAT_BURST', '3'))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv('RATE_LIMIT_MAX_RETRIES', '3'))
+# Chats whose rate limit state is kept before idle ones are dropped
+RATE_LIMIT_CHAT_CACHE_SIZE = int(os.getenv('RATE_LIMIT_CHAT_CACHE_SIZE', '10000'))
+
+# Reminder sends in flight at once while a time slot is being delivered
+REMINDER_CONCURRENCY = int(os.getenv('REMINDER_CONCURRENCY', '64'))
+
+# Active workout sessions: SQLite file inside DATA_DIR, in-memory LRU size,
+# idle seconds before a session is dropped, seconds between background writes
+SESSION_DB_FILENAME = os.getenv('SESSION_DB_FILENAME', 'sessions.db')
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', '10000'))
+SESSION_TTL = int(os.getenv('SESSION_TTL', str(6 * 3600)))
+SESSION_FLUSH_INTERVAL = float(os.getenv('SESSION_FLUSH_INTERVAL', '1.0'))
+
+# How updates are received: 'polling' (single process) or 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Webhook mode: HTTP front end address, path and secret token, public URL to
+# register with Telegram (optional), and worker processes sharded by user id.
+# Workers share state, so webhook mode needs STORAGE_BACKEND=sqlite when WEBHOOK_WORKERS > 1.
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '4'))
+
+# Users whose progress columns the json/journal backends keep for /progress
+PROGRESS_COLUMNS_CACHE_SIZE = int(os.getenv('PROGRESS_COLUMNS_CACHE_SIZE', '1024'))
+
+# Rendered calendar keyboards and per-user month lookups kept in memory
+CALENDAR_CACHE_SIZE = int(os.getenv('CALENDAR_CACHE_SIZE', '1024'))
+
+# Workout generation logging: level of the workout_manager logger and the
+# share of requests (0..1) that log a summary record. Warnings are never sampled.
+WORKOUT_LOG_LEVEL = os.getenv('WORKOUT_LOG_LEVEL', 'INFO')
+WORKOUT_LOG_SAMPLE_RATE = float(os.getenv('WORKOUT_LOG_SAMPLE_RATE', '0.1'))
+
+# Prometheus metrics endpoint (GET /metrics); 0 disables it. In webhook mode
+# worker N listens on METRICS_PORT + N.
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
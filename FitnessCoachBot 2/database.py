@@ -1,172 +1,195 @@
-import json
-from datetime import datetime, timedelta
-import json
-from collections import defaultdict
+import calendar
+import copy
+from datetime import date, datetime, timedelta
+from config import STORAGE_BACKEND, DATA_DIR
+from storage import create_storage
+import analytics
+import stats
 
 class Database:
-    def __init__(self):
+    def __init__(self, storage=None):
         """Initialize database and load existing data"""
-        self.users = self._load_from_file('users.json')
-        self.workouts = self._load_from_file('workouts.json')
-        self.progress = self._load_from_file('progress.json')
-        self.reminders = self._load_from_file('reminders.json')
-        self.feedback = self._load_from_file('feedback.json')
+        self.storage = storage if storage is not None else create_storage(STORAGE_BACKEND, DATA_DIR)
 
     def save_user_profile(self, user_id, profile_data, telegram_handle=None):
         """Save user profile data with telegram handle"""
         user_id = str(user_id)
-        profile_data['telegram_handle'] = telegram_handle
+        # A copy: the caller's dict (context.user_data) keeps changing
+        profile_data = dict(profile_data, telegram_handle=telegram_handle)
         profile_data['last_updated'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        self.users[user_id] = profile_data
-        self._save_to_file('users.json', self.users)
+        self.storage.set('users', user_id, profile_data)
 
     def get_user_profile(self, user_id):
         """Get user profile data"""
-        return self.users.get(str(user_id))
+        return self.storage.get('users', str(user_id))
 
     def save_workout_progress(self, user_id, workout_data):
-        """Save workout completion data"""
+        """Save workout completion data and update the user's running stats"""
         user_id = str(user_id)
-        if user_id not in self.progress:
-            self.progress[user_id] = []
-
         workout_data['date'] = datetime.now().strftime('%Y-%m-%d')
-        self.progress[user_id].append(workout_data)
-        self._save_to_file('progress.json', self.progress)
+        # Stored records are never changed in place; the writer may be saving them
+        user_stats = copy.deepcopy(self.get_progress_stats(user_id))
+        self.storage.append('progress', user_id, workout_data)
+        self.storage.set('stats', user_id, stats.add_workout(user_stats, workout_data))
 
     def get_user_progress(self, user_id):
         """Get user's workout progress"""
-        return self.progress.get(str(user_id), [])
+        return self.storage.get('progress', str(user_id), [])
 
-    def get_workout_streak(self, user_id):
-        """Calculate current and longest workout streaks"""
+    def get_progress_stats(self, user_id):
+        """Get the user's running workout aggregates (see stats.py)"""
         user_id = str(user_id)
-        workouts = self.get_user_progress(user_id)
-        if not workouts:
-            return {"current_streak": 0, "longest_streak": 0}
-
-        # Sort workouts by date
-        workout_dates = sorted(set(
-            datetime.strptime(w['date'], '%Y-%m-%d').date()
-            for w in workouts
-        ))
-
-        if not workout_dates:
-            return {"current_streak": 0, "longest_streak": 0}
-
-        # Calculate streaks
-        current_streak = 0
-        longest_streak = 0
-        streak_count = 0
-        today = datetime.now().date()
-
-        # Check if the last workout was today or yesterday to continue the streak
-        last_workout = workout_dates[-1]
-        if last_workout < today - timedelta(days=1):
-            current_streak = 0
-        else:
-            # Count backwards from the last workout
-            for i in range(len(workout_dates) - 1, -1, -1):
-                if i == len(workout_dates) - 1:
-                    streak_count = 1
-                    continue
-
-                if workout_dates[i] == workout_dates[i + 1] - timedelta(days=1):
-                    streak_count += 1
-                else:
-                    break
-
-            current_streak = streak_count
-
-        # Calculate longest streak
-        streak_count = 1
-        for i in range(1, len(workout_dates)):
-            if workout_dates[i] == workout_dates[i-1] + timedelta(days=1):
-                streak_count += 1
-            else:
-                longest_streak = max(longest_streak, streak_count)
-                streak_count = 1
-
-        longest_streak = max(longest_streak, streak_count, current_streak)
+        user_stats = self.storage.get('stats', user_id)
+        # History written before aggregates existed, or a crash between the
+        # progress and stats writes of a saved workout: build them again
+        if user_stats is None or user_stats['total_workouts'] != self.storage.progress_count(user_id):
+            user_stats = self.rebuild_stats(user_id)
+        return user_stats
+
+    def rebuild_stats(self, user_id):
+        """Recompute a user's aggregates from their full history"""
+        user_id = str(user_id)
+        progress = self.get_user_progress(user_id)
+        user_stats = stats.build_stats(progress)
+        if progress:
+            self.storage.set('stats', user_id, user_stats)
+        return user_stats
+
+    def rebuild_all_stats(self):
+        """Recompute the aggregates of every user with a history; return the user count"""
+        user_ids = [user_id for user_id, _ in self.storage.items('progress')]
+        for user_id in user_ids:
+            self.rebuild_stats(user_id)
+        return len(user_ids)
+
+    def get_progress_summary(self, user_id):
+        """Get the /progress figures: running totals and streaks, rolling averages, recent workouts"""
+        user_id = str(user_id)
+        user_stats = self.get_progress_stats(user_id)
+        total = user_stats['total_workouts']
+        summary = {
+            'total_workouts': total,
+            'completed_workouts': user_stats['completed_workouts'],
+            'average_completion': user_stats['completion_sum'] / total if total else 0.0,
+            'recent': user_stats['recent'],
+        }
+        summary.update(self.get_workout_streak(user_id))
+        summary.update(analytics.rolling_averages(self.storage.progress_columns(user_id), datetime.now().date()))
+        return summary
 
+    def get_workout_streak(self, user_id):
+        """Get current and longest workout streaks"""
+        user_stats = self.get_progress_stats(user_id)
+        current_streak = stats.current_streak(user_stats, datetime.now().date())
         return {
             "current_streak": current_streak,
-            "longest_streak": longest_streak
+            "longest_streak": max(user_stats['longest_streak'], current_streak)
         }
 
     def get_workout_intensity_stats(self, user_id, days=30):
         """Get workout intensity statistics for the last N days"""
-        user_id = str(user_id)
-        workouts = self.get_user_progress(user_id)
-        if not workouts:
-            return []
-
         # Get date range
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=days)
 
-        # Group workouts by date
-        daily_stats = defaultdict(lambda: {"total_exercises": 0, "completed_exercises": 0})
-
-        for workout in workouts:
-            workout_date = datetime.strptime(workout['date'], '%Y-%m-%d').date()
-            if start_date <= workout_date <= end_date:
-                daily_stats[workout_date.strftime('%Y-%m-%d')]['total_exercises'] += workout['total_exercises']
-                daily_stats[workout_date.strftime('%Y-%m-%d')]['completed_exercises'] += workout['exercises_completed']
+        # Totals grouped by date, sorted by date
+        if days <= stats.ROLLUP_DAYS:
+            start, end = start_date.isoformat(), end_date.isoformat()
+            daily_totals = sorted(
+                (date, total, completed)
+                for date, (total, completed) in self.get_progress_stats(user_id)['days'].items()
+                if start <= date <= end
+            )
+        else:
+            daily_totals = self.storage.daily_totals(str(user_id), start_date, end_date)
 
-        # Convert to list and sort by date
-        stats = [
+        return [
             {
                 "date": date,
-                "completion_rate": stats['completed_exercises'] / stats['total_exercises'] * 100 if stats['total_exercises'] >0 else 0,
-                "total_exercises": stats['total_exercises']
+                "completion_rate": completed / total * 100 if total > 0 else 0,
+                "total_exercises": total
             }
-            for date, stats in daily_stats.items()
+            for date, total, completed in daily_totals
         ]
 
-        return sorted(stats, key=lambda x: x['date'])
-
     def save_workout_feedback(self, user_id, workout_id, feedback_data):
         """Save workout feedback"""
-        user_id = str(user_id)
-        if user_id not in self.feedback:
-            self.feedback[user_id] = {}
-        self.feedback[user_id][workout_id] = feedback_data
-        self._save_to_file('feedback.json', self.feedback)
+        self.storage.set_item('feedback', str(user_id), workout_id, feedback_data)
 
     def get_user_feedback(self, user_id):
         """Get user's workout feedback history"""
-        return self.feedback.get(str(user_id), {})
+        return self.storage.get('feedback', str(user_id), {})
 
     def get_workouts_by_date(self, user_id, start_date, end_date):
         """Get workouts within date range"""
-        user_progress = self.get_user_progress(user_id)
-        return [
-            workout for workout in user_progress
-            if start_date <= datetime.strptime(workout['date'], '%Y-%m-%d').date() <= end_date
-        ]
+        return self.storage.progress_between(str(user_id), start_date, end_date)
+
+    def get_workout_days(self, user_id, year, month):
+        """Get the dates ('YYYY-MM-DD') of a month the user worked out on"""
+        # Per-day sums come from the backend's date index, without decoding the workouts
+        first, last = date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+        return {day for day, _, _ in self.storage.daily_totals(str(user_id), first, last)}
+
+    def get_workouts_on_date(self, user_id, day):
+        """Get the workouts of a single day ('YYYY-MM-DD')"""
+        day = date.fromisoformat(day)
+        return self.storage.progress_between(str(user_id), day, day)
+
+    def get_all_profiles(self):
+        """Get every user's profile by user id"""
+        return dict(self.storage.items('users'))
+
+    def get_all_feedback(self):
+        """Get every user's feedback history by user id"""
+        return dict(self.storage.items('feedback'))
+
+    def save_daily_plans(self, date, plans, assignments):
+        """Store distinct workout plans by id and the plan each user gets on a date"""
+        for plan_id, workout in plans.items():
+            self.storage.set('plans', plan_id, workout)
+        for user_id, plan_id in assignments.items():
+            self.storage.set('workouts', str(user_id), {'date': date, 'plan': plan_id})
+
+    def get_daily_workout(self, user_id, date):
+        """Get a private copy of the user's precomputed workout for a date, or None"""
+        assignment = self.storage.get('workouts', str(user_id))
+        if not assignment or assignment['date'] != date:
+            return None
+        plan = self.storage.get('plans', assignment['plan'])
+        return copy.deepcopy(plan) if plan is not None else None
 
     def set_reminder(self, user_id, time):
         """Set workout reminder"""
-        self.reminders[str(user_id)] = time
-        self._save_to_file('reminders.json', self.reminders)
+        self.storage.set('reminders', str(user_id), time)
 
     def get_reminder(self, user_id):
         """Get user's reminder time"""
-        return self.reminders.get(str(user_id))
-
-    def _save_to_file(self, filename, data):
-        """Save data to JSON file"""
-        try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Error saving to {filename}: {e}")
-
-    def _load_from_file(self, filename):
-        """Load data from JSON file"""
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
\ No newline at end of file
+        return self.storage.get('reminders', str(user_id))
+
+    def get_reminders(self):
+        """Get every user's reminder time"""
+        return dict(self.storage.items('reminders'))
+
+    def get_media_file_ids(self):
+        """Get cached Telegram file_ids by media URL"""
+        return {url: file_id for url, file_id in self.storage.items('media') if file_id}
+
+    def save_media_file_id(self, url, file_id):
+        """Cache the Telegram file_id of a media URL (None forgets it)"""
+        self.storage.set('media', url, file_id)
+
+    def flush(self):
+        """Wait until every accepted write is on disk"""
+        self.storage.flush()
+
+    def durable(self):
+        """concurrent.futures.Future resolved once the writes made so far are on disk.
+
+        Await it with ``asyncio.wrap_future`` when a reply must not promise
+        more than has been saved.
+        """
+        return self.storage.durable()
+
+    def close(self):
+        """Flush pending writes and release storage resources"""
+        self.storage.close()
@@ -0,0 +1,198 @@
+"""Local stand-in for the Telegram Bot API, for load tests without Telegram.
+
+Point the bot at it with TELEGRAM_API_URL=http://127.0.0.1:<port>/bot. Every
+request is recorded with its chat and answered after a simulated latency;
+a share of chat requests can be answered with 429 Too Many Requests. Sent
+and edited messages are kept per chat so a driver can build callback
+queries on the bot's latest message.
+"""
+import json
+import random
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'FitnessCoachBot', 'username': 'fitness_coach_test_bot'}
+
+# Methods answering with the (possibly edited) message
+MESSAGE_METHODS = {
+    'sendMessage', 'sendAnimation', 'sendPhoto',
+    'editMessageText', 'editMessageCaption', 'editMessageMedia', 'editMessageReplyMarkup',
+}
+
+
+class FakeBotAPI:
+    """Threaded HTTP server answering Bot API methods with plausible results"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.05, jitter=0.02, error_rate=0.0, retry_after=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.calls = []  # (chat_id, method, seconds, status)
+        self.messages = {}  # chat_id -> {message_id: message}
+        self._message_ids = {}
+        self._file_ids = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        self.server = ThreadingHTTPServer((host, port), self._make_request_handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/bot'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-bot-api', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def last_message(self, chat_id):
+        """The chat's most recently sent or edited message"""
+        with self._lock:
+            messages = self.messages.get(chat_id)
+            if not messages:
+                return None
+            return max(messages.values(), key=lambda message: message['_updated'])
+
+    def calls_for(self, chat_id):
+        with self._lock:
+            return [call for call in self.calls if call[0] == chat_id]
+
+    def handle(self, method, params):
+        """Return (HTTP status, response body) for one Bot API call"""
+        started = time.perf_counter()
+        chat_id = params.get('chat_id')
+        chat_id = int(chat_id) if chat_id is not None else None
+
+        with self._lock:
+            delay = max(0.0, self._random.gauss(self.latency, self.jitter)) if self.latency else 0.0
+            throttled = chat_id is not None and self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+
+        if throttled:
+            status, body = 429, {
+                'ok': False, 'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after},
+            }
+        else:
+            status, body = 200, {'ok': True, 'result': self._result(method, chat_id, params)}
+
+        with self._lock:
+            self.calls.append((chat_id, method, time.perf_counter() - started, status))
+        return status, body
+
+    def _result(self, method, chat_id, params):
+        if method == 'getMe':
+            return BOT_USER
+        if method not in MESSAGE_METHODS:
+            # setMyCommands, answerCallbackQuery, deleteMessage, ...
+            if method == 'deleteMessage':
+                with self._lock:
+                    self.messages.get(chat_id, {}).pop(int(params['message_id']), None)
+            return True
+
+        with self._lock:
+            messages = self.messages.setdefault(chat_id, {})
+            if method.startswith('send'):
+                message_id = self._message_ids[chat_id] = self._message_ids.get(chat_id, 0) + 1
+                message = {
+                    'message_id': message_id, 'date': int(time.time()), 'from': BOT_USER,
+                    'chat': {'id': chat_id, 'type': 'private'},
+                }
+            else:
+                message_id = int(params['message_id'])
+                message = dict(messages.get(message_id) or {
+                    'message_id': message_id, 'date': int(time.time()), 'from': BOT_USER,
+                    'chat': {'id': chat_id, 'type': 'private'},
+                })
+
+            if method in ('sendMessage', 'editMessageText'):
+                message.pop('animation', None)
+                message.pop('caption', None)
+                message['text'] = params.get('text', '')
+            elif method in ('sendAnimation', 'editMessageMedia'):
+                message.pop('text', None)
+                self._file_ids += 1
+                message['animation'] = {
+                    'file_id': f'fake-file-{self._file_ids}', 'file_unique_id': f'fake-{self._file_ids}',
+                    'width': 320, 'height': 240, 'duration': 3,
+                }
+                media = params.get('media')
+                message['caption'] = media.get('caption', '') if isinstance(media, dict) else params.get('caption', '')
+            elif method == 'editMessageCaption':
+                message['caption'] = params.get('caption', '')
+            markup = params.get('reply_markup')
+            if isinstance(markup, dict) and 'inline_keyboard' in markup:
+                # Only inline keyboards are part of the message Telegram returns
+                message['reply_markup'] = markup
+            elif method.startswith('send') or 'reply_markup' in params:
+                message.pop('reply_markup', None)
+            message['_updated'] = time.monotonic_ns()
+            messages[message_id] = message
+
+        return {key: value for key, value in message.items() if not key.startswith('_')}
+
+    def _make_request_handler(self):
+        api = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                method = self.path.rsplit('/', 1)[-1]
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status, response = api.handle(method, _parse_params(self.headers, body))
+                payload = json.dumps(response, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        return RequestHandler
+
+
+def _parse_params(headers, body):
+    """Decode form, multipart or JSON parameters; JSON objects and arrays are decoded"""
+    content_type = headers.get('Content-Type', '')
+    if content_type.startswith('application/json'):
+        return json.loads(body or b'{}')
+    if content_type.startswith('multipart/form-data'):
+        message = BytesParser(policy=HTTP).parsebytes(
+            b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body
+        )
+        pairs = [
+            (part.get_param('name', header='content-disposition'), part.get_content())
+            for part in message.iter_parts() if not part.get_filename()
+        ]
+    else:
+        pairs = parse_qsl(body.decode('utf-8'))
+
+    params = {}
+    for key, value in pairs:
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        if value[:1] in ('{', '['):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        params[key] = value
+    return params
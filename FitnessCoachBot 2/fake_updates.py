@@ -0,0 +1,90 @@
+"""Post synthetic Telegram updates to a local webhook, for testing without Telegram.
+
+    python fake_updates.py --users 50 --url http://127.0.0.1:8443/telegram
+
+The bot's replies still go to the Bot API, so point the bot at a test token
+or a fake Bot API server.
+"""
+import argparse
+import itertools
+import json
+import time
+import urllib.request
+from config import WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id):
+    return {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'}
+
+
+def _chat(user_id):
+    return {'id': user_id, 'type': 'private'}
+
+
+def command_update(user_id, command):
+    """Update for a user sending /command"""
+    return {
+        'update_id': next(_update_ids),
+        'message': {
+            'message_id': next(_update_ids),
+            'date': int(time.time()),
+            'from': _user(user_id),
+            'chat': _chat(user_id),
+            'text': command,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command.split()[0])}],
+        },
+    }
+
+
+def callback_update(user_id, data, message_id=1):
+    """Update for a user pressing an inline button"""
+    return {
+        'update_id': next(_update_ids),
+        'callback_query': {
+            'id': str(next(_update_ids)),
+            'from': _user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': _chat(user_id),
+                'text': '',
+            },
+        },
+    }
+
+
+def post_updates(url, updates, secret=WEBHOOK_SECRET):
+    """POST updates one by one; return the HTTP status codes"""
+    statuses = []
+    for update in updates:
+        request = urllib.request.Request(
+            url, data=json.dumps(update).encode('utf-8'), headers={'Content-Type': 'application/json'}
+        )
+        if secret:
+            request.add_header('X-Telegram-Bot-Api-Secret-Token', secret)
+        with urllib.request.urlopen(request) as response:
+            statuses.append(response.status)
+    return statuses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default=f'http://{WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--first-user-id', type=int, default=100000)
+    parser.add_argument('--command', default='/start')
+    args = parser.parse_args(argv)
+
+    user_ids = range(args.first_user_id, args.first_user_id + args.users)
+    start = time.perf_counter()
+    statuses = post_updates(args.url, [command_update(user_id, args.command) for user_id in user_ids])
+    elapsed = time.perf_counter() - start
+    print(f"Posted {len(statuses)} updates in {elapsed:.2f}s, {statuses.count(200)} accepted")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,52 @@
-from telegram import Update, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaAnimation
 from telegram.ext import (
     CommandHandler, MessageHandler, CallbackQueryHandler,
     ConversationHandler, filters
 )
 from telegram.ext.filters import TEXT
 from telegram.ext._contexttypes import ContextTypes
+from telegram.error import BadRequest, NetworkError, RetryAfter
 from config import AGE, HEIGHT, WEIGHT, SEX, GOALS, FITNESS_LEVEL, EQUIPMENT
 import messages
 import keyboards
-from datetime import datetime, timedelta
+import stats
+from timers import TimerScheduler, format_timer
+from media_cache import MediaCache
+from session_store import SessionStore
+import metrics
+from config import (
+    TIMER_EDIT_INTERVAL, TIMER_FINAL_COUNTDOWN,
+    DATA_DIR, SESSION_DB_FILENAME, SESSION_CACHE_SIZE, SESSION_TTL, SESSION_FLUSH_INTERVAL, CALENDAR_CACHE_SIZE
+)
+from collections import OrderedDict
+from datetime import datetime
 import logging
 import asyncio
+import os
 import time
 
 logger = logging.getLogger(__name__)
 
+HANDLER_SECONDS = metrics.histogram('bot_handler_seconds', "Time spent in a handler callback", ['handler'])
+HANDLER_ERRORS = metrics.counter('bot_handler_errors_total', "Handler callbacks that raised", ['handler'])
+HANDLERS_IN_FLIGHT = metrics.gauge('bot_handlers_in_flight', "Handler callbacks running")
+EXERCISE_STEPS = metrics.counter('bot_exercise_steps_total', "Exercise steps rendered")
+EXERCISE_STEP_API_CALLS = metrics.counter(
+    'bot_exercise_step_api_calls_total', "Bot API calls spent rendering exercise steps"
+)
+
 class BotHandlers:
-    def __init__(self, database, workout_manager, reminder_manager):
+    def __init__(self, database, workout_manager, reminder_manager, session_store=None):
         self.db = database
         self.workout_manager = workout_manager
         self.reminder_manager = reminder_manager
-        self.active_workouts = {}  # Store active workout sessions
-        self.active_timers = {}    # Store active timer sessions
+        self.media_cache = MediaCache(database)  # GIF URL -> Telegram file_id
+        # Active workout sessions, persisted in the background
+        self.active_workouts = session_store if session_store is not None else SessionStore(
+            os.path.join(DATA_DIR, SESSION_DB_FILENAME), SESSION_CACHE_SIZE, SESSION_TTL, SESSION_FLUSH_INTERVAL
+        )
+        self.active_timers = TimerScheduler(TIMER_EDIT_INTERVAL, TIMER_FINAL_COUNTDOWN)  # One countdown per user
+        self.calendar_keyboards = OrderedDict()  # (user_id, year, month) -> markup, LRU
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
@@ -190,49 +215,42 @@ class BotHandlers:
     async def progress(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /progress command"""
         user_id = update.effective_user.id
-        progress_data = self.db.get_user_progress(user_id)
+        summary = self.db.get_progress_summary(user_id)
 
-        if not progress_data:
+        if not summary['total_workouts']:
             await update.message.reply_text("У вас пока нет завершенных тренировок.")
             return
 
-        # Get streak information
-        streak_info = self.db.get_workout_streak(user_id)
-
-        # Get intensity statistics for the last 30 days
-        intensity_stats = self.db.get_workout_intensity_stats(user_id, days=30)
-
         # Create progress summary
         message = "📊 Ваш прогресс:\n\n"
 
         # Add streak information
         message += "🔥 Статистика тренировок:\n"
-        message += f"• Текущая серия: {streak_info['current_streak']} дней\n"
-        message += f"• Лучшая серия: {streak_info['longest_streak']} дней\n\n"
+        message += f"• Текущая серия: {summary['current_streak']} дней\n"
+        message += f"• Лучшая серия: {summary['longest_streak']} дней\n\n"
 
         # Show last 5 workouts
         message += "📅 Последние тренировки:\n"
-        recent_workouts = progress_data[-5:]
-        for workout in recent_workouts:
+        for workout in summary['recent']:
             message += f"• {workout['date']}\n"
             message += f"  ✅ Выполнено упражнений: {workout['exercises_completed']}/{workout['total_exercises']}\n"
-            completion_rate = (workout['exercises_completed'] / workout['total_exercises']) * 100
-            message += f"  📈 Эффективность: {completion_rate:.1f}%\n"
+            message += f"  📈 Эффективность: {stats.completion_rate(workout):.1f}%\n"
             if workout['workout_completed']:
                 message += "  ✨ Тренировка завершена полностью\n"
             else:
                 message += "  ⏸ Тренировка не завершена\n"
             message += "\n"
 
-        # Add total workouts statistics
-        total_workouts = len(progress_data)
-        completed_workouts = sum(1 for w in progress_data if w.get('workout_completed', False))
-        avg_completion = sum(w['exercises_completed'] / w['total_exercises'] * 100 for w in progress_data) / len(progress_data)
+        # Rolling completion averages
+        message += "📆 Последние дни:\n"
+        message += f"• За 7 дней: {summary['workouts_7d']} тренировок, эффективность {summary['average_7d']:.1f}%\n"
+        message += f"• За 30 дней: {summary['workouts_30d']} тренировок, эффективность {summary['average_30d']:.1f}%\n\n"
 
+        # Add total workouts statistics
         message += f"📈 Общая статистика:\n"
-        message += f"• Всего тренировок: {total_workouts}\n"
-        message += f"• Завершено полностью: {completed_workouts}\n"
-        message += f"• Средняя эффективность: {avg_completion:.1f}%\n"
+        message += f"• Всего тренировок: {summary['total_workouts']}\n"
+        message += f"• Завершено полностью: {summary['completed_workouts']}\n"
+        message += f"• Средняя эффективность: {summary['average_completion']:.1f}%\n"
 
         await update.message.reply_text(message)
 
@@ -282,7 +300,7 @@ class BotHandlers:
         self.active_workouts[user_id] = workout
         await self._show_exercise(update, context)
 
-    async def _show_exercise(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def _show_exercise(self, update: Update, context: ContextTypes.DEFAULT_TYPE, in_place=True):
         """Display current exercise with controls"""
         user_id = update.effective_user.id if update.callback_query else update.effective_user.id
         workout = self.active_workouts.get(user_id)
@@ -365,66 +383,10 @@ class BotHandlers:
         reply_markup = InlineKeyboardMarkup(keyboard)
 
         try:
-            # Always send a new message instead of editing
-            if 'gif_url' in exercise and exercise['gif_url']:
-                try:
-                    # Send new message with GIF
-                    if update.callback_query:
-                        await update.callback_query.message.reply_animation(
-                            animation=exercise['gif_url'],
-                            caption=message,
-                            reply_markup=reply_markup,
-                            parse_mode='HTML'
-                        )
-                        # Try to delete the old message, but don't fail if we can't
-                        try:
-                            await update.callback_query.message.delete()
-                        except Exception:
-                            pass
-                    else:
-                        await update.message.reply_animation(
-                            animation=exercise['gif_url'],
-                            caption=message,
-                            reply_markup=reply_markup,
-                            parse_mode='HTML'
-                        )
-                except Exception as e:
-                    logging.error(f"Failed to send GIF: {str(e)}")
-                    # Fall back to text-only message
-                    if update.callback_query:
-                        await update.callback_query.message.reply_text(
-                            text=message,
-                            reply_markup=reply_markup,
-                            parse_mode='HTML'
-                        )
-                        try:
-                            await update.callback_query.message.delete()
-                        except Exception:
-                            pass
-                    else:
-                        await update.message.reply_text(
-                            text=message,
-                            reply_markup=reply_markup,
-                            parse_mode='HTML'
-                        )
-            else:
-                # Send text-only message
-                if update.callback_query:
-                    await update.callback_query.message.reply_text(
-                        text=message,
-                        reply_markup=reply_markup,
-                        parse_mode='HTML'
-                    )
-                    try:
-                        await update.callback_query.message.delete()
-                    except Exception:
-                        pass
-                else:
-                    await update.message.reply_text(
-                        text=message,
-                        reply_markup=reply_markup,
-                        parse_mode='HTML'
-                    )
+            calls = await self._render_exercise(update, message, reply_markup, exercise.get('gif_url'), in_place)
+            EXERCISE_STEPS.inc()
+            EXERCISE_STEP_API_CALLS.inc(calls)
+            logger.debug(f"Exercise step rendered with {calls} API calls")
 
         except Exception as e:
             logging.error(f"Error in _show_exercise: {str(e)}")
@@ -434,6 +396,93 @@ class BotHandlers:
             else:
                 await update.message.reply_text(error_message)
 
+    async def _render_exercise(self, update: Update, text, reply_markup, gif_url, in_place):
+        """Show an exercise screen and return the number of Telegram API calls it took.
+
+        A button press edits the pressed message in place when the media type
+        stays the same (animation -> animation, text -> text). Otherwise a new
+        message is sent and the old one deleted.
+        """
+        old_message = update.callback_query.message if update.callback_query else None
+
+        if in_place and old_message is not None:
+            animation = self.media_cache.get(gif_url) if gif_url else None
+            try:
+                if gif_url and old_message.animation is not None:
+                    if old_message.animation.file_id == animation:
+                        await old_message.edit_caption(caption=text, reply_markup=reply_markup, parse_mode='HTML')
+                    else:
+                        edited = await old_message.edit_media(
+                            InputMediaAnimation(animation, caption=text, parse_mode='HTML'),
+                            reply_markup=reply_markup
+                        )
+                        self.media_cache.remember(gif_url, edited)
+                    return 1
+                if not gif_url and old_message.text is not None:
+                    await old_message.edit_text(text=text, reply_markup=reply_markup, parse_mode='HTML')
+                    return 1
+            except BadRequest as e:
+                # Telegram rejected the request itself, possibly the cached file_id
+                logging.error(f"Failed to edit exercise message: {str(e)}")
+                if animation and animation != gif_url:
+                    self.media_cache.forget(gif_url)
+                return 1 + await self._send_exercise(update, text, reply_markup, gif_url)
+            except (RetryAfter, NetworkError):
+                # Transient: the file_id is fine, and sending again would fail the same way
+                raise
+            except Exception as e:
+                logging.error(f"Failed to edit exercise message: {str(e)}")
+                return 1 + await self._send_exercise(update, text, reply_markup, gif_url)
+
+        return await self._send_exercise(update, text, reply_markup, gif_url)
+
+    async def _send_exercise(self, update: Update, text, reply_markup, gif_url):
+        """Send the exercise as a new message, deleting the pressed one; return the API calls made"""
+        reply_to = update.callback_query.message if update.callback_query else update.message
+        calls = 0
+
+        if gif_url:
+            animation = self.media_cache.get(gif_url)
+            try:
+                # Send new message with GIF, by cached file_id when we have one
+                calls += 1
+                sent = await reply_to.reply_animation(
+                    animation=animation,
+                    caption=text,
+                    reply_markup=reply_markup,
+                    parse_mode='HTML'
+                )
+                self.media_cache.remember(gif_url, sent)
+            except BadRequest as e:
+                logging.error(f"Failed to send GIF: {str(e)}")
+                if animation != gif_url:
+                    self.media_cache.forget(gif_url)
+                gif_url = None
+            except (RetryAfter, NetworkError):
+                raise
+            except Exception as e:
+                logging.error(f"Failed to send GIF: {str(e)}")
+                gif_url = None
+
+        if not gif_url:
+            # Text-only message, also the fallback when the GIF fails
+            calls += 1
+            await reply_to.reply_text(
+                text=text,
+                reply_markup=reply_markup,
+                parse_mode='HTML'
+            )
+
+        if update.callback_query:
+            # Try to delete the old message, but don't fail if we can't
+            calls += 1
+            try:
+                await update.callback_query.message.delete()
+            except Exception:
+                pass
+
+        return calls
+
     async def handle_timer(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle exercise timer callback"""
         query = update.callback_query
@@ -443,39 +492,9 @@ class BotHandlers:
         timer_type = data[0]  # 'timer' or 'rest'
         seconds = int(data[1])
 
-        # Create timer message
-        timer_message = await query.message.reply_text(
-            f"⏱ {'Таймер' if timer_type == 'timer' else 'Отдых'}: {seconds} сек"
-        )
-
-        # Start countdown
-        while seconds > 0:
-            await asyncio.sleep(1)
-            seconds -= 1
-            try:
-                await timer_message.edit_text(
-                    f"⏱ {'Таймер' if timer_type == 'timer' else 'Отдых'}: {seconds} сек"
-                )
-            except Exception as e:
-                logging.error(f"Error updating timer: {str(e)}")
-                break
-
-        # Timer finished with instructions
-        try:
-            if timer_type == 'timer':
-                message = (
-                    "✅ Время упражнения истекло!\n\n"
-                    "👉 Теперь нажмите кнопку '⏰ Отдых' для восстановления.\n"
-                    "После отдыха нажмите '✅ Готово', чтобы перейти к следующему упражнению."
-                )
-            else:  # rest timer
-                message = (
-                    "✅ Отдых завершен!\n\n"
-                    "👉 Нажмите '✅ Готово', чтобы перейти к следующему упражнению."
-                )
-            await timer_message.edit_text(message)
-        except Exception as e:
-            logging.error(f"Error updating final timer message: {str(e)}")
+        # Create timer message; the shared scheduler counts it down
+        timer_message = await query.message.reply_text(format_timer(timer_type, seconds))
+        self.active_timers.start(update.effective_user.id, timer_message, timer_type, seconds)
 
     async def handle_workout_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle workout navigation callbacks"""
@@ -485,6 +504,9 @@ class BotHandlers:
         user_id = update.effective_user.id
         workout = self.active_workouts.get(user_id)
 
+        # The user moved on; a countdown for the previous screen is stale
+        self.active_timers.cancel(user_id)
+
         if not workout:
             await query.message.reply_text("Тренировка не найдена. Используйте /workout для новой тренировки.")
             return
@@ -497,6 +519,7 @@ class BotHandlers:
             if workout['current_exercise'] < workout['total_exercises'] - 1:
                 # Move to next exercise in the current circuit
                 workout['current_exercise'] += 1
+                self.active_workouts.touch(user_id)
                 logger.info(f"Moving to next exercise: {workout['current_exercise'] + 1} in circuit {workout['current_circuit']}")
                 await self._show_exercise(update, context)
             else:
@@ -513,11 +536,12 @@ class BotHandlers:
                     # Reset to first exercise and increment circuit
                     workout['current_circuit'] += 1
                     workout['current_exercise'] = 0
+                    self.active_workouts.touch(user_id)
                     logger.info(f"Starting new circuit {workout['current_circuit']}")
 
-                    # Add a small delay before showing the next exercise
+                    # Add a small delay before showing the next exercise below the circuit message
                     await asyncio.sleep(2)
-                    await self._show_exercise(update, context)
+                    await self._show_exercise(update, context, in_place=False)
                 else:
                     # All circuits completed
                     logger.info("All circuits completed, finishing workout")
@@ -525,10 +549,12 @@ class BotHandlers:
 
         elif query.data == "prev_exercise" and workout['current_exercise'] > 0:
             workout['current_exercise'] -= 1
+            self.active_workouts.touch(user_id)
             await self._show_exercise(update, context)
 
         elif query.data == "next_exercise" and workout['current_exercise'] < workout['total_exercises'] - 1:
             workout['current_exercise'] += 1
+            self.active_workouts.touch(user_id)
             await self._show_exercise(update, context)
 
         elif query.data == "finish_workout":
@@ -550,6 +576,13 @@ class BotHandlers:
             }
 
             self.db.save_workout_progress(user_id, completion_data)
+            try:
+                # Report the workout as finished only once it is on disk
+                await asyncio.wrap_future(self.db.durable())
+            except Exception as e:
+                logger.error(f"Error saving workout of user {user_id}: {e}")
+            year, month = map(int, completion_data['date'].split('-')[:2])
+            self.calendar_keyboards.pop((user_id, year, month), None)
 
             # Ask for feedback
             message = (
@@ -610,18 +643,23 @@ class BotHandlers:
         user_id = update.effective_user.id
         today = datetime.now()
 
-        # Get all workouts for current month
-        first_day = today.replace(day=1)
-        last_day = (first_day.replace(month=first_day.month % 12 + 1, day=1) - timedelta(days=1))
-
-        workouts = self.db.get_workouts_by_date(user_id, first_day.date(), last_day.date())
-        workout_dates = {workout['date'] for workout in workouts}
-
         await update.message.reply_text(
             "Календарь тренировок:",
-            reply_markup=keyboards.get_calendar_keyboard(today.year, today.month, workout_dates)
+            reply_markup=self._calendar_keyboard(user_id, today.year, today.month)
         )
 
+    def _calendar_keyboard(self, user_id, year, month):
+        """Calendar markup of a user's month; dropped from the cache when a workout is saved in it"""
+        key = (user_id, year, month)
+        markup = self.calendar_keyboards.get(key)
+        if markup is None:
+            workout_dates = self.db.get_workout_days(user_id, year, month)
+            markup = self.calendar_keyboards[key] = keyboards.get_calendar_keyboard(year, month, workout_dates)
+            if len(self.calendar_keyboards) > CALENDAR_CACHE_SIZE:
+                self.calendar_keyboards.popitem(last=False)
+        self.calendar_keyboards.move_to_end(key)
+        return markup
+
     async def handle_calendar_navigation(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle calendar navigation"""
         query = update.callback_query
@@ -632,28 +670,13 @@ class BotHandlers:
             year = int(data[1])
             month = int(data[2])
 
-            # Get workouts for selected month
-            first_day = datetime(year, month, 1)
-            last_day = (first_day.replace(month=month % 12 + 1, day=1) - timedelta(days=1))
-
-            workouts = self.db.get_workouts_by_date(
-                update.effective_user.id,
-                first_day.date(),
-                last_day.date()
-            )
-            workout_dates = {workout['date'] for workout in workouts}
-
             await query.edit_message_text(
                 "Календарь тренировок:",
-                reply_markup=keyboards.get_calendar_keyboard(year, month, workout_dates)
+                reply_markup=self._calendar_keyboard(update.effective_user.id, year, month)
             )
         elif data[0] == 'date':
             date = data[1]
-            workouts = self.db.get_workouts_by_date(
-                update.effective_user.id,
-                datetime.strptime(date, '%Y-%m-%d').date(),
-                datetime.strptime(date, '%Y-%m-%d').date()
-            )
+            workouts = self.db.get_workouts_on_date(update.effective_user.id, date)
 
             if workouts:
                 message = f"Тренировки {date}:\n\n"
@@ -667,6 +690,11 @@ class BotHandlers:
 
             await query.answer(message, show_alert=True)
 
+    async def shutdown(self):
+        """Stop background work owned by the handlers"""
+        await self.active_timers.shutdown()
+        await self.active_workouts.close()
+
     def get_handlers(self):
         """Return all handlers"""
         handlers = [
@@ -696,4 +724,42 @@ class BotHandlers:
             CommandHandler('start_workout', self.start_workout),
             CallbackQueryHandler(self.handle_workout_callback, pattern='^(prev_exercise|next_exercise|exercise_done|finish_workout)$')
         ]
-        return handlers
\ No newline at end of file
+        _instrument(handlers)
+        return handlers
+
+
+def _instrument(handlers, label=None):
+    """Time every handler callback, labelled with its command or callback data pattern"""
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            _instrument(handler.entry_points)
+            # Conversation steps are labelled by the command that starts the conversation
+            conversation = _handler_label(handler.entry_points[0])
+            for state, state_handlers in handler.states.items():
+                _instrument(state_handlers, f'{conversation} state {state}')
+            _instrument(handler.fallbacks, f'{conversation} fallback')
+        else:
+            handler.callback = _timed(handler.callback, label or _handler_label(handler))
+
+
+def _handler_label(handler):
+    """'/command' of a CommandHandler, the callback data pattern of a CallbackQueryHandler"""
+    if isinstance(handler, CommandHandler):
+        return ' '.join(f'/{command}' for command in sorted(handler.commands))
+    pattern = getattr(handler, 'pattern', None)
+    if pattern is not None:
+        return getattr(pattern, 'pattern', str(pattern))
+    return type(handler).__name__
+
+
+def _timed(callback, name):
+    async def timed_callback(update, context):
+        with HANDLERS_IN_FLIGHT.track(), HANDLER_SECONDS.time(handler=name):
+            try:
+                return await callback(update, context)
+            except Exception:
+                HANDLER_ERRORS.inc(handler=name)
+                raise
+
+    timed_callback.__name__ = callback.__name__
+    return timed_callback
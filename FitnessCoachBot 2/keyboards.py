@@ -1,6 +1,7 @@
 from telegram import ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton, KeyboardButton
-from config import FITNESS_GOALS, FITNESS_LEVELS, EQUIPMENT_OPTIONS
+from config import FITNESS_GOALS, FITNESS_LEVELS, EQUIPMENT_OPTIONS, CALENDAR_CACHE_SIZE
 from datetime import datetime, timedelta
+from functools import lru_cache
 import calendar
 
 def get_sex_keyboard():
@@ -38,6 +39,11 @@ def get_reminder_keyboard():
     return InlineKeyboardMarkup(keyboard)
 
 def get_calendar_keyboard(year, month, workout_dates):
+    return _build_calendar_keyboard(year, month, frozenset(workout_dates))
+
+# Markups are immutable, so one rendered month is shared by every user with the same workout days
+@lru_cache(maxsize=CALENDAR_CACHE_SIZE)
+def _build_calendar_keyboard(year, month, workout_dates):
     keyboard = []
 
     # Add month and year header
@@ -0,0 +1,155 @@
+"""Maintenance commands for the bot's data.
+
+Usage (--data-dir may also come before the command):
+    python manage.py migrate-sqlite [--data-dir DIR] [--db FILE]
+    python manage.py migrate-shards [--data-dir DIR]
+    python manage.py warm-gifs [--data-dir DIR] --chat-id CHAT_ID [--delay SECONDS]
+    python manage.py rebuild-stats [--data-dir DIR] [--user-id USER_ID]
+    python manage.py precompute-plans [--data-dir DIR] [--date YYYY-MM-DD]
+
+Stop the bot before running a command on its data directory. The bot keeps
+its data in memory and rewrites the files when it compacts, so anything a
+command stores while the bot runs is never seen by the bot and is lost.
+"""
+import argparse
+import asyncio
+import logging
+from datetime import date
+from telegram import Bot
+from config import DATA_DIR, SQLITE_FILENAME, TOKEN, STORAGE_BACKEND
+from database import Database
+from media_cache import MediaCache
+from storage import JournalStorage, create_storage
+from sqlite_storage import SQLiteStorage
+from sharded_storage import ShardedStorage
+from workout_manager import WorkoutManager
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+def migrate_sqlite(args):
+    """Import the JSON files (and any pending journal records) into SQLite"""
+    source = JournalStorage(args.data_dir)
+    target = SQLiteStorage(args.data_dir, args.db)
+    try:
+        imported = target.import_from(source)
+    finally:
+        target.close()
+    logger.info(f"Imported {imported} records into {target.path}")
+
+
+def migrate_shards(args):
+    """Split the per-user JSON collections into one shard file per user"""
+    source = JournalStorage(args.data_dir)
+    target = ShardedStorage(args.data_dir)
+    try:
+        imported = target.import_from(source)
+    finally:
+        target.close()
+    logger.info(f"Wrote {imported} records into shards under {target.shard_dir}")
+
+
+async def _warm_gifs(database, chat_id, delay):
+    cache = MediaCache(database)
+    urls = [url for url in WorkoutManager().get_gif_urls() if cache.get(url) == url]
+    logger.info(f"Uploading {len(urls)} uncached GIFs")
+
+    async with Bot(TOKEN) as bot:
+        for number, url in enumerate(urls, 1):
+            try:
+                message = await bot.send_animation(chat_id, url, disable_notification=True)
+                cache.remember(url, message)
+                await message.delete()
+            except Exception as e:
+                logger.warning(f"Could not upload {url}: {e}")
+            logger.info(f"{number}/{len(urls)} done")
+            # Stay under the per-chat flood limit
+            await asyncio.sleep(delay)
+
+
+def warm_gifs(args):
+    """Pre-upload every catalog GIF to a chat and cache the file_ids (with the bot stopped)"""
+    if not TOKEN:
+        raise SystemExit("TELEGRAM_BOT_TOKEN is not set")
+    database = Database(create_storage(STORAGE_BACKEND, args.data_dir))
+    try:
+        asyncio.run(_warm_gifs(database, args.chat_id, args.delay))
+    finally:
+        database.close()
+
+
+def rebuild_stats(args):
+    """Recompute the /progress aggregates from the workout history"""
+    database = Database(create_storage(STORAGE_BACKEND, args.data_dir))
+    try:
+        if args.user_id is not None:
+            database.rebuild_stats(args.user_id)
+            count = 1
+        else:
+            count = database.rebuild_all_stats()
+    finally:
+        database.close()
+    logger.info(f"Rebuilt stats for {count} users")
+
+
+def precompute_plans(args):
+    """Build today's workout for every user with a profile, one plan per distinct parameter set"""
+    database = Database(create_storage(STORAGE_BACKEND, args.data_dir))
+    try:
+        workout_manager = WorkoutManager()
+        groups = workout_manager.group_profiles(database.get_all_profiles(), database.get_all_feedback())
+        plans = {}
+        assignments = {}
+        for params, user_ids in groups.items():
+            plan_id = '-'.join(map(str, params))
+            plans[plan_id] = workout_manager.build_workout(*params)
+            assignments.update(dict.fromkeys(user_ids, plan_id))
+        database.save_daily_plans(args.date, plans, assignments)
+    finally:
+        database.close()
+    logger.info(f"Stored {len(plans)} plans for {len(assignments)} users on {args.date}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fitness bot maintenance commands")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="directory holding the data files")
+    # Also accepted after the command; SUPPRESS keeps it from resetting a value given before it
+    data_dir = argparse.ArgumentParser(add_help=False)
+    data_dir.add_argument('--data-dir', default=argparse.SUPPRESS, help="directory holding the data files")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    migrate = commands.add_parser('migrate-sqlite', parents=[data_dir],
+                                  help="import users/progress/feedback/reminders JSON into SQLite")
+    migrate.add_argument('--db', default=SQLITE_FILENAME, help="SQLite file name inside the data directory")
+    migrate.set_defaults(func=migrate_sqlite)
+
+    shards = commands.add_parser('migrate-shards', parents=[data_dir],
+                                 help="split per-user JSON collections into per-user shard files")
+    shards.set_defaults(func=migrate_shards)
+
+    warm = commands.add_parser('warm-gifs', parents=[data_dir],
+                               help="upload all exercise GIFs once and cache their file_ids (stop the bot first)")
+    warm.add_argument('--chat-id', type=int, required=True, help="chat to upload into, e.g. an admin's private chat")
+    warm.add_argument('--delay', type=float, default=1.0, help="seconds between uploads")
+    warm.set_defaults(func=warm_gifs)
+
+    rebuild = commands.add_parser('rebuild-stats', parents=[data_dir],
+                                  help="recompute streak and progress aggregates from history")
+    rebuild.add_argument('--user-id', type=int, help="rebuild a single user (default: everyone)")
+    rebuild.set_defaults(func=rebuild_stats)
+
+    precompute = commands.add_parser('precompute-plans', parents=[data_dir],
+                                     help="generate and store every user's workout for a day")
+    precompute.add_argument('--date', default=date.today().isoformat(), help="day the plans are for")
+    precompute.set_defaults(func=precompute_plans)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MediaCache:
+    """Telegram file_ids of exercise GIFs, keyed by their source URL.
+
+    The first successful send of a URL stores the file_id Telegram returns;
+    later sends pass that file_id so Telegram does not download the GIF
+    again. Mappings are persisted through the Database and loaded once.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.file_ids = database.get_media_file_ids()
+
+    def get(self, url):
+        """Return what to send for url: its cached file_id, or the URL itself"""
+        return self.file_ids.get(url, url)
+
+    def remember(self, url, message):
+        """Store the file_id of the animation in a message sent for url"""
+        animation = getattr(message, 'animation', None)
+        if animation is None or self.file_ids.get(url) == animation.file_id:
+            return
+        self.file_ids[url] = animation.file_id
+        self.database.save_media_file_id(url, animation.file_id)
+
+    def forget(self, url):
+        """Drop a file_id Telegram rejected, so the URL is sent next time"""
+        if self.file_ids.pop(url, None) is not None:
+            logger.warning(f"Dropping cached file_id for {url}")
+            self.database.save_media_file_id(url, None)
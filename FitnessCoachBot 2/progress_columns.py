@@ -0,0 +1,184 @@
+"""Compact columnar form of one user's progress history.
+
+A progress entry is ``{'date', 'exercises_completed', 'total_exercises',
+'workout_completed', 'workout_id'}``. ProgressColumns keeps each field in a
+typed array instead: the date as a day ordinal, the counts as 16-bit ints,
+the completion flag as a byte and ``workout_YYYYMMDD_HHMMSS`` ids as one
+64-bit int. Entries that do not fit this shape (other keys, unusual ids)
+keep their dict in ``extra``, so the conversion is lossless.
+
+On disk the columns follow a 16-byte header back to back, in native byte
+order, with ``extra`` as a JSON trailer. ``load()`` reads the file in one
+call and views the columns in its bytes; they are copied into arrays on the
+first append.
+"""
+import json
+import re
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+MAGIC = b'PGC1'
+HEADER = struct.Struct('<4sIII')  # magic, rows, length of the extra JSON, is_sorted
+
+# (attribute, array typecode) in file order; the widest type first keeps every column aligned
+COLUMNS = (('workout_ids', 'q'), ('days', 'i'), ('completed', 'H'), ('totals', 'H'), ('flags', 'B'))
+
+WORKOUT_ID = re.compile(r'workout_(\d{8})_(\d{6})\Z')
+MAX_COUNT = 0xFFFF
+
+
+class ProgressColumns:
+    """One user's progress entries as parallel typed arrays"""
+
+    def __init__(self):
+        for name, typecode in COLUMNS:
+            setattr(self, name, array(typecode))
+        self.extra = {}  # row -> original entry that the columns cannot hold
+        self.is_sorted = True  # days never decrease, so date ranges can bisect
+        self._buffer = None  # bytes backing read-only columns
+
+    @classmethod
+    def from_entries(cls, entries):
+        columns = cls()
+        for entry in entries:
+            columns.append(entry)
+        return columns
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Columns of (day ordinal, completed, total, flag) rows, for aggregates: workout ids are left 0"""
+        columns = cls()
+        for name, values in zip(('days', 'completed', 'totals', 'flags'), zip(*rows)):
+            getattr(columns, name).extend(values)
+        columns.workout_ids.frombytes(bytes(columns.workout_ids.itemsize * len(columns.days)))
+        columns.is_sorted = columns.days.tolist() == sorted(columns.days)
+        return columns
+
+    def __len__(self):
+        return len(self.days)
+
+    def append(self, entry):
+        self._materialize()
+        row = len(self.days)
+        day, completed, total, flag, workout_id = _encode(entry)
+        if day is None or _decode(day, completed, total, flag, workout_id) != entry:
+            self.extra[row] = dict(entry)
+            day = day or 0
+        if row and day < self.days[-1]:
+            self.is_sorted = False
+        self.workout_ids.append(workout_id)
+        self.days.append(day)
+        self.completed.append(completed)
+        self.totals.append(total)
+        self.flags.append(flag)
+
+    def entry(self, row):
+        extra = self.extra.get(row)
+        if extra is not None:
+            return dict(extra)
+        return _decode(self.days[row], self.completed[row], self.totals[row], self.flags[row],
+                       self.workout_ids[row])
+
+    def to_entries(self):
+        return [self.entry(row) for row in range(len(self.days))]
+
+    def rows_between(self, start_date, end_date):
+        """Row numbers of the entries dated within [start_date, end_date]"""
+        start, end = start_date.toordinal(), end_date.toordinal()
+        if self.is_sorted:
+            return range(bisect_left(self.days, start), bisect_right(self.days, end))
+        return [row for row, day in enumerate(self.days) if start <= day <= end]
+
+    def between(self, start_date, end_date):
+        return [self.entry(row) for row in self.rows_between(start_date, end_date)]
+
+    def daily_totals(self, start_date, end_date):
+        """Sorted (date, total_exercises, exercises_completed) sums per day"""
+        totals = {}
+        for row in self.rows_between(start_date, end_date):
+            day = totals.setdefault(self.days[row], [0, 0])
+            day[0] += self.totals[row]
+            day[1] += self.completed[row]
+        return [(date.fromordinal(day).isoformat(), total, completed)
+                for day, (total, completed) in sorted(totals.items())]
+
+    def to_bytes(self):
+        extra = b''
+        if self.extra:
+            extra = json.dumps(self.extra, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        parts = [HEADER.pack(MAGIC, len(self.days), len(extra), self.is_sorted)]
+        parts.extend(bytes(getattr(self, name)) for name, _ in COLUMNS)
+        parts.append(extra)
+        return b''.join(parts)
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """Columns viewing ``buffer`` (bytes) without copying it"""
+        magic, rows, extra_size, is_sorted = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError("not a progress columns file")
+        columns = cls()
+        view = memoryview(buffer)
+        offset = HEADER.size
+        for name, typecode in COLUMNS:
+            size = rows * array(typecode).itemsize
+            setattr(columns, name, view[offset:offset + size].cast(typecode))
+            offset += size
+        if extra_size:
+            extra = json.loads(bytes(view[offset:offset + extra_size]))
+            columns.extra = {int(row): entry for row, entry in extra.items()}
+        columns.is_sorted = bool(is_sorted)
+        columns._buffer = buffer
+        return columns
+
+    @classmethod
+    def load(cls, path):
+        """Read a file holding ``to_bytes()`` output"""
+        # Read rather than mapped: a map per cached user would hold a file descriptor each
+        with open(path, 'rb') as f:
+            return cls.from_buffer(f.read())
+
+    def _materialize(self):
+        """Copy read-only columns into arrays before changing them"""
+        if self._buffer is None:
+            return
+        for name, typecode in COLUMNS:
+            column = array(typecode)
+            column.frombytes(getattr(self, name).cast('B'))
+            setattr(self, name, column)
+        self._buffer = None
+
+
+def _encode(entry):
+    """Column values of an entry; day is None when its date cannot be parsed"""
+    try:
+        day = date.fromisoformat(entry['date']).toordinal()
+    except (KeyError, TypeError, ValueError):
+        day = None
+    completed = entry.get('exercises_completed')
+    total = entry.get('total_exercises')
+    completed = completed if _is_count(completed) else 0
+    total = total if _is_count(total) else 0
+    flag = 1 if entry.get('workout_completed') is True else 0
+    workout_id = entry.get('workout_id')
+    match = WORKOUT_ID.match(workout_id) if isinstance(workout_id, str) else None
+    workout_id = int(match.group(1) + match.group(2)) if match else 0
+    return day, completed, total, flag, workout_id
+
+
+def _decode(day, completed, total, flag, workout_id):
+    entry = {
+        'date': date.fromordinal(day).isoformat(),
+        'exercises_completed': completed,
+        'total_exercises': total,
+        'workout_completed': bool(flag),
+    }
+    if workout_id:
+        entry['workout_id'] = f'workout_{workout_id // 1000000:08d}_{workout_id % 1000000:06d}'
+    return entry
+
+
+def _is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= MAX_COUNT
@@ -0,0 +1,183 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from config import RATE_LIMIT_CHAT_CACHE_SIZE
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Priority classes for outgoing requests, lower is sent first.
+# Pass them as rate_limit_args={'priority': ...}; the default is interactive.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_TIMER = 1
+PRIORITY_BROADCAST = 2
+
+TELEGRAM_REQUEST_SECONDS = metrics.histogram(
+    'telegram_request_seconds', "Bot API request round trip", ['endpoint']
+)
+TELEGRAM_REQUESTS_IN_FLIGHT = metrics.gauge('telegram_requests_in_flight', "Bot API requests awaiting a response")
+TELEGRAM_RETRY_AFTER = metrics.counter('telegram_retry_after_total', "Flood limit (RetryAfter) responses", ['endpoint'])
+RATE_LIMIT_WAIT_SECONDS = metrics.histogram(
+    'rate_limit_wait_seconds', "Time a request waited for the rate limiter", ['priority']
+)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate`` tokens per second"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        """Take a whole token; check delay() first"""
+        self._refill(now)
+        self.tokens -= 1
+
+    def delay(self, now):
+        """Seconds until a whole token is available"""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def pause(self, now, seconds):
+        """Make the next reservation wait at least ``seconds``"""
+        self._refill(now)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class PriorityGate:
+    """Token bucket whose waiting requests are let through highest priority first"""
+    __slots__ = ('bucket', '_waiters', '_seq', '_dispatcher')
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self._waiters = []  # (priority, seq, future)
+        self._seq = itertools.count()
+        self._dispatcher = None
+
+    async def acquire(self, priority):
+        now = asyncio.get_running_loop().time()
+        if not self._waiters and self.bucket.delay(now) == 0:
+            self.bucket.take(now)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    def idle(self, now):
+        return not self._waiters and self.bucket.idle(now)
+
+    def cancel(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for _, _, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+
+    async def _dispatch(self):
+        """Hand out tokens to waiting requests, highest priority first"""
+        loop = asyncio.get_running_loop()
+        while self._waiters:
+            wait = self.bucket.delay(loop.time())
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.bucket.take(loop.time())
+                future.set_result(None)
+
+
+class PriorityRateLimiter(BaseRateLimiter):
+    """Throttle every Bot API request that targets a chat.
+
+    A request first waits for a token from its chat's bucket (``per_chat_rate``
+    per second with bursts of ``per_chat_burst``), then for one from the
+    global bucket (``overall_rate`` per second). Both waits are priority
+    queues (PriorityGate), so interactive replies overtake timer updates,
+    which overtake reminder broadcasts, within a chat as well as globally. Requests without a ``chat_id`` (answerCallbackQuery,
+    getMe, ...) are not throttled. A RetryAfter from Telegram pauses the chat
+    and the global bucket for the requested time and the request is retried
+    up to ``max_retries`` times. Idle chat buckets are dropped once more than
+    ``chat_cache_size`` chats are tracked.
+    """
+
+    def __init__(self, overall_rate=30, per_chat_rate=1, per_chat_burst=3, max_retries=3,
+                 chat_cache_size=RATE_LIMIT_CHAT_CACHE_SIZE):
+        self.overall_rate = overall_rate
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self.chat_cache_size = chat_cache_size
+        self._overall = None
+        self._chats = {}  # chat_id -> PriorityGate
+
+    async def initialize(self):
+        self._overall = PriorityGate(TokenBucket(self.overall_rate, self.overall_rate, self._now()))
+
+    async def shutdown(self):
+        self._overall.cancel()
+        for gate in self._chats.values():
+            gate.cancel()
+        self._chats.clear()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            return await self._send(callback, args, kwargs, endpoint)
+
+        priority = (rate_limit_args or {}).get('priority', PRIORITY_INTERACTIVE)
+        for attempt in range(self.max_retries + 1):
+            with RATE_LIMIT_WAIT_SECONDS.time(priority=priority):
+                await self._acquire(chat_id, priority)
+            try:
+                return await self._send(callback, args, kwargs, endpoint)
+            except RetryAfter as e:
+                TELEGRAM_RETRY_AFTER.inc(endpoint=endpoint)
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"Flood limit hit on {endpoint} for chat {chat_id}, retrying in {e.retry_after}s")
+                # The flood limit may be the bot's, not just this chat's: hold every chat back
+                now = self._now()
+                self._chat_gate(chat_id).bucket.pause(now, e.retry_after)
+                self._overall.bucket.pause(now, e.retry_after)
+
+    @staticmethod
+    async def _send(callback, args, kwargs, endpoint):
+        with TELEGRAM_REQUESTS_IN_FLIGHT.track(), TELEGRAM_REQUEST_SECONDS.time(endpoint=endpoint):
+            return await callback(*args, **kwargs)
+
+    def _now(self):
+        return asyncio.get_running_loop().time()
+
+    def _chat_gate(self, chat_id):
+        gate = self._chats.get(chat_id)
+        if gate is None:
+            now = self._now()
+            if len(self._chats) >= self.chat_cache_size:
+                # Full buckets without waiters carry no state; forget them
+                self._chats = {key: g for key, g in self._chats.items() if not g.idle(now)}
+            gate = self._chats[chat_id] = PriorityGate(TokenBucket(self.per_chat_rate, self.per_chat_burst, now))
+        return gate
+
+    async def _acquire(self, chat_id, priority):
+        await self._chat_gate(chat_id).acquire(priority)
+        await self._overall.acquire(priority)
@@ -1,40 +1,138 @@
-import schedule
-import time
-from threading import Thread
-from telegram import Bot
+import asyncio
+import logging
+from datetime import time
+from time import monotonic
 from telegram.error import TelegramError
-from datetime import datetime
+from tzlocal import get_localzone
+from rate_limiter import PRIORITY_BROADCAST
+from config import REMINDER_CONCURRENCY, RATE_LIMIT_OVERALL
+import metrics
+
+logger = logging.getLogger(__name__)
+
+REMINDERS_SENT = metrics.counter('reminders_sent_total', "Reminder messages by delivery result", ['result'])
+REMINDER_SLOT_SECONDS = metrics.histogram(
+    'reminder_slot_seconds', "Time to deliver every reminder of a time slot",
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800)
+)
+REMINDERS_IN_FLIGHT = metrics.gauge('reminders_in_flight', "Reminder sends awaiting the Bot API")
+
+REMINDER_TEXT = "🏋️‍♂️ Время тренировки! Готовы начать? Используйте /workout для получения программы."
+
 
 class ReminderManager:
-    def __init__(self, bot, database):
-        self.bot = bot
+    """Daily workout reminders on the application's JobQueue.
+
+    Users are grouped by their HH:MM reminder time and every minute slot has
+    a single daily job. When a slot fires, its users are sent the reminder by
+    ``concurrency`` workers through the bot's rate limiter at broadcast
+    priority, so a slot of N users is delivered in roughly N / ``rate``
+    seconds, ``rate`` being this process's share of the message limit.
+
+    With several bot processes each one schedules the reminders of its own
+    users, those with ``user_id % shards == shard``: the same users whose
+    updates (and so their /reminder choices) it receives.
+    """
+
+    def __init__(self, job_queue, database, concurrency=REMINDER_CONCURRENCY, shard=0, shards=1,
+                 rate=RATE_LIMIT_OVERALL):
+        self.job_queue = job_queue
         self.database = database
-        self.thread = Thread(target=self._run_schedule, daemon=True)
-        self.thread.start()
+        self.concurrency = concurrency
+        self.shard = shard
+        self.shards = shards
+        self.rate = rate
+        self.slots = {}       # "HH:MM" -> set of user ids
+        self.user_slots = {}  # user id -> "HH:MM"
+        self.jobs = {}        # "HH:MM" -> Job
+        # Reminder times are wall-clock times of the machine running the bot; the
+        # zone itself (not today's UTC offset) keeps them right across DST changes
+        self.tzinfo = get_localzone()
+
+    def load_reminders(self):
+        """Schedule every stored reminder of this process's users"""
+        reminders = {
+            user_id: time_str for user_id, time_str in self.database.get_reminders().items()
+            if int(user_id) % self.shards == self.shard
+        }
+        for user_id, time_str in reminders.items():
+            self._schedule_reminder(user_id, time_str)
+        logger.info(f"Scheduled {len(reminders)} reminders in {len(self.slots)} time slots")
 
     def set_reminder(self, user_id, time_str):
         """Set a new reminder for a user"""
         self.database.set_reminder(user_id, time_str)
-        self._schedule_reminder(user_id, time_str)
+        self._schedule_reminder(str(user_id), time_str)
 
     def _schedule_reminder(self, user_id, time_str):
-        """Schedule a reminder for specific time"""
-        schedule.every().day.at(time_str).do(
-            self._send_reminder, user_id=user_id
+        """Move the user into the slot for time_str, creating its job if needed"""
+        old_slot = self.user_slots.get(user_id)
+        if old_slot is not None and old_slot != time_str:
+            users = self.slots[old_slot]
+            users.discard(user_id)
+            if not users:
+                self._remove_slot(old_slot)
+
+        self.user_slots[user_id] = time_str
+        users = self.slots.setdefault(time_str, set())
+        users.add(user_id)
+        if time_str not in self.jobs:
+            hour, minute = map(int, time_str.split(':'))
+            self.jobs[time_str] = self.job_queue.run_daily(
+                self._send_slot,
+                time=time(hour, minute, tzinfo=self.tzinfo),
+                data=time_str,
+                name=f"reminder_{time_str}"
+            )
+
+    def _remove_slot(self, slot):
+        del self.slots[slot]
+        job = self.jobs.pop(slot, None)
+        if job is not None:
+            job.schedule_removal()
+
+    async def _send_slot(self, context):
+        """Send the reminder to every user of the slot that fired"""
+        slot = context.job.data
+        user_ids = list(self.slots.get(slot, ()))
+        logger.info(
+            f"Sending {len(user_ids)} reminders for {slot}, "
+            f"expected to take ~{len(user_ids) / self.rate:.0f}s"
+        )
+
+        started = monotonic()
+        pending = iter(user_ids)
+        failed = []
+
+        async def worker():
+            for user_id in pending:
+                if not await self._send_reminder(context.bot, user_id):
+                    failed.append(user_id)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(user_ids)))))
+        REMINDER_SLOT_SECONDS.observe(monotonic() - started)
+        logger.info(
+            f"Reminders for {slot}: {len(user_ids) - len(failed)} sent, {len(failed)} failed "
+            f"in {monotonic() - started:.1f}s"
         )
 
-    def _send_reminder(self, user_id):
+    async def _send_reminder(self, bot, user_id):
         """Send reminder message to user"""
         try:
-            self.bot.send_message(
-                chat_id=user_id,
-                text="🏋️‍♂️ Время тренировки! Готовы начать? Используйте /workout для получения программы."
-            )
-        except Exception as e:
-            print(f"Error sending reminder to {user_id}: {e}")
-
-    def _run_schedule(self):
-        """Run the schedule loop in background"""
-        while True:
-            schedule.run_pending()
-            time.sleep(60)
\ No newline at end of file
+            with REMINDERS_IN_FLIGHT.track():
+                await bot.send_message(
+                    chat_id=int(user_id),
+                    text=REMINDER_TEXT,
+                    rate_limit_args={'priority': PRIORITY_BROADCAST}
+                )
+            REMINDERS_SENT.inc(result='sent')
+            return True
+        except TelegramError as e:
+            logger.warning(f"Error sending reminder to {user_id}: {e}")
+            REMINDERS_SENT.inc(result='failed')
+            return False
+        except Exception:
+            # Anything else would end this worker and fail the whole slot's gather
+            logger.exception(f"Unexpected error sending reminder to {user_id}")
+            REMINDERS_SENT.inc(result='failed')
+            return False
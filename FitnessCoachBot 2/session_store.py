@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """Active workout sessions: an in-memory LRU with a write-behind SQLite back.
+
+    Reads and writes only touch the in-memory LRU. Changed sessions are
+    marked dirty and a background task writes them in batches every
+    ``flush_interval`` seconds, serializing in the event loop and writing in
+    a worker thread. Callers that mutate a session in place must call
+    ``touch``. Reads only queue a refresh of the stored access time, so a
+    session in use does not expire after a restart. Sessions idle for
+    ``ttl`` seconds are dropped from memory and disk; sessions pushed out of
+    the LRU are written by the same background task and reloaded on their
+    next access, as are sessions left by a previous process.
+    """
+
+    def __init__(self, path, max_size=10000, ttl=6 * 3600, flush_interval=1.0):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.sessions = OrderedDict()  # user_id -> [session, last access]
+        self._dirty = set()
+        self._accessed = set()  # read since the last flush; only their access time is written
+        self._evicted = {}      # user_id -> entry pushed out of the LRU before it was written
+        self._deleted = set()
+        self._db_lock = threading.Lock()
+        self._flusher = None
+
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS sessions (user_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)'
+        )
+        self._load_recent()
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, user_id, default=None):
+        """Get a session, refreshing its LRU position and TTL"""
+        user_id = str(user_id)
+        entry = self.sessions.get(user_id)
+        now = time.time()
+        if entry is None:
+            entry = self._load(user_id, now)
+            if entry is None:
+                return default
+        elif now - entry[1] > self.ttl:
+            self._expire(user_id)
+            return default
+        entry[1] = now
+        self.sessions.move_to_end(user_id)
+        self._accessed.add(user_id)
+        self._start_flusher()
+        return entry[0]
+
+    def __setitem__(self, user_id, session):
+        user_id = str(user_id)
+        self.sessions[user_id] = [session, time.time()]
+        self.sessions.move_to_end(user_id)
+        self._evicted.pop(user_id, None)
+        self._deleted.discard(user_id)
+        self._mark_dirty(user_id)
+        self._evict()
+
+    def touch(self, user_id):
+        """Schedule a write of a session that was changed in place"""
+        user_id = str(user_id)
+        entry = self.sessions.get(user_id)
+        if entry is not None:
+            entry[1] = time.time()
+            self.sessions.move_to_end(user_id)
+            self._mark_dirty(user_id)
+
+    def pop(self, user_id, default=None):
+        """Remove a session and return it"""
+        session = self.get(user_id)
+        user_id = str(user_id)
+        if session is None:
+            return default
+        del self.sessions[user_id]
+        self._dirty.discard(user_id)
+        self._accessed.discard(user_id)
+        self._deleted.add(user_id)
+        self._start_flusher()
+        return session
+
+    async def flush(self):
+        """Write every pending change now"""
+        rows = self._collect()
+        if any(rows):
+            await asyncio.to_thread(self._write, *rows)
+
+    async def close(self):
+        """Stop the background writer after a final flush"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+        with self._db_lock:
+            self.conn.close()
+
+    def _mark_dirty(self, user_id):
+        self._dirty.add(user_id)
+        self._start_flusher()
+
+    def _start_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            try:
+                self._flusher = asyncio.get_running_loop().create_task(self._run())
+            except RuntimeError:
+                # No event loop (scripts, tests): write synchronously
+                self._write(*self._collect())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self._expire_idle()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error writing sessions: {e}")
+
+    def _collect(self):
+        """Serialize dirty sessions (in the event loop, so no one mutates them meanwhile)"""
+        entries = list(self._evicted.items())
+        entries += [(user_id, self.sessions[user_id]) for user_id in self._dirty if user_id in self.sessions]
+        updates = [
+            (user_id, json.dumps(session, ensure_ascii=False), last_access)
+            for user_id, (session, last_access) in entries
+        ]
+        accessed = [
+            (self.sessions[user_id][1], user_id)
+            for user_id in self._accessed if user_id in self.sessions and user_id not in self._dirty
+        ]
+        deletes = [(user_id,) for user_id in self._deleted]
+        self._dirty.clear()
+        self._accessed.clear()
+        self._evicted.clear()
+        self._deleted.clear()
+        return updates, accessed, deletes
+
+    def _write(self, updates, accessed, deletes):
+        with self._db_lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)', updates)
+            self.conn.executemany('UPDATE sessions SET updated = ? WHERE user_id = ?', accessed)
+            self.conn.executemany('DELETE FROM sessions WHERE user_id = ?', deletes)
+            self.conn.execute('DELETE FROM sessions WHERE updated < ?', (time.time() - self.ttl,))
+
+    def _load(self, user_id, now):
+        """Reload a session evicted from memory or left by a previous process"""
+        if user_id in self._deleted:
+            return None
+        entry = self._evicted.pop(user_id, None)
+        if entry is not None:
+            # Evicted before the flusher wrote it: take it back, still dirty
+            entry[1] = now
+            self.sessions[user_id] = entry
+            self._mark_dirty(user_id)
+            self._evict()
+            return entry
+        with self._db_lock:
+            row = self.conn.execute(
+                'SELECT data FROM sessions WHERE user_id = ? AND updated >= ?', (user_id, now - self.ttl)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = self.sessions[user_id] = [json.loads(row[0]), now]
+        self._evict()
+        return entry
+
+    def _load_recent(self):
+        with self._db_lock:
+            rows = self.conn.execute(
+                'SELECT user_id, data, updated FROM sessions WHERE updated >= ? ORDER BY updated DESC LIMIT ?',
+                (time.time() - self.ttl, self.max_size)
+            ).fetchall()
+        for user_id, data, updated in reversed(rows):
+            self.sessions[user_id] = [json.loads(data), updated]
+        if rows:
+            logger.info(f"Restored {len(rows)} active workout sessions")
+
+    def _evict(self):
+        """Drop least recently used sessions from memory; they stay on disk"""
+        while len(self.sessions) > self.max_size:
+            user_id, entry = self.sessions.popitem(last=False)
+            self._accessed.discard(user_id)
+            if user_id in self._dirty:
+                # Not written yet; the flusher writes it with the other changes
+                self._dirty.discard(user_id)
+                self._evicted[user_id] = entry
+                self._start_flusher()
+
+    def _expire(self, user_id):
+        del self.sessions[user_id]
+        self._dirty.discard(user_id)
+        self._accessed.discard(user_id)
+        self._deleted.add(user_id)
+
+    def _expire_idle(self):
+        cutoff = time.time() - self.ttl
+        # The LRU is ordered by last access, so idle sessions are at the front
+        while self.sessions:
+            user_id, (_, last_access) = next(iter(self.sessions.items()))
+            if last_access >= cutoff:
+                break
+            self._expire(user_id)
+
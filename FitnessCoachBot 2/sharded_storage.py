@@ -0,0 +1,338 @@
+import json
+import logging
+import os
+import zlib
+from collections import OrderedDict, defaultdict
+from config import (
+    JOURNAL_COMPACT_MIN_BYTES, JOURNAL_COMPACT_RATIO, JOURNAL_FSYNC, SHARD_CACHE_SIZE, STORAGE_WRITE_BATCH
+)
+from storage import JournalStorage, COLLECTIONS, _fsync_dir, _write_file
+from progress_columns import ProgressColumns
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SHARD_LOADS = metrics.counter('storage_shard_loads_total', "User shard files read into the cache")
+SHARDS_CACHED = metrics.gauge('storage_shards_cached', "User shards held in memory")
+
+# Collections read as a whole at startup or shared by all users; they stay
+# in journal files in the data directory
+SHARED_COLLECTIONS = ('reminders', 'media', 'plans')
+
+# Pseudo-collection of shard writes queued on the writer thread
+SHARDS = 'shards'
+
+
+class ShardedStorage(JournalStorage):
+    """Storage keeping each user's records in a file of their own.
+
+    Per-user collections (profile, workouts, progress, feedback and stats),
+    all keyed by user id, live in ``shards/<xx>/<user_id>.<collection>.json``,
+    loaded on first access into an LRU of ``cache_size`` users. A group
+    commit rewrites only the files of the collections that changed. The
+    progress history is kept as ProgressColumns in ``<user_id>.progress``;
+    new entries are appended to ``<user_id>.progress.journal`` and folded
+    into the columns file once the journal outgrows ``compact_ratio`` times
+    its size, so saving a workout does not rewrite the whole history. Users
+    with unwritten changes are never evicted. Startup reads only the shared
+    collections, so its time and memory no longer grow with the number of
+    users. ``items()`` over a per-user collection reads every shard and is
+    meant for batch jobs.
+    """
+
+    def __init__(self, data_dir='.', cache_size=SHARD_CACHE_SIZE, compact_ratio=JOURNAL_COMPACT_RATIO,
+                 compact_min_bytes=JOURNAL_COMPACT_MIN_BYTES, fsync=JOURNAL_FSYNC, write_delay=None,
+                 write_batch=STORAGE_WRITE_BATCH):
+        self.shard_dir = os.path.join(data_dir, 'shards')
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # user_id -> {collection: {key: value}}
+        self._dirty = {}  # user_id -> {collection: changes not written yet}
+        self._progress_files = {}  # user_id -> ProgressFiles of a cached user
+        super().__init__(data_dir, compact_ratio, compact_min_bytes, fsync, write_delay, write_batch,
+                         SHARED_COLLECTIONS)
+
+    def get(self, collection, key, default=None):
+        if collection in self.collections:
+            return super().get(collection, key, default)
+        with self._lock:
+            value = self._shard(key).get(collection, {}).get(key)
+            if value is None:
+                return default
+            return value.to_entries() if collection == 'progress' else value
+
+    def items(self, collection):
+        if collection in self.collections:
+            return super().items(collection)
+        with self._lock:
+            cached = {user_id: shard.get(collection, {}) for user_id, shard in self._cache.items()}
+        records = [item for records in cached.values() for item in records.items()]
+        for user_id in self._stored_user_ids():
+            if user_id not in cached:
+                # Read past the cache so a full scan does not evict active users
+                records.extend(self._load_shard(user_id)[0].get(collection, {}).items())
+        if collection == 'progress':
+            return [(key, columns.to_entries()) for key, columns in records]
+        return records
+
+    def set(self, collection, key, value):
+        if collection in self.collections:
+            return super().set(collection, key, value)
+        if collection == 'progress':
+            value = ProgressColumns.from_entries(value)
+        self._update(collection, key, lambda records: records.__setitem__(key, value))
+        if collection == 'progress':
+            with self._lock:
+                # Replaced, not appended to: the next write rewrites the columns file
+                self._progress_files[key].rows = None
+
+    def append(self, collection, key, value):
+        if collection in self.collections:
+            return super().append(collection, key, value)
+        empty = ProgressColumns if collection == 'progress' else list
+        self._update(collection, key, lambda records: _get_or_add(records, key, empty).append(value))
+
+    def set_item(self, collection, key, field, value):
+        if collection in self.collections:
+            return super().set_item(collection, key, field, value)
+        self._update(collection, key, lambda records: records.setdefault(key, {}).__setitem__(field, value))
+
+    def import_from(self, source):
+        """Write the per-user collections of another backend into shard files.
+
+        Shared collections are not copied: run it on the source's data directory.
+        """
+        shards = defaultdict(dict)
+        imported = 0
+        for collection in COLLECTIONS:
+            if collection in self.collections:
+                continue
+            for key, value in source.items(collection):
+                shards[key].setdefault(collection, {})[key] = value
+                imported += 1
+        with self._lock:
+            self._cache.clear()
+        for user_id, shard in shards.items():
+            files = {}
+            for collection, records in shard.items():
+                if collection == 'progress':
+                    files['.progress'] = ProgressColumns.from_entries(records[user_id]).to_bytes()
+                else:
+                    files[f'.{collection}.json'] = _dumps(records[user_id])
+            self._write_files(user_id, files)
+        return imported
+
+    def progress_between(self, user_id, start_date, end_date):
+        columns = self._progress(user_id)
+        return columns.between(start_date, end_date) if columns else []
+
+    def daily_totals(self, user_id, start_date, end_date):
+        columns = self._progress(user_id)
+        return columns.daily_totals(start_date, end_date) if columns else []
+
+    def progress_columns(self, user_id):
+        return self._progress(user_id) or ProgressColumns()
+
+    def _progress(self, user_id):
+        with self._lock:
+            return self._shard(user_id).get('progress', {}).get(user_id)
+
+    def _update(self, collection, user_id, change):
+        with self._lock:
+            change(self._shard(user_id).setdefault(collection, {}))
+            dirty = self._dirty.setdefault(user_id, {})
+            dirty[collection] = dirty.get(collection, 0) + 1
+        self._enqueue(SHARDS, user_id)
+
+    def _shard(self, user_id):
+        """A user's cached records, loaded on first access; call with the lock held"""
+        shard = self._cache.get(user_id)
+        if shard is not None:
+            self._cache.move_to_end(user_id)
+            return shard
+        shard, self._progress_files[user_id] = self._load_shard(user_id)
+        self._cache[user_id] = shard
+        SHARD_LOADS.inc()
+        while len(self._cache) > self.cache_size:
+            # Never the user being returned: the caller is about to read or change it
+            evicted = next((cached for cached in self._cache if cached not in self._dirty and cached != user_id), None)
+            if evicted is None:
+                break  # every cached user still has writes queued
+            del self._cache[evicted]
+            del self._progress_files[evicted]
+        SHARDS_CACHED.set(len(self._cache))
+        return shard
+
+    def _shard_path(self, user_id, suffix='.json'):
+        bucket = f'{zlib.crc32(user_id.encode()) & 0xff:02x}'
+        return os.path.join(self.shard_dir, bucket, f'{user_id}{suffix}')
+
+    def _load_shard(self, user_id):
+        """(records, ProgressFiles) of a user read from their shard files"""
+        shard = {}
+        try:
+            # Written before each collection got a file of its own
+            with open(self._shard_path(user_id), 'r', encoding='utf-8') as f:
+                shard = json.load(f)
+        except FileNotFoundError:
+            pass
+        if 'progress' in shard:
+            # Written before progress moved to its own columnar file
+            shard['progress'] = {key: ProgressColumns.from_entries(entries)
+                                 for key, entries in shard['progress'].items()}
+        for collection in COLLECTIONS:
+            if collection in self.collections or collection == 'progress':
+                continue
+            try:
+                with open(self._shard_path(user_id, f'.{collection}.json'), 'r', encoding='utf-8') as f:
+                    shard[collection] = {user_id: json.load(f)}
+            except FileNotFoundError:
+                pass
+
+        files = ProgressFiles()
+        path = self._shard_path(user_id, '.progress')
+        try:
+            columns = ProgressColumns.load(path)
+            files.size = os.path.getsize(path)
+        except FileNotFoundError:
+            columns = shard.get('progress', {}).get(user_id) or ProgressColumns()
+            files.rows = None  # Nothing in columnar form yet
+        files.journal_size = self._replay_progress(user_id, columns)
+        if files.rows is not None:
+            files.rows = len(columns)
+        if len(columns):
+            shard['progress'] = {user_id: columns}
+        return shard, files
+
+    def _replay_progress(self, user_id, columns):
+        """Append the journaled entries the columns file lacks; return the journal's valid size"""
+        path = self._shard_path(user_id, '.progress.journal')
+        valid_size = 0
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError("incomplete record")
+                        record = json.loads(line)
+                        # Rows already folded into the columns file are skipped
+                        if record['i'] == len(columns):
+                            columns.append(record['v'])
+                    except (ValueError, KeyError) as e:
+                        logger.warning(f"Dropping damaged tail of {path} at byte {valid_size}: {e}")
+                        break
+                    valid_size += len(line)
+        except FileNotFoundError:
+            return 0
+        if valid_size < os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(valid_size)
+        return valid_size
+
+    def _stored_user_ids(self):
+        try:
+            buckets = os.listdir(self.shard_dir)
+        except FileNotFoundError:
+            return
+        for bucket in buckets:
+            names = os.listdir(os.path.join(self.shard_dir, bucket))
+            yield from {name.split('.', 1)[0] for name in names if not name.endswith('.tmp')}
+
+    def _persist(self, collection, records):
+        if collection != SHARDS:
+            return super()._persist(collection, records)
+        error = None
+        for user_id in dict.fromkeys(records):
+            with self._lock:
+                changes = dict(self._dirty.get(user_id) or {})
+                if not changes:
+                    continue  # written by an earlier batch
+                shard = self._cache[user_id]
+                files = {
+                    f'.{name}.json': _dumps(shard[name][user_id])
+                    for name in changes if name != 'progress'
+                }
+                journal = None
+                if 'progress' in changes:
+                    progress = self._progress_files[user_id]
+                    columns = shard['progress'][user_id]
+                    rows = len(columns)
+                    if progress.rows is not None:
+                        journal = b''.join(
+                            self._encode({'i': row, 'v': columns.entry(row)}) for row in range(progress.rows, rows)
+                        )
+                        if progress.journal_size + len(journal) >= self.compact_ratio * progress.size:
+                            journal = None
+                    if journal is None:
+                        files['.progress'] = columns.to_bytes()
+            try:
+                if journal is not None:
+                    self._append_progress(user_id, journal)
+                self._write_files(user_id, files)
+            except Exception as e:
+                error = error or e
+                continue
+            with self._lock:
+                if 'progress' in changes:
+                    progress.rows = rows
+                    if journal is None:
+                        progress.size = len(files['.progress'])
+                        progress.journal_size = 0
+                    else:
+                        progress.journal_size += len(journal)
+                dirty = self._dirty[user_id]
+                for name, count in changes.items():
+                    dirty[name] -= count
+                    if not dirty[name]:
+                        del dirty[name]
+                if not dirty:
+                    del self._dirty[user_id]
+        if error is not None:
+            raise error
+
+    def _append_progress(self, user_id, data):
+        path = self._shard_path(user_id, '.progress.journal')
+        self._make_bucket(os.path.dirname(path))
+        with open(path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def _write_files(self, user_id, files):
+        """Atomically replace some of a user's files, by suffix"""
+        directory = os.path.dirname(self._shard_path(user_id))
+        self._make_bucket(directory)
+        for suffix, data in files.items():
+            _write_file(self._shard_path(user_id, suffix), data)
+        if '.progress' in files:
+            # The new columns file holds every journaled entry
+            with open(self._shard_path(user_id, '.progress.journal'), 'ab') as f:
+                f.truncate(0)
+        if files:
+            _fsync_dir(directory)
+
+    def _make_bucket(self, directory):
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+            _fsync_dir(self.shard_dir)
+
+
+class ProgressFiles:
+    """What a cached user's progress files on disk hold"""
+    __slots__ = ('rows', 'size', 'journal_size')
+
+    def __init__(self):
+        self.rows = 0  # entries in the columns file and journal; None: rewrite the columns file
+        self.size = 0  # bytes in the columns file
+        self.journal_size = 0  # bytes in the journal
+
+
+def _get_or_add(records, key, empty):
+    record = records.get(key)
+    if record is None:
+        record = records[key] = empty()
+    return record
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from config import SQLITE_FILENAME
+from storage import Storage, COLLECTIONS, STORAGE_WRITE_SECONDS
+from progress_columns import MAX_COUNT, ProgressColumns
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    collection TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (collection, key)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS progress (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    total_exercises INTEGER NOT NULL DEFAULT 0,
+    exercises_completed INTEGER NOT NULL DEFAULT 0,
+    workout_completed INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS progress_user_date ON progress (user_id, date);
+
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    workout_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    UNIQUE (user_id, workout_id)
+);
+"""
+
+
+class SQLiteStorage(Storage):
+    """SQLite storage backend.
+
+    Progress entries live in their own table indexed on (user_id, date), so
+    calendar, streak and intensity queries read only the rows they need.
+    Feedback keeps its insertion order through the rowid. Users, reminders
+    and any other collection are stored as JSON values in a key/value table.
+    The database runs in WAL mode and can be shared by several processes.
+    """
+
+    def __init__(self, data_dir='.', filename=SQLITE_FILENAME):
+        self.path = os.path.join(data_dir, filename)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self._add_workout_completed()
+
+    def get(self, collection, key, default=None):
+        if collection == 'progress':
+            rows = self._fetch('SELECT data FROM progress WHERE user_id = ? ORDER BY id', (key,))
+            return [json.loads(data) for data, in rows] if rows else default
+        if collection == 'feedback':
+            rows = self._fetch('SELECT workout_id, data FROM feedback WHERE user_id = ? ORDER BY id', (key,))
+            return {workout_id: json.loads(data) for workout_id, data in rows} if rows else default
+
+        rows = self._fetch('SELECT value FROM records WHERE collection = ? AND key = ?', (collection, key))
+        return json.loads(rows[0][0]) if rows else default
+
+    def items(self, collection):
+        if collection in ('progress', 'feedback'):
+            user_ids = self._fetch(f'SELECT DISTINCT user_id FROM {collection}')
+            return [(user_id, self.get(collection, user_id)) for user_id, in user_ids]
+
+        rows = self._fetch('SELECT key, value FROM records WHERE collection = ?', (collection,))
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def set(self, collection, key, value):
+        if collection == 'progress':
+            self._write(
+                [('DELETE FROM progress WHERE user_id = ?', (key,))]
+                + [_progress_insert(key, workout) for workout in value],
+                collection
+            )
+        elif collection == 'feedback':
+            self._write(
+                [('DELETE FROM feedback WHERE user_id = ?', (key,))]
+                + [_feedback_upsert(key, workout_id, data) for workout_id, data in value.items()],
+                collection
+            )
+        else:
+            self._write([(
+                'INSERT OR REPLACE INTO records (collection, key, value) VALUES (?, ?, ?)',
+                (collection, key, _dumps(value))
+            )], collection)
+
+    def append(self, collection, key, value):
+        if collection != 'progress':
+            records = self.get(collection, key, [])
+            records.append(value)
+            return self.set(collection, key, records)
+        self._write([_progress_insert(key, value)], collection)
+
+    def set_item(self, collection, key, field, value):
+        if collection != 'feedback':
+            record = self.get(collection, key, {})
+            record[field] = value
+            return self.set(collection, key, record)
+        self._write([_feedback_upsert(key, field, value)], collection)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def progress_between(self, user_id, start_date, end_date):
+        rows = self._fetch(
+            'SELECT data FROM progress WHERE user_id = ? AND date BETWEEN ? AND ? ORDER BY id',
+            (user_id, start_date.isoformat(), end_date.isoformat())
+        )
+        return [json.loads(data) for data, in rows]
+
+    def daily_totals(self, user_id, start_date, end_date):
+        return self._fetch(
+            'SELECT date, SUM(total_exercises), SUM(exercises_completed) FROM progress '
+            'WHERE user_id = ? AND date BETWEEN ? AND ? GROUP BY date ORDER BY date',
+            (user_id, start_date.isoformat(), end_date.isoformat())
+        )
+
+    def progress_columns(self, user_id):
+        # Only the aggregated fields, converted by SQLite instead of decoding every entry
+        return ProgressColumns.from_rows(self._fetch(
+            'SELECT CAST(COALESCE(julianday(date) - 1721424.5, 0) AS INTEGER), '
+            'MAX(0, MIN(exercises_completed, ?1)), MAX(0, MIN(total_exercises, ?1)), workout_completed '
+            'FROM progress WHERE user_id = ?2 ORDER BY id',
+            (MAX_COUNT, user_id)
+        ))
+
+    def progress_count(self, user_id):
+        return self._fetch('SELECT COUNT(*) FROM progress WHERE user_id = ?', (user_id,))[0][0]
+
+    def import_from(self, source):
+        """Copy every collection of another storage backend in one transaction"""
+        statements = [
+            ('DELETE FROM records', ()),
+            ('DELETE FROM progress', ()),
+            ('DELETE FROM feedback', ()),
+        ]
+        for collection in COLLECTIONS:
+            for key, value in source.items(collection):
+                if collection == 'progress':
+                    statements.extend(_progress_insert(key, workout) for workout in value)
+                elif collection == 'feedback':
+                    statements.extend(_feedback_upsert(key, workout_id, data) for workout_id, data in value.items())
+                else:
+                    statements.append((
+                        'INSERT INTO records (collection, key, value) VALUES (?, ?, ?)',
+                        (collection, key, _dumps(value))
+                    ))
+        self._write(statements, 'import')
+        return len(statements) - 3
+
+    def _add_workout_completed(self):
+        """Add the workout_completed column to a progress table created without it"""
+        columns = {name for _, name, *_ in self.conn.execute('PRAGMA table_info(progress)')}
+        if 'workout_completed' in columns:
+            return
+        with self.conn:
+            self.conn.execute('ALTER TABLE progress ADD COLUMN workout_completed INTEGER NOT NULL DEFAULT 0')
+            self.conn.execute("UPDATE progress SET workout_completed = json_extract(data, '$.workout_completed') IS 1")
+
+    def _fetch(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _write(self, statements, collection):
+        try:
+            with STORAGE_WRITE_SECONDS.time(backend='SQLiteStorage', collection=collection), self._lock, self.conn:
+                for sql, params in statements:
+                    self.conn.execute(sql, params)
+        except sqlite3.Error as e:
+            logger.error(f"Error writing to {self.path}: {e}")
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _progress_insert(user_id, workout):
+    return (
+        'INSERT INTO progress (user_id, date, total_exercises, exercises_completed, workout_completed, data) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        (user_id, workout['date'], workout.get('total_exercises', 0), workout.get('exercises_completed', 0),
+         workout.get('workout_completed') is True, _dumps(workout))
+    )
+
+
+def _feedback_upsert(user_id, workout_id, data):
+    return (
+        'INSERT INTO feedback (user_id, workout_id, data) VALUES (?, ?, ?) '
+        'ON CONFLICT (user_id, workout_id) DO UPDATE SET data = excluded.data',
+        (user_id, workout_id, _dumps(data))
+    )
@@ -0,0 +1,77 @@
+"""Running per-user workout aggregates, updated in O(1) on every saved workout"""
+from datetime import datetime, timedelta
+
+# Per-day rollups are kept for this many days, enough for the 30-day intensity view
+ROLLUP_DAYS = 31
+# Workouts listed under "recent" in /progress
+RECENT_WORKOUTS = 5
+
+
+def empty_stats():
+    """Aggregates of a user without workouts"""
+    return {
+        'total_workouts': 0,
+        'completed_workouts': 0,
+        'completion_sum': 0.0,
+        'last_date': None,
+        'current_streak': 0,
+        'longest_streak': 0,
+        'days': {},
+        'recent': [],
+    }
+
+
+def add_workout(stats, workout):
+    """Fold one progress entry into the aggregates (entries must come in date order)"""
+    stats['total_workouts'] += 1
+    if workout.get('workout_completed', False):
+        stats['completed_workouts'] += 1
+    stats['completion_sum'] += completion_rate(workout)
+
+    date = _parse_date(workout['date'])
+    last_date = _parse_date(stats['last_date']) if stats['last_date'] else None
+    if last_date is None or date > last_date + timedelta(days=1):
+        stats['current_streak'] = 1
+    elif date == last_date + timedelta(days=1):
+        stats['current_streak'] += 1
+    if last_date is None or date > last_date:
+        stats['last_date'] = workout['date']
+    stats['longest_streak'] = max(stats['longest_streak'], stats['current_streak'])
+
+    day = stats['days'].setdefault(workout['date'], [0, 0])
+    day[0] += workout['total_exercises']
+    day[1] += workout['exercises_completed']
+    cutoff = (_parse_date(stats['last_date']) - timedelta(days=ROLLUP_DAYS)).isoformat()
+    for old_date in [d for d in stats['days'] if d < cutoff]:
+        del stats['days'][old_date]
+
+    stats['recent'] = (stats['recent'] + [workout])[-RECENT_WORKOUTS:]
+    return stats
+
+
+def build_stats(progress):
+    """Compute the aggregates from a user's whole history"""
+    stats = empty_stats()
+    for workout in sorted(progress, key=lambda w: w['date']):
+        add_workout(stats, workout)
+    # Keep "recent" in insertion order, as the history lists it
+    stats['recent'] = progress[-RECENT_WORKOUTS:]
+    return stats
+
+
+def current_streak(stats, today):
+    """Streak still running on ``today``: the last workout was today or yesterday"""
+    if not stats['last_date'] or _parse_date(stats['last_date']) < today - timedelta(days=1):
+        return 0
+    return stats['current_streak']
+
+
+def completion_rate(workout):
+    """Share of a workout's exercises that were completed, in percent"""
+    if not workout['total_exercises']:
+        return 0.0
+    return workout['exercises_completed'] / workout['total_exercises'] * 100
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
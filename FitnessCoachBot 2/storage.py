@@ -0,0 +1,511 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+from datetime import datetime
+from config import (
+    JOURNAL_COMPACT_MIN_BYTES, JOURNAL_COMPACT_RATIO, JOURNAL_FSYNC, STORAGE_WRITE_BATCH, STORAGE_WRITE_DELAY,
+    PROGRESS_COLUMNS_CACHE_SIZE
+)
+from progress_columns import ProgressColumns
+import metrics
+
+logger = logging.getLogger(__name__)
+
+STORAGE_WRITE_SECONDS = metrics.histogram(
+    'storage_write_seconds', "Time to persist one Database write", ['backend', 'collection']
+)
+SNAPSHOT_SECONDS = metrics.histogram(
+    'storage_snapshot_seconds', "Time to write a full collection snapshot file", ['collection']
+)
+
+# Collections persisted by the Database, one snapshot file each
+COLLECTIONS = ('users', 'workouts', 'progress', 'reminders', 'feedback', 'media', 'stats', 'plans')
+
+
+class Storage:
+    """Base class for Database storage backends.
+
+    Collections are dicts keyed by user id. Backends only have to persist
+    three kinds of mutations, which keeps each write proportional to the
+    size of the changed record:
+
+    * ``set(collection, key, value)`` - collection[key] = value
+    * ``append(collection, key, value)`` - collection[key].append(value)
+    * ``set_item(collection, key, field, value)`` - collection[key][field] = value
+
+    The progress queries below scan the user's history in Python; backends
+    with an index on (user_id, date) override them.
+    """
+
+    def get(self, collection, key, default=None):
+        """Get a record from a collection"""
+        raise NotImplementedError
+
+    def items(self, collection):
+        """Iterate over (key, record) pairs of a collection"""
+        raise NotImplementedError
+
+    def set(self, collection, key, value):
+        """Replace a whole record"""
+        raise NotImplementedError
+
+    def append(self, collection, key, value):
+        """Append a value to a list record"""
+        raise NotImplementedError
+
+    def set_item(self, collection, key, field, value):
+        """Set a single field of a dict record"""
+        raise NotImplementedError
+
+    def flush(self):
+        """Make every accepted write durable"""
+
+    def durable(self):
+        """Future resolved once every accepted write is durable"""
+        future = Future()
+        future.set_result(None)
+        return future
+
+    def close(self):
+        """Flush and release file handles"""
+        self.flush()
+
+    def progress_between(self, user_id, start_date, end_date):
+        """Get a user's progress entries dated within [start_date, end_date]"""
+        return [
+            workout for workout in self.get('progress', user_id, [])
+            if start_date <= _parse_date(workout['date']) <= end_date
+        ]
+
+    def progress_columns(self, user_id):
+        """Get a user's progress history as ProgressColumns for aggregates (treat as read-only)"""
+        return ProgressColumns.from_entries(self.get('progress', user_id, []))
+
+    def progress_count(self, user_id):
+        """Get the number of progress entries a user has"""
+        return len(self.progress_columns(user_id))
+
+    def daily_totals(self, user_id, start_date, end_date):
+        """Get sorted (date, total_exercises, exercises_completed) sums per day"""
+        totals = defaultdict(lambda: [0, 0])
+        for workout in self.progress_between(user_id, start_date, end_date):
+            day = totals[workout['date']]
+            day[0] += workout['total_exercises']
+            day[1] += workout['exercises_completed']
+        return sorted((date, total, completed) for date, (total, completed) in totals.items())
+
+
+class StorageWriter:
+    """Background thread group-committing a storage's disk writes.
+
+    The first submitted item opens a window of ``delay`` seconds; everything
+    submitted until it closes, or until ``max_batch`` items are queued, is
+    handed to ``write_batch`` as one list and made durable together.
+    ``durable()`` acknowledges the commit of what was submitted before it.
+    """
+
+    def __init__(self, write_batch, delay, max_batch=STORAGE_WRITE_BATCH, name='storage-writer'):
+        self.write_batch = write_batch
+        self.delay = delay
+        self.max_batch = max_batch
+        self._queue = []
+        self._submitted = 0  # items ever submitted
+        self._written = 0  # items whose batch has been written
+        self._waiters = []  # (item count, Future) resolved once written
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("storage writer is closed")
+            self._queue.append(item)
+            self._submitted += 1
+            if len(self._queue) in (1, self.max_batch):
+                self._condition.notify_all()
+
+    def durable(self):
+        """Future resolved when everything submitted so far is written"""
+        future = Future()
+        with self._condition:
+            if self._written < self._submitted:
+                self._waiters.append((self._submitted, future))
+                return future
+        future.set_result(None)
+        return future
+
+    def flush(self):
+        """Block until every submitted item has been written"""
+        with self._condition:
+            while self._written < self._submitted:
+                self._condition.wait()
+
+    def close(self):
+        """Write what is queued and stop the thread"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                deadline = time.monotonic() + self.delay
+                while not self._closed and len(self._queue) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch, self._queue = self._queue, []
+                last = self._submitted
+
+            error = None
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                logger.error(f"Error in storage writer: {e}")
+                error = e
+
+            with self._condition:
+                self._written = last
+                done = [future for count, future in self._waiters if count <= last]
+                self._waiters = [(count, future) for count, future in self._waiters if count > last]
+                self._condition.notify_all()
+            for future in done:
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+
+class FileStorage(Storage):
+    """Storage keeping every collection in memory, loaded from JSON files.
+
+    Reads and in-memory updates happen in the caller's thread. With a
+    ``write_delay`` (seconds) persistence runs on a StorageWriter thread
+    that group-commits the writes of each window (at most ``write_batch``
+    records); ``durable()`` and ``flush()`` wait for it. With None every
+    write is persisted before returning. Values passed to
+    set/append/set_item must not be mutated afterwards.
+    """
+
+    def __init__(self, data_dir='.', write_delay=None, write_batch=STORAGE_WRITE_BATCH, collections=COLLECTIONS):
+        self.data_dir = data_dir
+        self._lock = threading.RLock()
+        self.collections = {name: self._load_collection(name) for name in collections}
+        self._progress_columns = OrderedDict()  # user_id -> ProgressColumns, LRU built on first use
+        self._writer = None
+        if write_delay is not None:
+            self._writer = StorageWriter(self._write_batch, write_delay, write_batch)
+
+    def get(self, collection, key, default=None):
+        return self.collections[collection].get(key, default)
+
+    def items(self, collection):
+        with self._lock:
+            return list(self.collections[collection].items())
+
+    def set(self, collection, key, value):
+        with self._lock:
+            self.collections[collection][key] = value
+            if collection == 'progress':
+                self._progress_columns.pop(key, None)
+        self._submit(collection, {'op': 'set', 'k': key, 'v': value})
+
+    def append(self, collection, key, value):
+        with self._lock:
+            records = self.collections[collection].setdefault(key, [])
+            records.append(value)
+            index = len(records) - 1
+            if collection == 'progress' and key in self._progress_columns:
+                self._progress_columns[key].append(value)
+        # The index makes replaying an already compacted append a no-op
+        self._submit(collection, {'op': 'append', 'k': key, 'i': index, 'v': value})
+
+    def set_item(self, collection, key, field, value):
+        with self._lock:
+            self.collections[collection].setdefault(key, {})[field] = value
+        self._submit(collection, {'op': 'set_item', 'k': key, 'f': field, 'v': value})
+
+    def progress_columns(self, user_id):
+        # Kept next to the entries once built, so only the first call converts them
+        with self._lock:
+            columns = self._progress_columns.get(user_id)
+            if columns is None:
+                columns = self._progress_columns[user_id] = super().progress_columns(user_id)
+                if len(self._progress_columns) > PROGRESS_COLUMNS_CACHE_SIZE:
+                    self._progress_columns.popitem(last=False)
+            else:
+                self._progress_columns.move_to_end(user_id)
+            return columns
+
+    def progress_between(self, user_id, start_date, end_date):
+        with self._lock:
+            return self.progress_columns(user_id).between(start_date, end_date)
+
+    def daily_totals(self, user_id, start_date, end_date):
+        with self._lock:
+            return self.progress_columns(user_id).daily_totals(start_date, end_date)
+
+    def flush(self):
+        if self._writer is not None:
+            self._writer.flush()
+
+    def durable(self):
+        if self._writer is None:
+            return super().durable()
+        return self._writer.durable()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _path(self, collection):
+        return os.path.join(self.data_dir, f'{collection}.json')
+
+    def _submit(self, collection, record):
+        self._enqueue(collection, self._encode(record))
+
+    def _enqueue(self, collection, item):
+        """Persist an item of a collection now or hand it to the writer"""
+        if self._writer is None:
+            try:
+                self._write_batch([(collection, item)])
+            except Exception as e:
+                logger.error(f"Error saving {collection}: {e}")
+        else:
+            self._writer.submit((collection, item))
+
+    def _encode(self, record):
+        """Prepare a record for the writer; runs in the caller's thread"""
+        return record
+
+    def _write_batch(self, items):
+        by_collection = {}
+        for collection, item in items:
+            by_collection.setdefault(collection, []).append(item)
+        error = None
+        for collection, records in by_collection.items():
+            try:
+                with STORAGE_WRITE_SECONDS.time(backend=type(self).__name__, collection=collection):
+                    self._persist(collection, records)
+            except Exception as e:
+                # Still persist the other collections of the batch
+                error = error or e
+        if error is not None:
+            raise error
+
+    def _persist(self, collection, records):
+        """Persist a batch of encoded records of one collection"""
+        raise NotImplementedError
+
+    def _load_collection(self, collection):
+        """Load a collection snapshot from its JSON file"""
+        try:
+            with open(self._path(collection), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_to_file(self, filename, data):
+        """Atomically replace a JSON file: write a temp file, fsync, rename"""
+        with SNAPSHOT_SECONDS.time(collection=os.path.basename(filename)[:-len('.json')]):
+            # Copy under the lock and serialize outside it, so writes are not
+            # blocked while a large collection is encoded
+            with self._lock:
+                data = _snapshot(data)
+            text = json.dumps(data, ensure_ascii=False, indent=2)
+            _write_file(filename, text)
+            _fsync_dir(os.path.dirname(filename) or '.')
+
+
+class JsonFileStorage(FileStorage):
+    """Legacy backend: every write batch rewrites the whole collection file"""
+
+    def _persist(self, collection, records):
+        self._save_to_file(self._path(collection), self.collections[collection])
+
+
+class JournalStorage(FileStorage):
+    """Append-only journal per collection with periodic compaction.
+
+    Each write appends one JSON line to ``<collection>.json.journal``; a
+    batch from the writer thread is appended with a single write and fsync.
+    Once the journal outgrows ``compact_ratio`` times the snapshot (and
+    ``compact_min_bytes``) the collection is written to a fresh snapshot
+    (temp file + atomic rename) and the journal is truncated. On
+    startup the snapshot is loaded and the journal replayed on top of it; a
+    torn last line left by a crash is dropped. Replay is idempotent, so a
+    crash between the rename and the truncate cannot duplicate records.
+    """
+
+    def __init__(self, data_dir='.', compact_ratio=JOURNAL_COMPACT_RATIO, compact_min_bytes=JOURNAL_COMPACT_MIN_BYTES,
+                 fsync=JOURNAL_FSYNC, write_delay=None, write_batch=STORAGE_WRITE_BATCH, collections=COLLECTIONS):
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+        self.fsync = fsync
+        self._journals = {}
+        self._journal_size = {}  # collection -> bytes in its journal
+        self._snapshot_size = {}  # collection -> bytes in its last snapshot
+        super().__init__(data_dir, write_delay, write_batch, collections)
+
+    def _journal_path(self, collection):
+        return f'{self._path(collection)}.journal'
+
+    def _load_collection(self, collection):
+        data = super()._load_collection(collection)
+        self._snapshot_size[collection] = _file_size(self._path(collection))
+        path = self._journal_path(collection)
+        valid_size = 0
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError("incomplete record")
+                        _apply(data, json.loads(line))
+                    except (ValueError, KeyError) as e:
+                        logger.warning(f"Dropping damaged tail of {path} at byte {valid_size}: {e}")
+                        break
+                    valid_size += len(line)
+        except FileNotFoundError:
+            pass
+        else:
+            if valid_size < os.path.getsize(path):
+                with open(path, 'r+b') as f:
+                    f.truncate(valid_size)
+
+        self._journal_size[collection] = valid_size
+        return data
+
+    def _journal(self, collection):
+        journal = self._journals.get(collection)
+        if journal is None:
+            journal = open(self._journal_path(collection), 'ab')
+            self._journals[collection] = journal
+        return journal
+
+    def _encode(self, record):
+        return (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+    def _persist(self, collection, lines):
+        journal = self._journal(collection)
+        data = b''.join(lines)
+        journal.write(data)
+        journal.flush()
+        if self.fsync:
+            os.fsync(journal.fileno())
+
+        self._journal_size[collection] += len(data)
+        size = self._journal_size[collection]
+        if size >= self.compact_min_bytes and size >= self.compact_ratio * self._snapshot_size[collection]:
+            self.compact(collection)
+
+    def compact(self, collection):
+        """Fold the journal into a new snapshot of the collection"""
+        try:
+            path = self._path(collection)
+            self._save_to_file(path, self.collections[collection])
+            self._snapshot_size[collection] = _file_size(path)
+            self._journal(collection).truncate(0)
+            self._journal_size[collection] = 0
+        except Exception as e:
+            logger.error(f"Error compacting {collection}: {e}")
+
+    def close(self):
+        super().close()
+        for collection in self.collections:
+            if self._journal_size[collection]:
+                self.compact(collection)
+        for journal in self._journals.values():
+            journal.close()
+        self._journals.clear()
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def _snapshot(data):
+    """Copy of a collection that later set/append/set_item calls do not change"""
+    # Records are lists (append) or dicts (set_item) changed in place; the
+    # values inside them are never mutated
+    return {key: value.copy() if isinstance(value, (list, dict)) else value for key, value in data.items()}
+
+
+def _apply(data, record):
+    """Apply a journal record to a collection dict"""
+    op = record['op']
+    key = record['k']
+    if op == 'set':
+        data[key] = record['v']
+    elif op == 'append':
+        records = data.setdefault(key, [])
+        if len(records) == record['i']:
+            records.append(record['v'])
+    elif op == 'set_item':
+        data.setdefault(key, {})[record['f']] = record['v']
+    else:
+        raise ValueError(f"unknown operation {op!r}")
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _write_file(filename, data):
+    """Atomically replace a file with text or bytes: write a temp file, fsync, rename"""
+    tmp_name = f'{filename}.tmp'
+    with open(tmp_name, 'wb') as f:
+        f.write(data if isinstance(data, bytes) else data.encode('utf-8'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_name, filename)
+
+
+def _fsync_dir(path):
+    """Persist a rename on filesystems that need the directory synced"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def create_storage(backend='journal', data_dir='.'):
+    """Create a storage backend by name"""
+    if backend == 'sqlite':
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage(data_dir)
+    if backend == 'sharded':
+        from sharded_storage import ShardedStorage
+        return ShardedStorage(data_dir, write_delay=STORAGE_WRITE_DELAY)
+
+    backends = {
+        'json': JsonFileStorage,
+        'journal': JournalStorage,
+    }
+    try:
+        storage_class = backends[backend]
+    except KeyError:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return storage_class(data_dir, write_delay=STORAGE_WRITE_DELAY)
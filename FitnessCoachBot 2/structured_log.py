@@ -0,0 +1,28 @@
+"""Structured log records for hot paths: lazy formatting and sampling"""
+import random
+
+
+class Fields:
+    """Event fields rendered as ``key=value`` only when a handler formats the record"""
+    __slots__ = ('fields',)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __str__(self):
+        return ' '.join(f'{key}={value}' for key, value in self.fields.items())
+
+
+def log_event(logger, level, event, sample_rate=1.0, /, **fields):
+    """Log ``event`` with its fields, for a ``sample_rate`` share of calls.
+
+    Nothing is formatted unless the record is actually emitted. Handlers and
+    formatters can read the raw values from ``record.event`` and
+    ``record.fields``.
+    """
+    if not logger.isEnabledFor(level):
+        return False
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return False
+    logger.log(level, '%s %s', event, Fields(fields), extra={'event': event, 'fields': fields})
+    return True
@@ -0,0 +1,59 @@
+import random
+from datetime import date, timedelta
+import analytics
+from database import Database
+from progress_columns import ProgressColumns
+from storage import JournalStorage
+
+
+def make_history(entries):
+    """Entries in date order ending today, skipping about a third of the days"""
+    rng = random.Random(0)
+    history = []
+    day = date.today() - timedelta(days=entries)
+    while len(history) < entries:
+        day += timedelta(days=1 + (rng.random() < 0.3))
+        total = rng.randint(5, 15)
+        completed = rng.randint(1, total)
+        history.append({'date': min(day, date.today()).isoformat(), 'exercises_completed': completed,
+                        'total_exercises': total, 'workout_completed': completed == total})
+    return history
+
+
+def test_summary_matches_stats(tmp_path):
+    history = make_history(500)
+    db = Database(JournalStorage(str(tmp_path), fsync=False))
+    for workout in history:
+        db.storage.append('progress', '1', workout)
+
+    summary = db.get_progress_summary(1)
+    stats = db.get_progress_stats(1)
+    assert summary['total_workouts'] == stats['total_workouts'] == 500
+    assert summary['completed_workouts'] == stats['completed_workouts']
+    assert abs(summary['average_completion'] - stats['completion_sum'] / 500) < 1e-9
+    assert {key: summary[key] for key in ('current_streak', 'longest_streak')} == db.get_workout_streak(1)
+    assert summary['recent'] == history[-5:]
+    week_start = (date.today() - timedelta(days=6)).isoformat()
+    assert summary['workouts_7d'] == sum(1 for workout in history if workout['date'] >= week_start)
+
+    # Saved workouts reach the cached columns
+    db.save_workout_progress(1, {'exercises_completed': 2, 'total_exercises': 4, 'workout_completed': False})
+    assert db.get_progress_summary(1)['total_workouts'] == 501
+
+
+def test_rolling_windows():
+    today = date(2024, 5, 31)
+    entries = [
+        {'date': (today - timedelta(days=days_ago)).isoformat(), 'exercises_completed': completed,
+         'total_exercises': 10, 'workout_completed': completed == 10}
+        for days_ago, completed in [(40, 10), (20, 5), (19, 5), (18, 5), (6, 10), (1, 4), (0, 6)]
+    ]
+    averages = analytics.rolling_averages(ProgressColumns.from_entries(entries), today)
+
+    assert (averages['workouts_7d'], averages['average_7d']) == (3, 20 / 30 * 100)
+    assert (averages['workouts_30d'], averages['average_30d']) == (6, 35 / 60 * 100)
+
+
+def test_empty_history():
+    averages = analytics.rolling_averages(ProgressColumns(), date(2024, 5, 31))
+    assert averages == {'workouts_7d': 0, 'average_7d': 0.0, 'workouts_30d': 0, 'average_30d': 0.0}
@@ -0,0 +1,387 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+import pytest
+from config import SQLITE_FILENAME
+from database import Database
+from storage import JournalStorage, JsonFileStorage
+from sqlite_storage import SQLiteStorage
+from sharded_storage import ShardedStorage
+import manage
+
+
+def make_db(tmp_path, **options):
+    return Database(JournalStorage(str(tmp_path), **options))
+
+
+def test_journal_replay(tmp_path):
+    db = make_db(tmp_path, fsync=False)
+    db.save_user_profile(1, {'age': 30}, telegram_handle='user')
+    db.save_workout_progress(1, {'exercises_completed': 3, 'total_exercises': 5, 'workout_completed': False})
+    db.save_workout_feedback(1, 'workout_1', {'feedback': 'good'})
+    db.set_reminder(1, '07:00')
+
+    # Nothing but the journal has been written yet
+    assert not (tmp_path / 'progress.json').exists()
+
+    reopened = make_db(tmp_path)
+    assert reopened.get_user_profile(1)['telegram_handle'] == 'user'
+    assert len(reopened.get_user_progress(1)) == 1
+    assert reopened.get_user_feedback(1) == {'workout_1': {'feedback': 'good'}}
+    assert reopened.get_reminder(1) == '07:00'
+
+
+def test_torn_journal_tail_is_dropped(tmp_path):
+    db = make_db(tmp_path, fsync=False)
+    db.set_reminder(1, '07:00')
+    with open(tmp_path / 'reminders.json.journal', 'a', encoding='utf-8') as f:
+        f.write('{"op":"set","k":"2","v":"09:')
+
+    reopened = make_db(tmp_path)
+    assert reopened.get_reminder(1) == '07:00'
+    assert reopened.get_reminder(2) is None
+
+    # New records land after the last good one
+    reopened.set_reminder(3, '11:00')
+    assert make_db(tmp_path).get_reminder(3) == '11:00'
+
+
+def test_background_writes_are_batched(tmp_path):
+    db = make_db(tmp_path, fsync=False, write_delay=0.05)
+    batches = []
+    write_batch = db.storage._write_batch
+    db.storage._writer.write_batch = lambda items: (batches.append(len(items)), write_batch(items))
+    for user_id in range(20):
+        db.set_reminder(user_id, '07:00')
+    # Reads see the writes before they reach the disk
+    assert db.get_reminder(19) == '07:00'
+
+    db.flush()
+    assert sum(batches) == 20 and len(batches) < 20
+    assert make_db(tmp_path).get_reminder(19) == '07:00'
+
+    db.save_workout_progress(1, {'exercises_completed': 1, 'total_exercises': 1, 'workout_completed': True})
+    db.close()
+    assert len(make_db(tmp_path).get_user_progress(1)) == 1
+
+
+def test_group_commit_acknowledges_durability(tmp_path):
+    # The window never closes on time here: only the batch size triggers commits
+    db = make_db(tmp_path, fsync=False, write_delay=60, write_batch=3)
+    db.set_reminder(1, '07:00')
+    db.set_reminder(2, '08:00')
+    durable = db.durable()
+    assert not durable.done()
+
+    db.set_reminder(3, '09:00')
+    durable.result(timeout=5)
+    assert make_db(tmp_path).get_reminder(3) == '09:00'
+    assert db.durable().done()
+
+    db.set_reminder(4, '10:00')
+    db.close()
+    assert make_db(tmp_path).get_reminder(4) == '10:00'
+
+
+def test_writes_do_not_wait_for_compaction(tmp_path, monkeypatch):
+    make_db(tmp_path, fsync=False).save_workout_progress(
+        1, {'exercises_completed': 1, 'total_exercises': 1, 'workout_completed': True})
+    # The next write stays queued until close(), after the compaction
+    db = make_db(tmp_path, fsync=False, write_delay=60)
+    dumps = json.dumps
+    encoding = threading.Event()
+
+    def slow_dumps(data, **kwargs):
+        if kwargs.get('indent'):
+            # Snapshot of a large collection
+            encoding.set()
+            time.sleep(1)
+        return dumps(data, **kwargs)
+
+    monkeypatch.setattr(json, 'dumps', slow_dumps)
+    compaction = threading.Thread(target=db.storage.compact, args=('progress',))
+    compaction.start()
+    assert encoding.wait(5)
+    start = time.monotonic()
+    db.save_workout_progress(1, {'exercises_completed': 2, 'total_exercises': 2, 'workout_completed': True})
+    assert time.monotonic() - start < 0.5
+    compaction.join()
+    with open(tmp_path / 'progress.json', encoding='utf-8') as f:
+        assert len(json.load(f)['1']) == 1
+
+    db.close()
+    assert len(make_db(tmp_path).get_user_progress(1)) == 2
+
+
+def test_compaction_writes_legacy_snapshot(tmp_path):
+    db = make_db(tmp_path, compact_ratio=1.0, compact_min_bytes=1, fsync=False)
+    compactions = []
+    compact = db.storage.compact
+    db.storage.compact = lambda collection: (compactions.append(collection), compact(collection))
+    for _ in range(200):
+        db.save_workout_progress(1, {'exercises_completed': 1, 'total_exercises': 1, 'workout_completed': True})
+
+    # Each snapshot is larger than the last, so compactions get rarer as the data grows
+    assert 1 < compactions.count('progress') < 20
+    with open(tmp_path / 'progress.json', encoding='utf-8') as f:
+        assert 0 < len(json.load(f)['1']) < 200
+    assert len(make_db(tmp_path).get_user_progress(1)) == 200
+
+    # Crash between snapshot rename and journal truncate: replay must not duplicate
+    journal = (tmp_path / 'progress.json.journal').read_text(encoding='utf-8')
+    db.storage.compact('progress')
+    (tmp_path / 'progress.json.journal').write_text(journal, encoding='utf-8')
+    assert len(make_db(tmp_path).get_user_progress(1)) == 200
+
+
+def test_json_backend_reads_journal_snapshot(tmp_path):
+    db = make_db(tmp_path, fsync=False)
+    db.set_reminder(1, '07:00')
+    db.close()
+
+    assert Database(JsonFileStorage(str(tmp_path))).get_reminder(1) == '07:00'
+
+
+@pytest.fixture(params=['journal', 'sqlite', 'sharded'])
+def any_db(request, tmp_path):
+    if request.param == 'sqlite':
+        storage = SQLiteStorage(str(tmp_path))
+    elif request.param == 'sharded':
+        storage = ShardedStorage(str(tmp_path), fsync=False)
+    else:
+        storage = JournalStorage(str(tmp_path), fsync=False)
+    db = Database(storage)
+    yield db
+    db.close()
+
+
+def add_workout(db, user_id, day, completed, total):
+    db.storage.append('progress', str(user_id), {
+        'date': day.isoformat(),
+        'exercises_completed': completed,
+        'total_exercises': total,
+        'workout_completed': completed == total,
+    })
+
+
+def test_progress_queries(any_db):
+    today = date.today()
+    for days_ago, completed in [(0, 4), (0, 2), (1, 5), (2, 5), (10, 1), (11, 3), (40, 5)]:
+        add_workout(any_db, 1, today - timedelta(days=days_ago), completed, 5)
+    add_workout(any_db, 2, today, 5, 5)
+
+    assert any_db.get_workout_streak(1) == {'current_streak': 3, 'longest_streak': 3}
+    assert len(any_db.get_workouts_by_date(1, today - timedelta(days=2), today)) == 4
+
+    stats = any_db.get_workout_intensity_stats(1, days=30)
+    assert [s['date'] for s in stats] == sorted(s['date'] for s in stats)
+    assert len(stats) == 5
+    assert stats[-1] == {'date': today.isoformat(), 'completion_rate': 60.0, 'total_exercises': 10}
+
+    summary = any_db.get_progress_summary(1)
+    assert (summary['total_workouts'], summary['completed_workouts'], summary['current_streak']) == (7, 3, 3)
+    assert (summary['workouts_7d'], summary['workouts_30d']) == (4, 6)
+
+
+def test_feedback_keeps_insertion_order(any_db):
+    for workout_id, feedback in [('b', 'good'), ('a', 'too_easy'), ('b', 'too_hard')]:
+        any_db.save_workout_feedback(1, workout_id, {'feedback': feedback})
+    assert list(any_db.get_user_feedback(1).items()) == [
+        ('b', {'feedback': 'too_hard'}),
+        ('a', {'feedback': 'too_easy'}),
+    ]
+
+
+def test_migrate_sqlite(tmp_path):
+    db = make_db(tmp_path, fsync=False)
+    db.save_user_profile(1, {'age': 30})
+    db.save_workout_progress(1, {'exercises_completed': 3, 'total_exercises': 5, 'workout_completed': False})
+    db.save_workout_feedback(1, 'workout_1', {'feedback': 'good'})
+    db.set_reminder(1, '07:00')
+    db.close()
+
+    manage.main(['--data-dir', str(tmp_path), 'migrate-sqlite'])
+
+    migrated = Database(SQLiteStorage(str(tmp_path)))
+    assert migrated.get_user_profile(1)['age'] == 30
+    assert migrated.get_user_progress(1) == db.get_user_progress(1)
+    assert migrated.get_user_feedback(1) == {'workout_1': {'feedback': 'good'}}
+    assert migrated.storage.items('reminders') == [('1', '07:00')]
+
+
+def test_sqlite_adds_workout_completed_column(tmp_path):
+    conn = sqlite3.connect(tmp_path / SQLITE_FILENAME)
+    conn.execute('CREATE TABLE progress (id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, date TEXT NOT NULL, '
+                 'total_exercises INTEGER NOT NULL DEFAULT 0, exercises_completed INTEGER NOT NULL DEFAULT 0, '
+                 'data TEXT NOT NULL)')
+    for completed in (True, False):
+        workout = {'date': date.today().isoformat(), 'exercises_completed': 2, 'total_exercises': 2,
+                   'workout_completed': completed}
+        conn.execute('INSERT INTO progress (user_id, date, total_exercises, exercises_completed, data) '
+                     'VALUES (?, ?, 2, 2, ?)', ('1', workout['date'], json.dumps(workout)))
+    conn.commit()
+    conn.close()
+
+    columns = SQLiteStorage(str(tmp_path)).progress_columns('1')
+    assert list(columns.flags) == [1, 0] and list(columns.totals) == [2, 2]
+
+
+def test_sharded_storage_loads_users_lazily(tmp_path):
+    db = Database(ShardedStorage(str(tmp_path), cache_size=2, fsync=False))
+    for user_id in (1, 2, 3):
+        db.save_user_profile(user_id, {'age': 30 + user_id})
+        db.save_workout_progress(user_id, {'exercises_completed': 1, 'total_exercises': 2,
+                                           'workout_completed': False})
+    db.set_reminder(1, '07:00')
+    assert list(db.storage._cache) == ['2', '3']
+
+    # Evicted users come back from their shard; full scans read past the cache
+    assert db.get_user_profile(1)['age'] == 31
+    assert list(db.storage._cache) == ['3', '1']
+    assert sorted(db.get_all_profiles()) == ['1', '2', '3']
+    db.close()
+
+    reopened = Database(ShardedStorage(str(tmp_path), fsync=False))
+    assert not reopened.storage._cache
+    assert reopened.get_reminder(1) == '07:00'
+    assert len(reopened.get_user_progress(3)) == 1
+
+
+def test_sharded_cache_keeps_users_with_queued_writes(tmp_path):
+    db = Database(ShardedStorage(str(tmp_path), cache_size=1, fsync=False, write_delay=0.2))
+    for user_id in range(5):
+        db.save_user_profile(user_id, {'age': 20 + user_id})
+    db.close()
+
+    reopened = Database(ShardedStorage(str(tmp_path), cache_size=1, fsync=False))
+    assert [reopened.get_user_profile(user_id)['age'] for user_id in range(5)] == [20, 21, 22, 23, 24]
+
+
+def test_sharded_writes_only_changed_files(tmp_path):
+    storage = ShardedStorage(str(tmp_path), compact_ratio=2.0, fsync=False)
+    db = Database(storage)
+    db.save_user_profile(1, {'age': 30})
+    written = []
+    write_files = storage._write_files
+    storage._write_files = lambda user_id, files: (written.append(sorted(files)), write_files(user_id, files))
+    for _ in range(50):
+        db.save_workout_progress(1, {'exercises_completed': 1, 'total_exercises': 2, 'workout_completed': False})
+
+    # The profile is never rewritten; most entries only go to the progress journal
+    assert not any('.users.json' in files for files in written)
+    rewrites = sum('.progress' in files for files in written)
+    assert 1 <= rewrites < 20
+    assert list((tmp_path / 'shards').rglob('1.progress.journal'))
+    db.close()
+
+    reopened = Database(ShardedStorage(str(tmp_path), fsync=False))
+    assert len(reopened.get_user_progress(1)) == 50
+    assert reopened.get_progress_stats(1)['total_workouts'] == 50
+    assert reopened.get_user_profile(1)['age'] == 30
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason="needs /proc")
+def test_cached_shards_hold_no_open_files(tmp_path):
+    db = Database(ShardedStorage(str(tmp_path), fsync=False))
+    for user_id in range(50):
+        db.save_workout_progress(user_id, {'exercises_completed': 1, 'total_exercises': 2, 'workout_completed': False})
+    db.close()
+
+    reopened = Database(ShardedStorage(str(tmp_path), fsync=False))
+    open_files = len(os.listdir('/proc/self/fd'))
+    for user_id in range(50):
+        assert reopened.get_progress_summary(user_id)['total_workouts'] == 1
+    assert len(os.listdir('/proc/self/fd')) < open_files + 5
+
+
+def test_migrate_shards(tmp_path):
+    db = make_db(tmp_path, fsync=False)
+    db.save_user_profile(1, {'age': 30})
+    db.save_workout_progress(1, {'exercises_completed': 3, 'total_exercises': 5, 'workout_completed': False})
+    db.set_reminder(1, '07:00')
+    db.close()
+
+    manage.main(['--data-dir', str(tmp_path), 'migrate-shards'])
+
+    migrated = Database(ShardedStorage(str(tmp_path)))
+    assert migrated.get_user_profile(1)['age'] == 30
+    assert migrated.get_user_progress(1) == db.get_user_progress(1)
+    assert migrated.get_workout_days(1, date.today().year, date.today().month) == {date.today().isoformat()}
+    assert migrated.get_reminder(1) == '07:00'
+
+
+def test_stats_follow_saved_workouts(tmp_path):
+    db = make_db(tmp_path, fsync=False)
+    for completed in (5, 3):
+        db.save_workout_progress(1, {'exercises_completed': completed, 'total_exercises': 5,
+                                     'workout_completed': completed == 5})
+
+    stats = db.get_progress_stats(1)
+    assert (stats['total_workouts'], stats['completed_workouts'], stats['completion_sum']) == (2, 1, 160.0)
+    assert db.get_workout_streak(1) == {'current_streak': 1, 'longest_streak': 1}
+    assert make_db(tmp_path).get_progress_stats(1) == stats
+
+
+def test_stats_catch_up_with_history(any_db):
+    any_db.save_workout_progress(1, {'exercises_completed': 5, 'total_exercises': 5, 'workout_completed': True})
+    # A crash after the progress write, before the stats write
+    any_db.storage.append('progress', '1', {'date': date.today().isoformat(), 'exercises_completed': 1,
+                                             'total_exercises': 5, 'workout_completed': False})
+
+    stats = any_db.get_progress_stats(1)
+    assert (stats['total_workouts'], stats['completed_workouts'], stats['completion_sum']) == (2, 1, 120.0)
+    assert any_db.storage.get('stats', '1') == stats
+
+
+def test_rebuild_stats_matches_history(tmp_path):
+    db = make_db(tmp_path, fsync=False)
+    today = date.today()
+    for days_ago in (9, 8, 7, 6, 2, 1):
+        add_workout(db, 1, today - timedelta(days=days_ago), 4, 5)
+    db.close()
+
+    # --data-dir works after the command too
+    manage.main(['rebuild-stats', '--data-dir', str(tmp_path)])
+
+    stats = make_db(tmp_path).storage.get('stats', '1')
+    assert stats['total_workouts'] == 6
+    assert (stats['current_streak'], stats['longest_streak']) == (2, 4)
+    assert stats['last_date'] == (today - timedelta(days=1)).isoformat()
+
+
+def test_calendar_days_and_workouts(any_db):
+    any_db.save_workout_progress(1, {'exercises_completed': 2, 'total_exercises': 5, 'workout_completed': False})
+    any_db.save_workout_progress(1, {'exercises_completed': 5, 'total_exercises': 5, 'workout_completed': True})
+    today = date.today()
+
+    assert any_db.get_workout_days(1, today.year, today.month) == {today.isoformat()}
+    assert [w['exercises_completed'] for w in any_db.get_workouts_on_date(1, today.isoformat())] == [2, 5]
+    assert any_db.get_workouts_on_date(2, today.isoformat()) == []
+
+
+def test_calendar_reads_history_saved_without_stats(any_db):
+    day = date(2023, 2, 14)
+    add_workout(any_db, 1, day, 3, 5)
+
+    assert any_db.get_workout_days(1, 2023, 2) == {'2023-02-14'}
+    assert any_db.get_workouts_on_date(1, '2023-02-14') == any_db.get_workouts_by_date(1, day, day)
+
+
+def test_precompute_plans(tmp_path):
+    db = make_db(tmp_path, fsync=False)
+    for user_id in (1, 2):
+        db.save_user_profile(user_id, {'fitness_level': 'Начинающий', 'goals': 'Похудение',
+                                       'equipment': 'Только вес тела'})
+    db.close()
+
+    manage.main(['--data-dir', str(tmp_path), 'precompute-plans', '--date', '2024-05-01'])
+
+    db = make_db(tmp_path)
+    first = db.get_daily_workout(1, '2024-05-01')
+    assert first['exercises'] and first == db.get_daily_workout(2, '2024-05-01')
+    assert first is not db.get_daily_workout(2, '2024-05-01')
+    assert len(db.storage.items('plans')) == 1
+    assert db.get_daily_workout(1, '2024-05-02') is None
@@ -0,0 +1,45 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import pytest
+from telegram import Bot
+from telegram.error import RetryAfter
+from fake_bot_api import FakeBotAPI
+
+
+def test_fake_api_answers_like_telegram():
+    api = FakeBotAPI(latency=0).start()
+
+    async def scenario():
+        async with Bot('123:TEST', base_url=api.base_url) as bot:
+            message = await bot.send_animation(42, 'https://example.com/a.gif', caption='step 1')
+            assert message.animation.file_id.startswith('fake-file-')
+            edited = await message.edit_caption('step 2')
+            assert edited.caption == 'step 2'
+
+            api.error_rate = 1.0
+            with pytest.raises(RetryAfter):
+                await bot.send_message(42, 'hi')
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        api.stop()
+    assert [call[1] for call in api.calls_for(42)] == ['sendAnimation', 'editMessageCaption', 'sendMessage']
+    assert api.last_message(42)['caption'] == 'step 2'
+
+
+def test_loadtest_runs_every_journey_step(tmp_path):
+    # A subprocess, since config.py reads the environment at import time
+    report_path = tmp_path / 'report.json'
+    subprocess.run(
+        [sys.executable, os.path.join('benchmarks', 'loadtest.py'), '--users', '3', '--api-latency', '0',
+         '--per-chat-rate', '1000', '--overall-rate', '1000', '--json', str(report_path)],
+        check=True, capture_output=True, timeout=120
+    )
+    report = json.loads(report_path.read_text(encoding='utf-8'))
+    assert report['errors'] == {}
+    assert {'/profile', '/start_workout', 'exercise_done', 'finish_workout', 'calendar_*'} <= set(report['latency'])
+    assert report['api_calls_by_method']['answerCallbackQuery'] == 8
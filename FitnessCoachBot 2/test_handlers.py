@@ -0,0 +1,153 @@
+import asyncio
+from datetime import date
+from types import SimpleNamespace
+import pytest
+from telegram.error import BadRequest, TimedOut
+from telegram.ext import CallbackQueryHandler, CommandHandler, ConversationHandler, MessageHandler, filters
+from database import Database
+from handlers import HANDLER_SECONDS, BotHandlers, _instrument
+from session_store import SessionStore
+from storage import JournalStorage
+from workout_manager import WorkoutManager
+
+
+class FakeMessage:
+    def __init__(self, calls, animation=None, text=None):
+        self.calls = calls
+        self.animation = animation
+        self.text = text
+
+    async def _call(self, name, animation=None, text=None):
+        self.calls.append(name)
+        return FakeMessage(self.calls, animation=animation, text=text)
+
+    async def edit_caption(self, **kwargs):
+        return await self._call('edit_caption', animation=self.animation)
+
+    async def edit_media(self, media, **kwargs):
+        self.sent_media = media.media
+        return await self._call('edit_media', animation=SimpleNamespace(file_id='file-id'))
+
+    async def edit_text(self, **kwargs):
+        return await self._call('edit_text', text=kwargs['text'])
+
+    async def reply_animation(self, animation, **kwargs):
+        self.sent_media = animation
+        return await self._call('reply_animation', animation=SimpleNamespace(file_id='file-id'))
+
+    async def reply_text(self, text, **kwargs):
+        return await self._call('reply_text', text=text)
+
+    async def delete(self):
+        await self._call('delete')
+
+
+def make_handlers(tmp_path):
+    return BotHandlers(
+        Database(JournalStorage(str(tmp_path), fsync=False)), WorkoutManager(), None,
+        SessionStore(str(tmp_path / 'sessions.db'))
+    )
+
+
+def press(message):
+    return SimpleNamespace(callback_query=SimpleNamespace(message=message), message=None)
+
+
+def test_navigation_edits_in_place(tmp_path):
+    handlers = make_handlers(tmp_path)
+    gif = 'https://media.tenor.com/a.gif'
+
+    async def scenario():
+        calls = []
+        # animation -> animation and text -> text are single edits
+        animated = FakeMessage(calls, animation=SimpleNamespace(file_id='id:other'))
+        assert await handlers._render_exercise(press(animated), 'step', None, gif, True) == 1
+        assert await handlers._render_exercise(press(FakeMessage(calls, text='old')), 'step', None, None, True) == 1
+        assert calls == ['edit_media', 'edit_text']
+        assert animated.sent_media == gif
+
+        # text -> animation needs a new message and a delete; the file_id is reused
+        calls.clear()
+        text_message = FakeMessage(calls, text='old')
+        assert await handlers._render_exercise(press(text_message), 'step', None, gif, True) == 2
+        assert calls == ['reply_animation', 'delete']
+        assert text_message.sent_media == 'file-id'
+
+    asyncio.run(scenario())
+
+
+class FailingMessage(FakeMessage):
+    def __init__(self, calls, error, **kwargs):
+        super().__init__(calls, **kwargs)
+        self.error = error
+
+    async def reply_animation(self, animation, **kwargs):
+        self.calls.append('reply_animation')
+        raise self.error
+
+
+def test_cached_file_id_is_dropped_only_when_rejected(tmp_path):
+    handlers = make_handlers(tmp_path)
+    gif = 'https://media.tenor.com/a.gif'
+    handlers.media_cache.remember(gif, SimpleNamespace(animation=SimpleNamespace(file_id='file-id')))
+
+    async def scenario():
+        calls = []
+        # A timeout keeps the file_id and reaches the error handler
+        with pytest.raises(TimedOut):
+            await handlers._send_exercise(press(FailingMessage(calls, TimedOut())), 'step', None, gif)
+        assert handlers.media_cache.get(gif) == 'file-id'
+
+        # A rejected file_id is forgotten and the step is sent as text
+        calls.clear()
+        message = FailingMessage(calls, BadRequest('Wrong file identifier'))
+        assert await handlers._send_exercise(press(message), 'step', None, gif) == 3
+        assert calls == ['reply_animation', 'reply_text', 'delete']
+        assert handlers.media_cache.get(gif) == gif
+
+    asyncio.run(scenario())
+
+
+def test_handler_metrics_are_labelled_by_command_and_pattern():
+    async def callback(update, context):
+        pass
+
+    handlers = [
+        CommandHandler('progress', callback),
+        CallbackQueryHandler(callback, pattern='^feedback_'),
+        ConversationHandler(
+            entry_points=[CommandHandler('profile', callback)],
+            states={1: [MessageHandler(filters.TEXT, callback)]},
+            fallbacks=[],
+        ),
+    ]
+    _instrument(handlers)
+    labels = ['/progress', '^feedback_', '/profile', '/profile state 1']
+    before = [HANDLER_SECONDS.count(handler=label) for label in labels]
+
+    async def scenario():
+        for handler in handlers[:2] + handlers[2].entry_points + handlers[2].states[1]:
+            await handler.callback(None, None)
+
+    asyncio.run(scenario())
+    assert [HANDLER_SECONDS.count(handler=label) for label in labels] == [count + 1 for count in before]
+
+
+def test_calendar_keyboard_cache(tmp_path):
+    handlers = make_handlers(tmp_path)
+    today = date.today()
+
+    empty = handlers._calendar_keyboard(1, today.year, today.month)
+    assert handlers._calendar_keyboard(1, today.year, today.month) is empty
+    # Same month and workout days: the rendered markup is shared between users
+    assert handlers._calendar_keyboard(2, today.year, today.month) is empty
+
+    handlers.active_workouts[1] = {'current_exercise': 0, 'total_exercises': 1}
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=1), callback_query=None,
+                             message=FakeMessage([]))
+    asyncio.run(handlers._finish_workout(update, SimpleNamespace(user_data={})))
+
+    marked = handlers._calendar_keyboard(1, today.year, today.month)
+    assert marked is not empty
+    assert f"💪{today.day}" in [button.text for row in marked.inline_keyboard for button in row]
+    assert handlers._calendar_keyboard(2, today.year, today.month) is empty
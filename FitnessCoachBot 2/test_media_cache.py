@@ -0,0 +1,19 @@
+from types import SimpleNamespace
+from database import Database
+from media_cache import MediaCache
+from storage import JournalStorage
+
+
+def test_file_ids_are_cached_and_persisted(tmp_path):
+    db = Database(JournalStorage(str(tmp_path), fsync=False))
+    cache = MediaCache(db)
+    url = 'https://media.tenor.com/squat.gif'
+    assert cache.get(url) == url
+
+    cache.remember(url, SimpleNamespace(animation=SimpleNamespace(file_id='CgAC-squat')))
+    assert cache.get(url) == 'CgAC-squat'
+    assert MediaCache(Database(JournalStorage(str(tmp_path)))).get(url) == 'CgAC-squat'
+
+    cache.forget(url)
+    assert cache.get(url) == url
+    assert MediaCache(Database(JournalStorage(str(tmp_path)))).get(url) == url
@@ -0,0 +1,71 @@
+import math
+import re
+import urllib.request
+import metrics
+
+# name{label="value",...} value, as Prometheus parses a sample line
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*",?)*\})? (\S+)$')
+
+
+def parse(text):
+    """Samples of an exposition as {(name, labels): value}; fails on a malformed line"""
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        name, labels, value = match.groups()
+        # Prometheus spells the special values +Inf, -Inf and NaN
+        assert re.fullmatch(r'[+-]Inf|NaN|-?[0-9.]+(e[+-]?[0-9]+)?', value), line
+        samples[name, labels or ''] = float(value)
+    return samples
+
+
+def test_histogram_exposition_and_quantiles():
+    registry = metrics.Registry()
+    latency = metrics.histogram('test_seconds', "Test latency", ['handler'], buckets=(0.1, 1), registry=registry)
+    calls = metrics.counter('test_calls_total', "Test calls", registry=registry)
+    for value in (0.05, 0.05, 0.5, 5):
+        latency.observe(value, handler='progress')
+    calls.inc(3)
+
+    text = registry.expose()
+    assert 'test_seconds_bucket{handler="progress",le="0.1"} 2' in text
+    assert 'test_seconds_bucket{handler="progress",le="+Inf"} 4' in text
+    assert 'test_seconds_count{handler="progress"} 4' in text
+    assert 'test_calls_total 3' in text
+    assert latency.quantile(0.5, handler='progress') == 0.1
+    assert 0.1 < latency.quantile(0.75, handler='progress') <= 1
+
+
+def test_metrics_endpoint():
+    registry = metrics.Registry()
+    metrics.gauge('test_in_flight', "Test gauge", registry=registry).set(2)
+    server = metrics.start_server('127.0.0.1', 0, registry)
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics') as response:
+            assert response.headers['Content-Type'].startswith('text/plain')
+            assert 'test_in_flight 2' in response.read().decode('utf-8')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_exposition_parses():
+    registry = metrics.Registry()
+    latency = metrics.histogram('test_seconds', "Test latency", ['handler'], registry=registry)
+    latency.observe(0.2, handler='^(calendar|date)_')
+    latency.observe(float('inf'), handler='/progress')
+    limits = metrics.gauge('test_limit', "Test gauge", ['kind'], registry=registry)
+    limits.set(float('inf'), kind='upper')
+    limits.set(float('-inf'), kind='lower')
+    limits.set(float('nan'), kind='unknown')
+
+    samples = parse(registry.expose())
+    assert samples['test_seconds_count', '{handler="^(calendar|date)_"}'] == 1
+    assert samples['test_seconds_bucket', '{handler="/progress",le="+Inf"}'] == 1
+    assert samples['test_seconds_sum', '{handler="/progress"}'] == math.inf
+    assert samples['test_limit', '{kind="upper"}'] == math.inf
+    assert samples['test_limit', '{kind="lower"}'] == -math.inf
+    assert math.isnan(samples['test_limit', '{kind="unknown"}'])
@@ -0,0 +1,36 @@
+from datetime import date
+from progress_columns import ProgressColumns
+
+ENTRIES = [
+    {'date': '2024-05-01', 'exercises_completed': 3, 'total_exercises': 5, 'workout_completed': False,
+     'workout_id': 'workout_20240501_070000'},
+    {'date': '2024-05-01', 'exercises_completed': 5, 'total_exercises': 5, 'workout_completed': True,
+     'workout_id': 'workout_20240501_190501'},
+    {'date': '2024-05-03', 'exercises_completed': 2, 'total_exercises': 4, 'workout_completed': False},
+    # Shapes the columns cannot hold are kept as they are
+    {'date': '2024-05-04', 'exercises_completed': 4, 'total_exercises': 4, 'workout_completed': True,
+     'workout_id': 'imported-7', 'note': 'gym'},
+]
+
+
+def test_round_trip_through_file(tmp_path):
+    columns = ProgressColumns.from_entries(ENTRIES)
+    assert columns.to_entries() == ENTRIES
+    assert list(columns.extra) == [3]
+
+    path = tmp_path / '1.progress'
+    path.write_bytes(columns.to_bytes())
+    loaded = ProgressColumns.load(str(path))
+    assert loaded.to_entries() == ENTRIES
+    assert isinstance(loaded.days, memoryview)
+
+    # Appending copies the read-only columns first
+    loaded.append({'date': '2024-04-30', 'exercises_completed': 1, 'total_exercises': 1, 'workout_completed': True})
+    assert len(loaded) == 5 and not loaded.is_sorted
+    assert len(ProgressColumns.load(str(path))) == 4
+
+
+def test_range_queries():
+    columns = ProgressColumns.from_entries(ENTRIES)
+    assert columns.daily_totals(date(2024, 5, 1), date(2024, 5, 3)) == [('2024-05-01', 10, 8), ('2024-05-03', 4, 2)]
+    assert columns.between(date(2024, 5, 2), date(2024, 5, 10)) == ENTRIES[2:]
@@ -0,0 +1,105 @@
+import asyncio
+from telegram.error import RetryAfter
+from rate_limiter import PriorityRateLimiter, PRIORITY_INTERACTIVE, PRIORITY_TIMER, PRIORITY_BROADCAST
+
+
+async def send(limiter, sent, name, chat_id, priority=None):
+    async def callback():
+        sent.append(name)
+        return True
+
+    rate_limit_args = None if priority is None else {'priority': priority}
+    return await limiter.process_request(callback, (), {}, 'sendMessage', {'chat_id': chat_id}, rate_limit_args)
+
+
+def test_priority_order_under_global_limit():
+    async def scenario():
+        limiter = PriorityRateLimiter(overall_rate=50, per_chat_rate=50, per_chat_burst=50)
+        await limiter.initialize()
+        sent = []
+        # Drain the global burst so everything below has to queue
+        await asyncio.gather(*(send(limiter, [], 'burst', 0) for _ in range(50)))
+        await asyncio.gather(
+            send(limiter, sent, 'reminder', 1, PRIORITY_BROADCAST),
+            send(limiter, sent, 'tick', 2, PRIORITY_TIMER),
+            send(limiter, sent, 'reply', 3),
+        )
+        await limiter.shutdown()
+        return sent
+
+    assert asyncio.run(scenario()) == ['reply', 'tick', 'reminder']
+
+
+def test_per_chat_limit_and_retry_after():
+    async def scenario():
+        limiter = PriorityRateLimiter(overall_rate=1000, per_chat_rate=20, per_chat_burst=2)
+        await limiter.initialize()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await asyncio.gather(*(send(limiter, [], 'msg', 1, PRIORITY_INTERACTIVE) for _ in range(6)))
+        throttled = loop.time() - start
+
+        attempts = []
+
+        async def flaky():
+            attempts.append(loop.time())
+            if len(attempts) == 1:
+                raise RetryAfter(0.1)
+            return True
+
+        result = await limiter.process_request(flaky, (), {}, 'sendMessage', {'chat_id': 2}, None)
+        await limiter.shutdown()
+        return throttled, result, attempts
+
+    throttled, result, attempts = asyncio.run(scenario())
+    # 2 burst tokens, then 4 more at 20/s
+    assert throttled >= 0.19
+    assert result is True
+    assert attempts[1] - attempts[0] >= 0.1
+
+
+def test_retry_after_holds_back_every_chat():
+    async def scenario():
+        limiter = PriorityRateLimiter(overall_rate=1000, per_chat_rate=1000, per_chat_burst=10)
+        await limiter.initialize()
+        loop = asyncio.get_running_loop()
+        attempts = []
+
+        async def flooded():
+            attempts.append(loop.time())
+            if len(attempts) == 1:
+                raise RetryAfter(0.2)
+            return True
+
+        async def other_chat():
+            await send(limiter, [], 'other chat', 2)
+            return loop.time() - start
+
+        start = loop.time()
+        # The other chat queues behind the flood limit hit by chat 1
+        _, waited = await asyncio.gather(
+            limiter.process_request(flooded, (), {}, 'sendMessage', {'chat_id': 1}, None),
+            other_chat(),
+        )
+        await limiter.shutdown()
+        return waited
+
+    assert asyncio.run(scenario()) >= 0.19
+
+
+def test_priority_order_within_a_chat():
+    async def scenario():
+        limiter = PriorityRateLimiter(overall_rate=1000, per_chat_rate=20, per_chat_burst=1)
+        await limiter.initialize()
+        sent = []
+        # Take the chat's only token so the rest queue on the chat bucket
+        await send(limiter, [], 'burst', 1)
+        await asyncio.gather(
+            send(limiter, sent, 'reminder', 1, PRIORITY_BROADCAST),
+            send(limiter, sent, 'tick', 1, PRIORITY_TIMER),
+            send(limiter, sent, 'reply', 1),
+        )
+        await limiter.shutdown()
+        return sent
+
+    assert asyncio.run(scenario()) == ['reply', 'tick', 'reminder']
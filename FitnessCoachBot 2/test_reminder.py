@@ -0,0 +1,117 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+import tzlocal
+from database import Database
+from reminder import ReminderManager
+from storage import JournalStorage
+
+
+class FakeJob:
+    def __init__(self, callback, time, data):
+        self.callback = callback
+        self.time = time
+        self.data = data
+        self.removed = False
+
+    def schedule_removal(self):
+        self.removed = True
+
+
+class FakeJobQueue:
+    def __init__(self):
+        self.jobs = []
+
+    def run_daily(self, callback, time, data, name):
+        job = FakeJob(callback, time, data)
+        self.jobs.append(job)
+        return job
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def send_message(self, chat_id, text, rate_limit_args=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        self.sent.append(chat_id)
+
+
+def test_reminders_are_grouped_by_slot_and_reloaded(tmp_path):
+    db = Database(JournalStorage(str(tmp_path), fsync=False))
+    for user_id in range(100):
+        db.set_reminder(user_id, '08:00')
+    db.set_reminder(100, '09:00')
+
+    job_queue = FakeJobQueue()
+    manager = ReminderManager(job_queue, db, concurrency=8)
+    manager.load_reminders()
+    assert sorted(job.data for job in job_queue.jobs) == ['08:00', '09:00']
+
+    # Moving the only 09:00 user drops that slot's job
+    manager.set_reminder(100, '08:00')
+    slot_0900 = next(job for job in job_queue.jobs if job.data == '09:00')
+    assert slot_0900.removed
+    assert db.get_reminder(100) == '08:00'
+
+    bot = FakeBot()
+    slot_0800 = next(job for job in job_queue.jobs if job.data == '08:00')
+    asyncio.run(slot_0800.callback(SimpleNamespace(bot=bot, job=slot_0800)))
+    assert sorted(bot.sent) == list(range(101))
+    assert bot.max_in_flight == 8
+
+
+def test_reminders_follow_local_dst(tmp_path, monkeypatch):
+    monkeypatch.setenv('TZ', 'Europe/Berlin')
+    tzlocal.reload_localzone()
+    try:
+        manager = ReminderManager(FakeJobQueue(), Database(JournalStorage(str(tmp_path), fsync=False)))
+        manager.set_reminder(1, '07:00')
+    finally:
+        monkeypatch.undo()
+        tzlocal.reload_localzone()
+
+    # 07:00 local is 06:00 UTC in winter and 05:00 UTC in summer
+    slot = manager.job_queue.jobs[0].time
+    for day, utc_hour in ((datetime(2024, 1, 15), 6), (datetime(2024, 7, 15), 5)):
+        local = datetime.combine(day.date(), slot)
+        assert local.astimezone(ZoneInfo('UTC')).hour == utc_hour
+
+
+def test_each_process_schedules_its_own_users(tmp_path):
+    db = Database(JournalStorage(str(tmp_path), fsync=False))
+    for user_id in range(10):
+        db.set_reminder(user_id, '08:00')
+
+    managers = [ReminderManager(FakeJobQueue(), db, shard=shard, shards=3) for shard in range(3)]
+    for manager in managers:
+        manager.load_reminders()
+    for shard, manager in enumerate(managers):
+        assert sorted(map(int, manager.slots['08:00'])) == list(range(shard, 10, 3))
+
+
+class BrokenBot(FakeBot):
+    async def send_message(self, chat_id, text, rate_limit_args=None):
+        if chat_id == 3:
+            raise ValueError("bad chat")
+        await super().send_message(chat_id, text, rate_limit_args)
+
+
+def test_one_failed_reminder_does_not_stop_the_slot(tmp_path):
+    db = Database(JournalStorage(str(tmp_path), fsync=False))
+    for user_id in range(10):
+        db.set_reminder(user_id, '08:00')
+    job_queue = FakeJobQueue()
+    manager = ReminderManager(job_queue, db, concurrency=2)
+    manager.load_reminders()
+
+    bot = BrokenBot()
+    job = job_queue.jobs[0]
+    asyncio.run(job.callback(SimpleNamespace(bot=bot, job=job)))
+    assert sorted(bot.sent) == [user_id for user_id in range(10) if user_id != 3]
@@ -0,0 +1,79 @@
+import asyncio
+import sqlite3
+import time
+from session_store import SessionStore
+
+
+def test_sessions_survive_restart(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+
+    async def first_process():
+        store = SessionStore(path, flush_interval=0.01)
+        store[1] = {'current_exercise': 0}
+        store[2] = {'current_exercise': 0}
+        store.get(1)['current_exercise'] = 3
+        store.touch(1)
+        store.pop(2)
+        await asyncio.sleep(0.05)
+        # Written behind, without an explicit flush
+        assert store.conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0] == 1
+        await store.close()
+
+    asyncio.run(first_process())
+    restarted = SessionStore(path)
+    assert restarted.get(1) == {'current_exercise': 3}
+    assert restarted.get(2) is None
+
+
+def test_lru_and_ttl_bound_memory(tmp_path):
+    async def scenario():
+        store = SessionStore(str(tmp_path / 'sessions.db'), max_size=2, ttl=60)
+        for user_id in range(3):
+            store[user_id] = {'user': user_id}
+        assert len(store) == 2
+        # Evicted from memory, reloaded from disk
+        assert store.get(0) == {'user': 0}
+        assert len(store) == 2
+
+        store.sessions['0'][1] = time.time() - 120
+        assert store.get(0) is None
+        await store.close()
+
+    asyncio.run(scenario())
+
+
+def test_reads_keep_the_stored_session_alive(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    store = SessionStore(path, ttl=60)
+    store[1] = {'current_exercise': 2}
+    asyncio.run(store.close())
+    with sqlite3.connect(path) as conn:
+        conn.execute('UPDATE sessions SET updated = ?', (time.time() - 50,))
+    conn.close()
+
+    async def read_only():
+        store = SessionStore(path, ttl=60)
+        assert store.get(1) == {'current_exercise': 2}
+        await store.close()
+
+    asyncio.run(read_only())
+    # Read, never changed: still fresh for the next process
+    with sqlite3.connect(path) as conn:
+        assert conn.execute('SELECT updated FROM sessions').fetchone()[0] > time.time() - 5
+    conn.close()
+
+
+def test_evicted_sessions_are_written_behind(tmp_path):
+    async def scenario():
+        store = SessionStore(str(tmp_path / 'sessions.db'), max_size=1, flush_interval=60)
+        store[0] = {'user': 0}
+        evicted = store.get(0)
+        store[1] = {'user': 1}
+        # Evicted while dirty: queued for the flusher, not written on the event loop
+        assert store.conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0] == 0
+        assert store.get(0) is evicted
+        await store.flush()
+        assert store.conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0] == 2
+        await store.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,65 @@
+import asyncio
+from timers import TimerScheduler, FINISH_MESSAGES, CANCELLED_MESSAGE
+
+
+class FakeMessage:
+    def __init__(self):
+        self.edits = []
+
+    async def edit_text(self, text, **kwargs):
+        self.edits.append(text)
+
+
+def test_adaptive_cadence_and_completion():
+    async def scenario():
+        # Long enough ticks that a busy machine does not coalesce countdown edits
+        scheduler = TimerScheduler(edit_interval=10, final_countdown=5, tick=0.02)
+        message = FakeMessage()
+        scheduler.start(1, message, 'rest', 30)
+        while 1 in scheduler or scheduler._edits:
+            await asyncio.sleep(0.005)
+        await scheduler.shutdown()
+        return message.edits
+
+    edits = asyncio.run(scenario())
+    assert edits[-1] == FINISH_MESSAGES['rest']
+    countdown = [int(text.split(': ')[1].split()[0]) for text in edits[:-1]]
+    assert countdown == [20, 10, 5, 4, 3, 2, 1]
+
+
+def test_new_timer_cancels_previous():
+    async def scenario():
+        scheduler = TimerScheduler(tick=0.005)
+        first, second = FakeMessage(), FakeMessage()
+        scheduler.start(1, first, 'timer', 60)
+        scheduler.start(1, second, 'rest', 60)
+        await asyncio.sleep(0.02)
+        assert len(scheduler) == 1
+        await scheduler.shutdown()
+        return first.edits
+
+    assert asyncio.run(scenario()) == [CANCELLED_MESSAGE]
+
+
+class SlowMessage(FakeMessage):
+    async def edit_text(self, text, **kwargs):
+        await asyncio.sleep(0.3)
+        self.edits.append(text)
+
+
+def test_slow_edit_does_not_hold_up_other_timers():
+    async def scenario():
+        scheduler = TimerScheduler(edit_interval=10, final_countdown=5, tick=0.005)
+        slow, fast = SlowMessage(), FakeMessage()
+        scheduler.start(1, slow, 'rest', 30)
+        scheduler.start(2, fast, 'rest', 30)
+        await asyncio.sleep(0.25)
+        assert fast.edits[-1] == FINISH_MESSAGES['rest']
+        while 1 in scheduler or scheduler._edits:
+            await asyncio.sleep(0.05)
+        await scheduler.shutdown()
+        return slow.edits
+
+    # Countdown edits due while one is in flight are skipped; the last one still lands last
+    edits = asyncio.run(scenario())
+    assert edits[0] == '⏱ Отдых: 20 сек' and edits[-1] == FINISH_MESSAGES['rest'] and len(edits) < 8
@@ -0,0 +1,64 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from update_processor import PerUserUpdateProcessor
+
+
+def make_update(user_id):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), effective_chat=None)
+
+
+async def process_all(processor, updates, handler):
+    async with processor:
+        await asyncio.gather(*(
+            processor.process_update(update, handler(update, i))
+            for i, update in enumerate(updates)
+        ))
+
+
+def test_users_run_concurrently():
+    async def handler(update, i):
+        await asyncio.sleep(0.05)
+
+    processor = PerUserUpdateProcessor(256)
+    start = time.perf_counter()
+    asyncio.run(process_all(processor, [make_update(user_id) for user_id in range(50)], handler))
+    assert time.perf_counter() - start < 0.5
+    assert not processor._locks
+
+
+def test_same_user_updates_never_interleave():
+    events = []
+
+    async def handler(update, i):
+        events.append(('start', update.effective_user.id, i))
+        await asyncio.sleep(0.01)
+        events.append(('end', update.effective_user.id, i))
+
+    updates = [make_update(user_id) for _ in range(5) for user_id in (1, 2)]
+    asyncio.run(process_all(PerUserUpdateProcessor(256), updates, handler))
+
+    for user_id in (1, 2):
+        user_events = [(kind, i) for kind, uid, i in events if uid == user_id]
+        indexes = [i for kind, i in user_events if kind == 'start']
+        assert indexes == sorted(indexes)
+        # Every start is immediately followed by its own end
+        assert all(
+            user_events[n + 1] == ('end', i)
+            for n, (kind, i) in enumerate(user_events) if kind == 'start'
+        )
+
+
+def test_busy_user_does_not_hold_every_slot():
+    finished = {}
+
+    async def handler(update, i):
+        if update.effective_user.id == 1:
+            await asyncio.sleep(0.2)
+        finished[i] = time.perf_counter()
+
+    # User 1 queues more slow updates than there are slots, then user 2 sends one
+    updates = [make_update(1) for _ in range(6)] + [make_update(2)]
+    start = time.perf_counter()
+    asyncio.run(process_all(PerUserUpdateProcessor(4), updates, handler))
+    assert finished[6] - start < 0.1
@@ -0,0 +1,82 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import urllib.error
+import pytest
+from fake_updates import callback_update, command_update, post_updates
+from webhook import WebhookFrontend, _process_updates, get_shard_key
+
+
+def record_worker(index, workers, updates, results):
+    while True:
+        data = updates.get()
+        if data is None:
+            break
+        results.put((index, get_shard_key(json.loads(data))))
+
+
+def test_get_shard_key():
+    assert get_shard_key(command_update(42, '/start')) == 42
+    assert get_shard_key(callback_update(43, 'next_exercise')) == 43
+    assert get_shard_key({'update_id': 1}) == 0
+
+
+def test_updates_of_a_user_go_to_one_worker():
+    results = multiprocessing.get_context('spawn').Queue()
+    frontend = WebhookFrontend(
+        workers=3, host='127.0.0.1', port=0, path='/hook', secret='s3cret',
+        worker_target=_bound(results)
+    )
+    frontend.start()
+    try:
+        url = 'http://%s:%d/hook' % frontend.address
+        updates = [command_update(user_id, '/start') for user_id in range(10)] * 2
+        assert post_updates(url, updates, secret='s3cret') == [200] * 20
+        with pytest.raises(urllib.error.HTTPError):
+            post_updates(url, updates[:1], secret='wrong')
+    finally:
+        frontend.stop()
+
+    routed = [results.get(timeout=10) for _ in range(20)]
+    assert all(index == user_id % 3 for index, user_id in routed)
+
+
+class _bound:
+    """Picklable worker target with an extra result queue"""
+
+    def __init__(self, results):
+        self.results = results
+
+    def __call__(self, index, workers, updates):
+        record_worker(index, workers, updates, self.results)
+
+
+class FakeApplication:
+    def __init__(self):
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.calls.append('exit')
+
+    async def start(self):
+        self.calls.append('start')
+        # The worker is asked to stop as soon as it runs
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    async def stop(self):
+        self.calls.append('stop')
+
+    async def post_shutdown(self, application):
+        self.calls.append('post_shutdown')
+
+
+def test_worker_stops_cleanly_on_sigterm():
+    application = FakeApplication()
+    asyncio.run(asyncio.wait_for(_process_updates(application, queue.Queue()), 5))
+    assert application.calls == ['start', 'stop', 'post_shutdown', 'exit']
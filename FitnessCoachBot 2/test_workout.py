@@ -31,5 +31,54 @@ def test_workout_generation():
         for i, exercise in enumerate(workout['exercises'][:3]):
             logger.info(f"Exercise {i+1}: {exercise['name']} - Equipment: {exercise.get('weight', 'No equipment')}")
 
+def test_generated_exercises_are_independent():
+    manager = WorkoutManager()
+    profile = {
+        'fitness_level': 'Средний',
+        'goals': 'Похудение',
+        'equipment': 'Только вес тела'
+    }
+    feedback_history = {f'workout_{i}': {'feedback': 'good'} for i in range(3)}
+
+    first = manager.generate_workout(profile)
+    # start_workout rewrites circuits in place; the index must not see it
+    first['exercises'][0]['circuits'] = 99
+    second = manager.generate_workout(profile)
+    assert second['exercises'][0]['circuits'] != 99
+
+    progressed = manager.generate_workout(profile, feedback_history)
+    for plain, harder in zip(second['exercises'], progressed['exercises']):
+        if 'time' in plain:
+            assert harder['time'] == int(plain['time'] * 1.1)
+
+def test_generation_logs_one_sampled_summary(caplog):
+    profile = {'fitness_level': 'Средний', 'goals': 'Похудение', 'equipment': 'Только вес тела'}
+
+    with caplog.at_level(logging.INFO, logger='workout_manager'):
+        WorkoutManager(log_sample_rate=0.0).generate_workout(profile)
+        assert [r.event for r in caplog.records if r.levelno == logging.INFO] == ['catalog_loaded']
+
+        caplog.clear()
+        workout = WorkoutManager(log_sample_rate=1.0).generate_workout(profile)
+        summaries = [r for r in caplog.records if r.event == 'workout_generated']
+        assert len(summaries) == 1
+        assert summaries[0].fields['exercises'] == workout['total_exercises']
+        assert summaries[0].fields['level'] == 'intermediate'
+
+def test_batch_generation_shares_plans():
+    manager = WorkoutManager()
+    profiles = {
+        '1': {'fitness_level': 'Средний', 'goals': 'Похудение', 'equipment': 'Только вес тела'},
+        '2': {'fitness_level': 'Средний', 'goals': 'Похудение', 'equipment': 'Только вес тела'},
+        '3': {'fitness_level': 'Средний', 'goals': 'Похудение', 'equipment': 'Только вес тела'},
+    }
+    feedback = {'3': {f'workout_{i}': {'feedback': 'good'} for i in range(3)}}
+
+    workouts = manager.generate_workouts_batch(profiles, feedback)
+    assert workouts['1'] is workouts['2']
+    assert workouts['1'] == manager.generate_workout(profiles['1'])
+    assert workouts['3'] == manager.generate_workout(profiles['3'], feedback['3'])
+    assert workouts['3'] != workouts['1']
+
 if __name__ == "__main__":
     test_workout_generation()
@@ -0,0 +1,167 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from rate_limiter import PRIORITY_TIMER
+
+logger = logging.getLogger(__name__)
+
+TIMER_LABELS = {
+    'timer': 'Таймер',
+    'rest': 'Отдых',
+}
+
+FINISH_MESSAGES = {
+    'timer': (
+        "✅ Время упражнения истекло!\n\n"
+        "👉 Теперь нажмите кнопку '⏰ Отдых' для восстановления.\n"
+        "После отдыха нажмите '✅ Готово', чтобы перейти к следующему упражнению."
+    ),
+    'rest': (
+        "✅ Отдых завершен!\n\n"
+        "👉 Нажмите '✅ Готово', чтобы перейти к следующему упражнению."
+    ),
+}
+
+CANCELLED_MESSAGE = "⏹ Таймер остановлен"
+
+
+def format_timer(timer_type, seconds):
+    """Countdown text shown in the timer message"""
+    return f"⏱ {TIMER_LABELS.get(timer_type, TIMER_LABELS['rest'])}: {seconds} сек"
+
+
+class Timer:
+    """A running countdown attached to a Telegram message"""
+    __slots__ = ('message', 'timer_type', 'deadline', 'shown', 'next_edit', 'editing')
+
+    def __init__(self, message, timer_type, deadline, shown, next_edit):
+        self.message = message
+        self.timer_type = timer_type
+        self.deadline = deadline
+        self.shown = shown
+        self.next_edit = next_edit
+        self.editing = None  # Task of the message edit in flight
+
+
+class TimerScheduler:
+    """One task driving every active countdown, one timer per user.
+
+    Pending message edits sit in a heap ordered by due time and the task
+    sleeps until the earliest one. Instead of editing each timer message every
+    second, a timer is edited every ``edit_interval`` seconds and then every
+    second during the last ``final_countdown`` seconds. When it runs out the
+    message is edited once more into the completion text. Edits run as
+    tasks of their own so a slow one delays no other timer; a countdown edit
+    is skipped while the previous edit of its message is still in flight.
+    Starting a new timer or calling ``cancel`` stops the user's previous one.
+    """
+
+    def __init__(self, edit_interval=10, final_countdown=5, tick=1.0):
+        self.edit_interval = edit_interval
+        self.final_countdown = final_countdown
+        self.tick = tick  # Length of one timer second, in real seconds
+        self.timers = {}
+        self._queue = []  # (due, seq, user_id, timer); stale entries are skipped
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._edits = set()  # Running edit tasks, referenced until done
+
+    def __contains__(self, user_id):
+        return user_id in self.timers
+
+    def __len__(self):
+        return len(self.timers)
+
+    def start(self, user_id, message, timer_type, seconds):
+        """Start a countdown on an already sent timer message"""
+        self.cancel(user_id)
+        now = self._now()
+        timer = Timer(message, timer_type, now + seconds, seconds, self._next_edit(now, seconds))
+        self.timers[user_id] = timer
+        self._push(user_id, timer)
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def cancel(self, user_id):
+        """Stop the user's countdown, if any, and mark its message as stopped"""
+        timer = self.timers.pop(user_id, None)
+        if timer is not None:
+            self._final_edit(timer, CANCELLED_MESSAGE)
+
+    async def shutdown(self):
+        """Stop the task and drop all timers"""
+        self.timers.clear()
+        self._queue.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        edits, self._edits = self._edits, set()
+        for edit in edits:
+            edit.cancel()
+        await asyncio.gather(*edits, return_exceptions=True)
+
+    def _now(self):
+        return asyncio.get_running_loop().time() / self.tick
+
+    def _next_edit(self, now, remaining):
+        """When the message should next be updated, adapting to the time left"""
+        if remaining <= self.final_countdown:
+            return now + 1
+        return now + min(self.edit_interval, remaining - self.final_countdown)
+
+    def _push(self, user_id, timer):
+        heapq.heappush(self._queue, (timer.next_edit, next(self._seq), user_id, timer))
+
+    async def _run(self):
+        while self.timers:
+            now = self._now()
+            while self._queue and self._queue[0][0] <= now:
+                due, _, user_id, timer = heapq.heappop(self._queue)
+                if self.timers.get(user_id) is not timer:
+                    continue  # Cancelled or replaced
+
+                # Work from the scheduled time so late wakeups don't drift
+                remaining = round(timer.deadline - due)
+                if remaining <= 0:
+                    del self.timers[user_id]
+                    self._final_edit(timer, FINISH_MESSAGES.get(timer.timer_type, FINISH_MESSAGES['rest']))
+                    continue
+                if remaining != timer.shown and (timer.editing is None or timer.editing.done()):
+                    timer.shown = remaining
+                    timer.editing = self._spawn(self._edit(timer, format_timer(timer.timer_type, remaining)))
+                timer.next_edit = self._next_edit(due, remaining)
+                self._push(user_id, timer)
+
+            self._wakeup.clear()
+            if self._queue:
+                timeout = max(0, (self._queue[0][0] - self._now()) * self.tick)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        self._queue.clear()
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._edits.add(task)
+        task.add_done_callback(self._edits.discard)
+        return task
+
+    def _final_edit(self, timer, text):
+        """Edit the message a last time, after the edit in flight so it is not overwritten"""
+        timer.editing = self._spawn(self._edit(timer, text, after=timer.editing))
+
+    async def _edit(self, timer, text, after=None):
+        if after is not None:
+            await asyncio.wait([after])
+        try:
+            await timer.message.edit_text(text, rate_limit_args={'priority': PRIORITY_TIMER})
+        except Exception as e:
+            logging.error(f"Error updating timer: {str(e)}")
@@ -0,0 +1,74 @@
+import asyncio
+from telegram.ext import BaseUpdateProcessor
+import metrics
+
+UPDATES_IN_FLIGHT = metrics.gauge('bot_updates_in_flight', "Updates being processed or waiting for their user's lock")
+UPDATE_LOCK_WAIT_SECONDS = metrics.histogram(
+    'bot_update_lock_wait_seconds', "Time an update waited behind earlier updates of the same user"
+)
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates of different users concurrently, one user at a time.
+
+    Every update is keyed by its user (or chat, for updates without a user).
+    Updates with the same key wait on a per-key lock, so handlers working on
+    the same ``active_workouts`` entry or conversation state never interleave,
+    and asyncio locks hand over in arrival order. Locks are dropped once no
+    update for the key is pending. One of the ``max_concurrent_updates``
+    slots is taken only after the key's lock, so updates queued behind a
+    busy user do not keep other users waiting.
+    """
+
+    __slots__ = ('_locks', '_slots')
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}  # key -> [lock, number of updates holding or waiting]
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+
+    async def process_update(self, update, coroutine):
+        # Replaces the base class's semaphore, which is taken before the per-key lock
+        await self.do_process_update(update, coroutine)
+
+    async def do_process_update(self, update, coroutine):
+        key = self._get_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        UPDATES_IN_FLIGHT.inc()
+        try:
+            with UPDATE_LOCK_WAIT_SECONDS.time():
+                await entry[0].acquire()
+            try:
+                async with self._slots:
+                    await coroutine
+            finally:
+                entry[0].release()
+        finally:
+            UPDATES_IN_FLIGHT.dec()
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    @staticmethod
+    def _get_key(update):
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            return ('user', user.id)
+        chat = getattr(update, 'effective_chat', None)
+        if chat is not None:
+            return ('chat', chat.id)
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
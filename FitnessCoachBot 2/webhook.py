@@ -0,0 +1,186 @@
+"""Webhook deployment: an HTTP front end feeding N bot worker processes.
+
+Telegram POSTs each update to the front end, which answers immediately and
+routes the raw update to worker ``user_id % N``. A user therefore always
+lands on the same worker, which keeps their active workout and
+conversation state in one process. Each worker runs a full Application
+(handlers, job queue, rate limiter) fed from its queue; the global
+RATE_LIMIT_OVERALL is split evenly between the workers, and each worker
+schedules the reminders of its own users. State shared between workers
+lives in the Database, so more than one worker requires
+STORAGE_BACKEND=sqlite.
+
+Run with BOT_MODE=webhook python bot.py, or python webhook.py.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import signal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from config import (
+    TOKEN, STORAGE_BACKEND, METRICS_LISTEN, METRICS_PORT, RATE_LIMIT_OVERALL,
+    WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_URL, WEBHOOK_WORKERS
+)
+
+logger = logging.getLogger(__name__)
+
+
+def get_shard_key(update):
+    """User id an update belongs to (chat id when there is no user), 0 if neither"""
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        if isinstance(value.get('from'), dict):
+            return value['from']['id']
+        if isinstance(value.get('chat'), dict):
+            return value['chat']['id']
+    return 0
+
+
+def run_worker(index, workers, updates):
+    """Worker process: feed updates from the queue into a bot Application"""
+    logging.basicConfig(
+        format=f'%(asctime)s - worker {index} - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    from bot import build_application
+    import metrics
+
+    if METRICS_PORT:
+        metrics.start_server(METRICS_LISTEN, METRICS_PORT + index)
+    application, database = build_application(
+        reminder_shard=index,
+        reminder_shards=workers,
+        # Telegram's limit applies to the bot token, shared by every worker
+        overall_rate=RATE_LIMIT_OVERALL / workers
+    )
+    try:
+        asyncio.run(_process_updates(application, updates))
+    finally:
+        database.close()
+
+
+async def _process_updates(application, updates):
+    from telegram import Update
+
+    loop = asyncio.get_running_loop()
+    # Stop like the front end does: drain the queue, then shut down cleanly
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, updates.put, None)
+    async with application:
+        await application.start()
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+            update = Update.de_json(json.loads(data), application.bot)
+            await application.update_queue.put(update)
+        await application.stop()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+class WebhookFrontend:
+    """HTTP server that shards incoming updates over worker processes"""
+
+    def __init__(self, workers=WEBHOOK_WORKERS, host=WEBHOOK_LISTEN, port=WEBHOOK_PORT,
+                 path=WEBHOOK_PATH, secret=WEBHOOK_SECRET, worker_target=run_worker):
+        self.workers = workers
+        self.path = path
+        self.secret = secret
+        self.worker_target = worker_target
+        context = multiprocessing.get_context('spawn')
+        self.queues = [context.Queue() for _ in range(workers)]
+        self.processes = [
+            context.Process(target=worker_target, args=(index, workers, queue), name=f"bot-worker-{index}")
+            for index, queue in enumerate(self.queues)
+        ]
+        self.server = ThreadingHTTPServer((host, port), self._make_request_handler())
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def dispatch(self, body):
+        """Route one raw update to its worker"""
+        update = json.loads(body)
+        self.queues[get_shard_key(update) % self.workers].put(body.decode('utf-8'))
+
+    def _make_request_handler(self):
+        frontend = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != frontend.path:
+                    self.send_error(404)
+                    return
+                if frontend.secret and self.headers.get('X-Telegram-Bot-Api-Secret-Token') != frontend.secret:
+                    self.send_error(403)
+                    return
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                try:
+                    frontend.dispatch(body)
+                except (ValueError, AttributeError, KeyError, TypeError) as e:
+                    logger.warning(f"Rejected malformed update: {e}")
+                    self.send_error(400)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return RequestHandler
+
+    def start(self):
+        """Start the workers and serve HTTP in a background thread"""
+        for process in self.processes:
+            process.start()
+        self._thread = Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Webhook listening on {self.address} with {self.workers} workers")
+
+    def stop(self):
+        """Stop accepting updates, let workers drain their queues and exit"""
+        self.server.shutdown()
+        self.server.server_close()
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join()
+
+
+async def _set_webhook(url, secret):
+    from telegram import Bot
+
+    async with Bot(TOKEN) as bot:
+        await bot.set_webhook(url, secret_token=secret, allowed_updates=["message", "callback_query"])
+
+
+def main():
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    if WEBHOOK_WORKERS > 1 and STORAGE_BACKEND != 'sqlite':
+        raise SystemExit("Several webhook workers share state through the database; set STORAGE_BACKEND=sqlite")
+
+    frontend = WebhookFrontend()
+    stopped = multiprocessing.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stopped.set())
+    signal.signal(signal.SIGINT, lambda *args: stopped.set())
+
+    frontend.start()
+    if WEBHOOK_URL:
+        asyncio.run(_set_webhook(WEBHOOK_URL, WEBHOOK_SECRET))
+    print("Bot started (webhook)...")
+    stopped.wait()
+    frontend.stop()
+
+
+if __name__ == '__main__':
+    main()
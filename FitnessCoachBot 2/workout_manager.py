@@ -1,60 +1,163 @@
-import pandas as pd
+import csv
 from datetime import datetime
 import logging
+import time
+from config import WORKOUT_LOG_LEVEL, WORKOUT_LOG_SAMPLE_RATE
+from structured_log import log_event
+import metrics
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+logger.setLevel(WORKOUT_LOG_LEVEL)
+
+GENERATE_SECONDS = metrics.histogram(
+    'workout_generate_seconds', "Time to generate a workout", ['result']
+)
+
+# Exercise catalog
+EXERCISES_CSV = 'attached_assets/exercises - Sheet1 (1).csv'
+
+# Profile values mapped to CSV values
+LEVEL_MAP = {
+    "Начинающий": "beginner",
+    "Средний": "intermediate",
+    "Продвинутый": "advanced"
+}
+
+GOALS_MAP = {
+    "Похудение": "weightloss",
+    "Набор мышечной массы": "musclegain",
+    "Общая физическая подготовка": "strength"
+}
+
+EQUIPMENT_MAP = {
+    "Только вес тела": "Нет",
+    "Доступ в спортзал": "gym"
+}
+
+# Feedback score used to adjust the difficulty level
+DIFFICULTY_ADJUSTMENTS = {
+    'too_easy': 1,    # Increase difficulty
+    'good': 0,        # Keep current difficulty
+    'too_hard': -1    # Decrease difficulty
+}
+
+# Numeric fields scaled by the progression factor
+PROGRESSIVE_FIELDS = ('time', 'reps')
+
+# Numeric fields used as is
+FIXED_FIELDS = ('circuits', 'circuits_rest', 'exercises_rest')
+
+
+class Exercise:
+    """One row of the exercise catalog; empty CSV cells are None"""
+    __slots__ = (
+        'fitness_level', 'fitness_goals', 'name', 'target_muscle', 'difficulty', 'equipment',
+        'gif', 'time', 'reps', 'circuits', 'circuits_rest', 'exercises_rest', 'weight'
+    )
+
+    def __init__(self, row):
+        for field in self.__slots__:
+            value = row.get(field)
+            setattr(self, field, value if value and value.strip() else None)
+
+
+def load_exercises(path=EXERCISES_CSV):
+    """Read the exercise catalog into Exercise records, in file order"""
+    with open(path, newline='', encoding='utf-8') as f:
+        return [Exercise(row) for row in csv.DictReader(f)]
+
 
 class WorkoutManager:
-    def __init__(self):
-        self.workouts_df = pd.read_csv('attached_assets/exercises - Sheet1 (1).csv')
-        logger.info(f"Loaded {len(self.workouts_df)} exercises from CSV")
-        # Debug: Print sample of exercises with their GIF URLs and optional fields
-        sample_exercises = self.workouts_df.head()
-        logger.info("Sample exercises from CSV:")
-        for _, exercise in sample_exercises.iterrows():
-            logger.info(f"\nExercise: {exercise['name']}")
-            logger.info(f"GIF URL: {exercise['gif'] if pd.notna(exercise['gif']) else 'No GIF'}")
-            logger.info(f"Difficulty: {exercise['difficulty'] if pd.notna(exercise['difficulty']) else 'No difficulty'}")
-            logger.info(f"Equipment: {exercise['equipment']}")
-            logger.info("-" * 50)
+    def __init__(self, csv_path=EXERCISES_CSV, log_sample_rate=WORKOUT_LOG_SAMPLE_RATE):
+        self.log_sample_rate = log_sample_rate
+        self.exercises = load_exercises(csv_path)
+        self.exercise_index = self._build_exercise_index()
+        log_event(logger, logging.INFO, 'catalog_loaded',
+                  exercises=len(self.exercises), groups=len(self.exercise_index), path=csv_path)
+        if logger.isEnabledFor(logging.DEBUG):
+            for exercise in self.exercises[:5]:
+                log_event(logger, logging.DEBUG, 'catalog_sample', name=exercise.name, gif=exercise.gif,
+                          difficulty=exercise.difficulty, equipment=exercise.equipment)
 
-    def generate_workout(self, user_profile, feedback_history=None):
-        """Generate personalized workout based on user profile and feedback"""
-        # Map fitness levels to CSV values
-        level_map = {
-            "Начинающий": "beginner",
-            "Средний": "intermediate",
-            "Продвинутый": "advanced"
-        }
+    def _build_exercise_index(self):
+        """Group cleaned exercise records by (fitness_level, fitness_goals, equipment), keeping CSV order"""
+        index = {}
+        for exercise in self.exercises:
+            key = (exercise.fitness_level, exercise.fitness_goals, exercise.equipment)
+            index.setdefault(key, []).append(self._clean_exercise(exercise))
+        return {key: tuple(records) for key, records in index.items()}
 
-        goals_map = {
-            "Похудение": "weightloss",
-            "Набор мышечной массы": "musclegain",
-            "Общая физическая подготовка": "strength"
-        }
+    def _clean_exercise(self, exercise):
+        """Validate a CSV row once and return its fields as (name, value, progressive) tuples"""
+        fields = []
 
-        equipment_map = {
-            "Только вес тела": "Нет",
-            "Доступ в спортзал": "gym"
-        }
+        # Add name (required field)
+        fields.append(('name', exercise.name, False))
+
+        # Add target muscle if it exists and is not empty
+        if exercise.target_muscle:
+            fields.append(('target_muscle', exercise.target_muscle, False))
+
+        # Only add optional fields if they exist and are not empty or 'nan'
+        if exercise.difficulty:
+            difficulty = exercise.difficulty.strip()
+            if difficulty.lower() != 'nan':
+                fields.append(('difficulty', difficulty, False))
+
+        # Validate and add GIF URL if present
+        if exercise.gif:
+            gif_url = exercise.gif.strip()
+            if gif_url.lower() != 'nan' and (gif_url.startswith('http://') or gif_url.startswith('https://')):
+                if gif_url.lower().endswith(('.gif', '.mp4')):
+                    fields.append(('gif_url', gif_url, False))
+                else:
+                    log_event(logger, logging.WARNING, 'invalid_gif_url', name=exercise.name, url=gif_url)
+
+        # Numeric fields; time and reps get the progression factor applied per request
+        for field in PROGRESSIVE_FIELDS + FIXED_FIELDS:
+            raw_value = getattr(exercise, field)
+            if raw_value:
+                try:
+                    value = float(raw_value.strip())
+                except ValueError:
+                    continue
+                if value > 0:
+                    if field in PROGRESSIVE_FIELDS:
+                        fields.append((field, value, True))
+                    else:
+                        fields.append((field, int(value), False))
+
+        # Handle weight field separately as it might contain ranges
+        if exercise.weight:
+            weight = exercise.weight.strip()
+            if weight.lower() != 'nan':
+                fields.append(('weight', weight, False))
 
-        level = level_map.get(user_profile.get('fitness_level', 'beginner'), 'beginner')
-        goal = goals_map.get(user_profile.get('goals', 'weightloss'), 'weightloss')
-        equipment = equipment_map.get(user_profile.get('equipment', 'Только вес тела'), 'Нет')
+        return tuple(fields)
+
+    def get_gif_urls(self):
+        """Return every distinct valid GIF URL in the catalog"""
+        urls = {}
+        for records in self.exercise_index.values():
+            for record in records:
+                for field, value, _ in record:
+                    if field == 'gif_url':
+                        urls[value] = None
+        return list(urls)
+
+    def get_workout_params(self, user_profile, feedback_history=None):
+        """Return (level, goal, equipment, progression_factor) for a profile and its feedback"""
+        level = LEVEL_MAP.get(user_profile.get('fitness_level', 'beginner'), 'beginner')
+        goal = GOALS_MAP.get(user_profile.get('goals', 'weightloss'), 'weightloss')
+        equipment = EQUIPMENT_MAP.get(user_profile.get('equipment', 'Только вес тела'), 'Нет')
+        progression_factor = 1.0
 
         # Adjust difficulty based on feedback history
         if feedback_history:
             recent_feedbacks = list(feedback_history.values())[-5:]  # Get last 5 feedbacks
-            difficulty_adjustments = {
-                'too_easy': 1,    # Increase difficulty
-                'good': 0,        # Keep current difficulty
-                'too_hard': -1    # Decrease difficulty
-            }
 
             # Calculate average difficulty adjustment
-            total_adjustment = sum(difficulty_adjustments.get(f['feedback'], 0) for f in recent_feedbacks)
+            total_adjustment = sum(DIFFICULTY_ADJUSTMENTS.get(f['feedback'], 0) for f in recent_feedbacks)
             avg_adjustment = total_adjustment / len(recent_feedbacks) if recent_feedbacks else 0
 
             # Adjust level based on feedback
@@ -65,114 +168,50 @@ class WorkoutManager:
                 # User consistently finding workouts too hard
                 level = {"advanced": "intermediate", "intermediate": "beginner"}[level]
 
-        logger.info(f"Generating workout for - Level: {level}, Goal: {goal}, Equipment: {equipment}")
-
-        # Filter workouts based on user profile
-        suitable_workouts = self.workouts_df[
-            (self.workouts_df['fitness_level'] == level) &
-            (self.workouts_df['fitness_goals'] == goal)
-        ]
-
-        logger.info(f"Found {len(suitable_workouts)} exercises matching level and goals")
-        logger.info(f"Equipment values in filtered dataset: {suitable_workouts['equipment'].unique()}")
-
-        # Equipment filtering logic - strictly gym vs no equipment
-        if equipment == "gym":
-            suitable_workouts = suitable_workouts[
-                (suitable_workouts['equipment'] == "gym")
-            ]
-            logger.info(f"Filtered to {len(suitable_workouts)} gym equipment exercises")
-        else:
-            suitable_workouts = suitable_workouts[
-                (suitable_workouts['equipment'] == "Нет")
-            ]
-            logger.info(f"Filtered to {len(suitable_workouts)} bodyweight exercises")
-
-        if len(suitable_workouts) == 0:
-            logger.warning("No suitable exercises found, returning default workout")
-            return self._get_default_workout()
-
-        # Progressive overload: Increase reps/time based on successful completions
-        if feedback_history:
+            # Progressive overload: Increase reps/time based on successful completions
             successful_workouts = sum(1 for f in recent_feedbacks if f['feedback'] in ['good', 'too_easy'])
             if successful_workouts >= 3:  # If user completed 3 or more workouts successfully
                 progression_factor = 1.1  # Increase by 10%
-                logger.info("Applying progressive overload - increasing intensity by 10%")
-            else:
-                progression_factor = 1.0
-        else:
-            progression_factor = 1.0
+
+        return level, goal, equipment, progression_factor
+
+    def generate_workout(self, user_profile, feedback_history=None):
+        """Generate personalized workout based on user profile and feedback"""
+        start = time.perf_counter()
+        params = self.get_workout_params(user_profile, feedback_history)
+        workout = self.build_workout(*params)
+
+        elapsed = time.perf_counter() - start
+        GENERATE_SECONDS.observe(elapsed, result='ok' if params[:3] in self.exercise_index else 'default')
+
+        # One summary record per sampled request; the per-field trace is DEBUG only
+        level, goal, equipment, progression_factor = params
+        log_event(logger, logging.INFO, 'workout_generated', self.log_sample_rate,
+                  level=level, goal=goal, equipment=equipment, progression=progression_factor,
+                  exercises=workout['total_exercises'], ms=round(elapsed * 1000, 3))
+        if logger.isEnabledFor(logging.DEBUG):
+            for number, exercise in enumerate(workout['exercises'], 1):
+                log_event(logger, logging.DEBUG, 'workout_exercise', number=number, **exercise)
+
+        return workout
+
+    def build_workout(self, level, goal, equipment, progression_factor=1.0):
+        """Build the workout for already resolved parameters (see get_workout_params)"""
+        # Equipment filtering is strict: gym vs no equipment
+        records = self.exercise_index.get((level, goal, equipment))
+        if not records:
+            log_event(logger, logging.WARNING, 'workout_default',
+                      level=level, goal=goal, equipment=equipment)
+            return self._get_default_workout()
 
         # Include all matching exercises in their original order
-        exercises = []
-        for _, exercise in suitable_workouts.iterrows():
-            exercise_data = {}
-
-            # Add name (required field)
-            exercise_data['name'] = exercise['name']
-
-            # Add target muscle if it exists and is not empty
-            if pd.notna(exercise['target_muscle']) and str(exercise['target_muscle']).strip():
-                exercise_data['target_muscle'] = exercise['target_muscle']
-
-            # Only add optional fields if they exist and are not empty or 'nan'
-            if pd.notna(exercise['difficulty']) and str(exercise['difficulty']).strip():
-                difficulty = str(exercise['difficulty']).strip()
-                if difficulty.lower() != 'nan' and difficulty.strip():
-                    exercise_data['difficulty'] = difficulty
-                    logger.info(f"Added difficulty for {exercise['name']}: {difficulty}")
-
-            # Validate and add GIF URL if present
-            if pd.notna(exercise['gif']) and str(exercise['gif']).strip():
-                gif_url = str(exercise['gif']).strip()
-                if gif_url.lower() != 'nan' and (gif_url.startswith('http://') or gif_url.startswith('https://')):
-                    try:
-                        # Additional validation for the GIF URL
-                        if gif_url.lower().endswith(('.gif', '.mp4')):
-                            exercise_data['gif_url'] = gif_url
-                            logger.info(f"Added GIF URL for {exercise['name']}: {gif_url}")
-                        else:
-                            logger.warning(f"Invalid GIF URL format for {exercise['name']}: {gif_url}")
-                    except Exception as e:
-                        logger.error(f"Error processing GIF URL for {exercise['name']}: {str(e)}")
-
-            # Apply progressive overload to numeric fields
-            for field in ['time', 'reps']:
-                if pd.notna(exercise[field]) and str(exercise[field]).strip():
-                    try:
-                        value = float(str(exercise[field]).strip())
-                        if value > 0:
-                            # Apply progression factor to time and reps
-                            adjusted_value = int(value * progression_factor)
-                            exercise_data[field] = adjusted_value
-                            logger.info(f"Added {field} for {exercise['name']}: {adjusted_value} (after progression)")
-                    except (ValueError, TypeError):
-                        continue
-
-            # Handle other numeric fields without progression
-            for field in ['circuits', 'circuits_rest', 'exercises_rest']:
-                if pd.notna(exercise[field]) and str(exercise[field]).strip():
-                    try:
-                        value = float(str(exercise[field]).strip())
-                        if value > 0:
-                            exercise_data[field] = int(value)
-                            logger.info(f"Added {field} for {exercise['name']}: {value}")
-                    except (ValueError, TypeError):
-                        continue
-
-            # Handle weight field separately as it might contain ranges
-            if pd.notna(exercise['weight']) and str(exercise['weight']).strip():
-                weight = str(exercise['weight']).strip()
-                if weight.lower() != 'nan' and weight.strip():
-                    exercise_data['weight'] = weight
-                    logger.info(f"Added weight for {exercise['name']}: {weight}")
-
-            exercises.append(exercise_data)
-            logger.info(f"Processed exercise: {exercise_data}")
-
-        logger.info(f"Generated workout with {len(exercises)} exercises")
-        if exercises:
-            logger.info(f"First exercise data: {exercises[0]}")
+        exercises = [
+            {
+                field: int(value * progression_factor) if progressive else value
+                for field, value, progressive in record
+            }
+            for record in records
+        ]
 
         return {
             'exercises': exercises,
@@ -181,6 +220,34 @@ class WorkoutManager:
             'current_circuit': 1
         }
 
+    def group_profiles(self, profiles, feedback_histories=None):
+        """Group user ids by their effective (level, goal, equipment, progression_factor)"""
+        feedback_histories = feedback_histories or {}
+        groups = {}
+        for user_id, profile in profiles.items():
+            params = self.get_workout_params(profile, feedback_histories.get(user_id))
+            groups.setdefault(params, []).append(user_id)
+        return groups
+
+    def generate_workouts_batch(self, profiles, feedback_histories=None):
+        """Generate workouts for many users at once: {user_id: workout}.
+
+        ``profiles`` and ``feedback_histories`` are dicts keyed by user id.
+        Each distinct plan is built once and the same dict is returned for
+        every user sharing it, so copy a workout before changing it.
+        """
+        start = time.perf_counter()
+        workouts = {}
+        groups = self.group_profiles(profiles, feedback_histories)
+        for params, user_ids in groups.items():
+            workout = self.build_workout(*params)
+            for user_id in user_ids:
+                workouts[user_id] = workout
+
+        log_event(logger, logging.INFO, 'workouts_batch_generated',
+                  users=len(workouts), plans=len(groups), ms=round((time.perf_counter() - start) * 1000, 3))
+        return workouts
+
     def _get_default_workout(self):
         """Return default workout if no suitable workout found"""
         return {